@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.auth.models import Principal
+from app.core.cache import TTLCache
+from app.core.database import (
+    collection_admin,
+    collection_distribuidores,
+    collection_produccion,
+    collection_facturas,
+    collection_bodegas
+)
+from app.orders.controllers import filtro_tipo_precio_cdi
+
+logger = logging.getLogger(__name__)
+
+# Write-behind de fecha_ultimo_acceso: el login solo anota y un worker escribe en lote
+ACCESOS_FLUSH_SEGUNDOS = float(os.getenv("ACCESOS_FLUSH_SEGUNDOS", 10))
+ACCESOS_FLUSH_MAX = int(os.getenv("ACCESOS_FLUSH_MAX", 500))
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", 2048))
+
+_principales = TTLCache(maxsize=PRINCIPAL_CACHE_MAX, ttl=PRINCIPAL_CACHE_TTL, nombre="principales")
+
+# Orden de prioridad si un correo existiera en varias colecciones
+COLECCIONES_LOGIN = [
+    (collection_admin, "collection_admin"),
+    (collection_distribuidores, "collection_distribuidores"),
+    (collection_produccion, "collection_produccion"),
+    (collection_facturas, "collection_facturas"),
+    (collection_bodegas, "collection_bodegas")
+]
+
+# Campos necesarios para validar la contraseña y emitir el token
+PROYECCION_LOGIN = {
+    "correo_electronico": 1, "hashed_password": 1, "rol": 1, "nombre": 1, "pais": 1,
+    "cdi": 1, "tipo_precio": 1, "unidades_individuales": 1
+}
+
+_accesos_pendientes = {}  # (colección, _id) -> fecha_ultimo_acceso
+_despertar_accesos = asyncio.Event()
+_tarea_accesos: asyncio.Task | None = None
+
+COLECCIONES_POR_ROL = {
+    "Admin": collection_admin,
+    "produccion": collection_produccion,
+    "facturacion": collection_facturas,
+    "bodega": collection_bodegas
+}
+
+NO_ENCONTRADO_POR_ROL = {
+    "Admin": "Administrador no encontrado",
+    "bodega": "Bodega no encontrada",
+    "distribuidor": "Distribuidor no encontrado"
+}
+
+# Solo los campos que necesitan los endpoints; nunca el hash de la contraseña
+PROYECCION_PRINCIPAL = {
+    "nombre": 1, "phone": 1, "pais": 1, "cdi": 1, "tipo_precio": 1,
+    "admin_id": 1, "unidades_individuales": 1, "minimo_compra": 1
+}
+
+
+def coleccion_de_rol(rol: str):
+    if rol.startswith("distribuidor"):
+        return collection_distribuidores
+    return COLECCIONES_POR_ROL.get(rol)
+
+
+def mensaje_no_encontrado(rol: str) -> str:
+    clave = "distribuidor" if rol.startswith("distribuidor") else rol
+    return NO_ENCONTRADO_POR_ROL.get(clave, f"{rol} no encontrado")
+
+
+def construir_principal(email: str, rol: str, usuario: dict = None) -> Principal:
+    usuario = usuario or {}
+    cdi = (usuario.get("cdi") or "").lower() or None
+    id_usuario = str(usuario["_id"]) if "_id" in usuario else None
+
+    if rol == "bodega":
+        filtro_cdi = filtro_tipo_precio_cdi(cdi)
+        filtro_ordenes = filtro_cdi
+    else:
+        filtro_cdi = {}
+        filtro_ordenes = {"distribuidor_id": id_usuario} if rol.startswith("distribuidor") else {}
+
+    return Principal(
+        email=email,
+        rol=rol,
+        id=id_usuario,
+        nombre=usuario.get("nombre"),
+        phone=usuario.get("phone"),
+        pais=usuario.get("pais"),
+        cdi=cdi,
+        tipo_precio=usuario.get("tipo_precio"),
+        admin_id=str(usuario["admin_id"]) if usuario.get("admin_id") else None,
+        unidades_individuales=usuario.get("unidades_individuales") or False,
+        minimo_compra=usuario.get("minimo_compra"),
+        filtro_cdi=filtro_cdi,
+        filtro_ordenes=filtro_ordenes
+    )
+
+
+async def resolver_principal(email: str, rol: str):
+    """Perfil del usuario autenticado; None si ya no existe en su colección"""
+    principal = _principales.get(email)
+    if principal is not None and principal.rol == rol:
+        return principal
+
+    coleccion = coleccion_de_rol(rol)
+    if coleccion is None:
+        # Rol sin colección propia: no hay perfil que consultar
+        return construir_principal(email, rol)
+
+    usuario = await coleccion.find_one({"correo_electronico": email}, PROYECCION_PRINCIPAL)
+    if not usuario:
+        return None
+
+    principal = construir_principal(email, rol, usuario)
+    _principales.set(email, principal)
+    return principal
+
+
+def invalidar_principal(*emails):
+    """Descarta perfiles cacheados tras cambios en los usuarios (sin argumentos: todos)"""
+    if not emails:
+        _principales.clear()
+        return
+    for email in emails:
+        if email:
+            _principales.invalidate(email)
+            _principales.invalidate(email.lower())
+
+
+def filtro_cdi_bodega(principal: Principal) -> dict:
+    """Filtro por CDI de la bodega autenticada; 400 si no tiene un CDI válido"""
+    if not principal.cdi:
+        raise HTTPException(status_code=400, detail="La bodega no tiene un CDI asignado")
+    if principal.filtro_cdi is None:
+        raise HTTPException(status_code=400, detail="CDI de bodega no válido")
+    return principal.filtro_cdi
+
+
+async def buscar_usuario_login(email: str):
+    """Busca el correo en todas las colecciones de usuarios a la vez.
+
+    Devuelve (usuario, colección) con la misma prioridad que la búsqueda
+    secuencial original, o (None, None) si no existe.
+    """
+    async def buscar(coleccion, nombre):
+        try:
+            return await coleccion.find_one({"correo_electronico": email}, PROYECCION_LOGIN)
+        except Exception as e:
+            logger.error("Error al conectar o buscar en %s: %s", nombre, e)
+            return None
+
+    resultados = await asyncio.gather(*(buscar(c, n) for c, n in COLECCIONES_LOGIN))
+    for (coleccion, nombre), usuario in zip(COLECCIONES_LOGIN, resultados):
+        if usuario:
+            logger.debug("Usuario encontrado en %s", nombre)
+            return usuario, coleccion
+    return None, None
+
+
+def registrar_ultimo_acceso(coleccion, usuario_id):
+    """Anota el último acceso; se escribe en el próximo flush del worker"""
+    _accesos_pendientes[(coleccion, usuario_id)] = datetime.now().strftime("%Y-%m-%d %H:%M")
+    if len(_accesos_pendientes) >= ACCESOS_FLUSH_MAX:
+        _despertar_accesos.set()
+
+
+async def flush_ultimos_accesos():
+    """Escribe los accesos pendientes con un bulk_write por colección"""
+    if not _accesos_pendientes:
+        return
+    pendientes = dict(_accesos_pendientes)
+    _accesos_pendientes.clear()
+
+    por_coleccion = {}
+    for (coleccion, usuario_id), fecha in pendientes.items():
+        por_coleccion.setdefault(coleccion, []).append(
+            UpdateOne({"_id": usuario_id}, {"$set": {"fecha_ultimo_acceso": fecha}})
+        )
+
+    for coleccion, operaciones in por_coleccion.items():
+        try:
+            await coleccion.bulk_write(operaciones, ordered=False)
+        except Exception as e:
+            logger.warning("⚠️ Error guardando últimos accesos: %s", e)
+            # Se reintentan en el siguiente flush salvo que haya un acceso más reciente
+            for (c, usuario_id), fecha in pendientes.items():
+                if c is coleccion:
+                    _accesos_pendientes.setdefault((c, usuario_id), fecha)
+
+
+async def _procesar_accesos():
+    while True:
+        try:
+            await asyncio.wait_for(_despertar_accesos.wait(), timeout=ACCESOS_FLUSH_SEGUNDOS)
+        except asyncio.TimeoutError:
+            pass
+        _despertar_accesos.clear()
+        await flush_ultimos_accesos()
+
+
+def iniciar_worker_accesos():
+    global _tarea_accesos
+    if _tarea_accesos is None:
+        _tarea_accesos = asyncio.create_task(_procesar_accesos())
+
+
+async def detener_worker_accesos():
+    global _tarea_accesos
+    if _tarea_accesos is not None:
+        _tarea_accesos.cancel()
+        try:
+            await _tarea_accesos
+        except asyncio.CancelledError:
+            pass
+        _tarea_accesos = None
+    # Lo que quede en el buffer se escribe antes de cerrar la conexión
+    await flush_ultimos_accesos()
+
+
+def alcance_visibilidad(principal: Principal) -> tuple:
+    """Qué datos ve el usuario: dos usuarios con el mismo alcance ven la misma respuesta"""
+    if principal.rol == "bodega":
+        return (principal.rol, principal.cdi, principal.admin_id)
+    return (principal.rol,)
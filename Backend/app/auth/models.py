@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from typing import Optional
 
 class UserCreate(BaseModel):
@@ -33,3 +33,26 @@ class TokenResponse(BaseModel):
     unidades_individuales: Optional[bool] = False  # 🔹 Nuevo campo
 
 
+# PERFIL DEL USUARIO AUTENTICADO (resuelto una vez y cacheado)
+class Principal(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    email: str
+    rol: str
+    id: Optional[str] = None  # _id del documento en su colección
+    nombre: Optional[str] = None
+    phone: Optional[str] = None
+    pais: Optional[str] = None
+    cdi: Optional[str] = None
+    tipo_precio: Optional[str] = None
+    admin_id: Optional[str] = None
+    unidades_individuales: bool = False
+    minimo_compra: Optional[float] = None
+    # Filtro de pedidos por CDI (solo bodega; {} para otros roles, None si el CDI no es válido)
+    filtro_cdi: Optional[dict] = None
+    # Pedidos visibles: los propios para distribuidores, los de su CDI para bodega
+    filtro_ordenes: Optional[dict] = None
+
+    @property
+    def es_distribuidor(self) -> bool:
+        return self.rol.startswith("distribuidor")
@@ -1,19 +1,34 @@
 
-from fastapi import APIRouter, HTTPException, Form
-from datetime import datetime, timedelta
-from app.core.security import create_access_token, pwd_context, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, ALGORITHM
+import logging
+import os
+from fastapi import APIRouter, HTTPException, Form, Query
+from fastapi.responses import FileResponse
+from datetime import timedelta
+from app.core.security import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, ALGORITHM
+from app.core.hashing import verificar_password, metricas_hashing
+from app.core.singleflight import metricas_singleflight
+from app.core.compresion import metricas_compresion, sin_compresion
+from app.core.vigilante_loop import metricas_event_loop
+from app.core.perfilado import (
+    PERFILADO_TOKEN_MINUTOS,
+    crear_token_perfilado,
+    listar_perfiles,
+    perfilado_disponible,
+    ruta_perfil
+)
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import status
-from app.auth.models import TokenResponse
+from app.auth.models import Principal, TokenResponse
+from app.auth.controllers import (
+    resolver_principal,
+    mensaje_no_encontrado,
+    buscar_usuario_login,
+    registrar_ultimo_acceso
+)
 from jose import jwt, JWTError
 from fastapi import Depends
-from app.core.database import (
-    collection_admin,
-    collection_distribuidores,
-    collection_produccion,
-    collection_facturas,
-    collection_bodegas
-)
+
+logger = logging.getLogger(__name__)
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
@@ -34,51 +49,40 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except jwt.PyJWTError:
         raise credentials_exception
 
+async def get_principal(current_user: dict = Depends(get_current_user)) -> Principal:
+    """Perfil del usuario autenticado (cdi, tipo_precio, admin_id, filtros de visibilidad).
+
+    Se cachea por correo con TTL, así que evita consultar su colección en cada
+    petición; los endpoints de usuarios lo invalidan al modificar esos campos.
+    """
+    principal = await resolver_principal(current_user["email"], current_user["rol"])
+    if principal is None:
+        raise HTTPException(status_code=404, detail=mensaje_no_encontrado(current_user["rol"]))
+    return principal
+
+# El token nunca se comprime (BREACH)
 @router.post("/token", response_model=TokenResponse)
+@sin_compresion
 async def login(
     username: str = Form(...),  # Correo electrónico
     password: str = Form(...)   # Contraseña
 ):
-    user = None
-    rol = None
-
     # Normalizar username
     username = username.lower()
 
-    collections = [
-        (collection_admin, "collection_admin"),
-        (collection_distribuidores, "collection_distribuidores"),
-        (collection_produccion, "collection_produccion"),
-        (collection_facturas, "collection_facturas"),
-        (collection_bodegas, "collection_bodegas")
-    ]
-
-    print("Iniciando búsqueda de usuario en las colecciones...")
-    for collection, name in collections:
-        try:
-            print(f"Buscando en {name} para el usuario: {username}")
-            user = await collection.find_one({"correo_electronico": username})
-            if user:
-                print(f"Usuario encontrado en {name}: {user}")
-                rol = user.get("rol")
-                break
-            else:
-                print(f"Usuario no encontrado en {name}")
-        except Exception as e:
-            print(f"Error al conectar o buscar en {name}: {e}")
-
+    # Todas las colecciones de usuarios se consultan en paralelo
+    logger.debug("Iniciando búsqueda de usuario en las colecciones...")
+    user, collection = await buscar_usuario_login(username)
     if not user:
         raise HTTPException(status_code=400, detail="Usuario no encontrado.")
+    rol = user.get("rol")
 
     # Verificar la contraseña
-    if not pwd_context.verify(password, user.get("hashed_password")):
+    if not await verificar_password(password, user.get("hashed_password")):
         raise HTTPException(status_code=401, detail="Contraseña incorrecta.")
 
-    # Actualizar la fecha de último acceso
-    await collection.update_one(
-        {"_id": user["_id"]},
-        {"$set": {"fecha_ultimo_acceso": datetime.now().strftime("%Y-%m-%d %H:%M")}}
-    )
+    # Actualizar la fecha de último acceso (write-behind, se guarda en lote)
+    registrar_ultimo_acceso(collection, user["_id"])
 
     # Extraer datos adicionales
     cdi = user.get("cdi")
@@ -114,6 +118,73 @@ async def login(
     )
 
 
+# Métricas del executor de bcrypt (espera en cola frente a tiempo de hash)
+@router.get("/metricas/hashing")
+async def obtener_metricas_hashing(current_user: dict = Depends(get_current_user)):
+    if current_user["rol"] != "Admin":
+        raise HTTPException(status_code=403, detail="Solo los Admin pueden ver las métricas")
+    return metricas_hashing()
+
+
+# Métricas de single-flight por endpoint (líderes, peticiones compartidas, latencia del líder)
+@router.get("/metricas/singleflight")
+async def obtener_metricas_singleflight(current_user: dict = Depends(get_current_user)):
+    if current_user["rol"] != "Admin":
+        raise HTTPException(status_code=403, detail="Solo los Admin pueden ver las métricas")
+    return metricas_singleflight()
+
+
+# Métricas de compresión de respuestas (bytes antes/después y tiempo de compresión)
+@router.get("/metricas/compresion")
+async def obtener_metricas_compresion(current_user: dict = Depends(get_current_user)):
+    if current_user["rol"] != "Admin":
+        raise HTTPException(status_code=403, detail="Solo los Admin pueden ver las métricas")
+    return metricas_compresion.resumen()
+
+
+# Retraso del event loop y peores bloqueos con la pila que los causó
+@router.get("/metricas/event-loop")
+async def obtener_metricas_event_loop(current_user: dict = Depends(get_current_user)):
+    if current_user["rol"] != "Admin":
+        raise HTTPException(status_code=403, detail="Solo los Admin pueden ver las métricas")
+    return metricas_event_loop()
+
+
+# Token para perfilar peticiones concretas (cabecera X-Perfilar o ?perfilar=)
+@router.post("/perfilado/token")
+@sin_compresion
+async def crear_token_de_perfilado(
+    ruta: str | None = Query(None, description="Prefijo de ruta al que se limita el token"),
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user["rol"] != "Admin":
+        raise HTTPException(status_code=403, detail="Solo los Admin pueden perfilar peticiones")
+    if not perfilado_disponible():
+        raise HTTPException(status_code=501, detail="pyinstrument no está instalado en el servidor")
+    return {
+        "token": crear_token_perfilado(current_user["email"], ruta),
+        "expira_en_minutos": PERFILADO_TOKEN_MINUTOS,
+    }
+
+
+@router.get("/perfilado/")
+async def obtener_perfiles(current_user: dict = Depends(get_current_user)):
+    if current_user["rol"] != "Admin":
+        raise HTTPException(status_code=403, detail="Solo los Admin pueden ver los perfiles")
+    return listar_perfiles()
+
+
+# Perfil en formato speedscope (abrir en https://speedscope.app)
+@router.get("/perfilado/{perfil_id}")
+async def descargar_perfil(perfil_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user["rol"] != "Admin":
+        raise HTTPException(status_code=403, detail="Solo los Admin pueden ver los perfiles")
+    ruta = ruta_perfil(perfil_id)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(ruta, media_type="application/json", filename=os.path.basename(ruta))
+
+
 @router.get("/validate_token")
 async def validate_token(token: str = Depends(oauth2_scheme)):
     try:
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+
+# Cachés con nombre, para exportar sus aciertos y fallos en /metrics
+_registradas = []
+
+
+def caches_registradas() -> list:
+    return list(_registradas)
+
+
+class TTLCache:
+    """Caché en memoria del proceso con expiración (TTL) y desalojo LRU.
+
+    Pensada para usarse desde el event loop, sin locks. Cada worker de uvicorn
+    tiene su propia copia, por lo que el TTL acota cuánto puede durar un dato
+    obsoleto cuando se modifica desde otro worker.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60, nombre: str = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.nombre = nombre
+        self._datos = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if nombre:
+            _registradas.append(self)
+
+    def get(self, clave, defecto=None):
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            self.misses += 1
+            return defecto
+        valor, expira = entrada
+        if expira < time.monotonic():
+            del self._datos[clave]
+            self.misses += 1
+            return defecto
+        self._datos.move_to_end(clave)
+        self.hits += 1
+        return valor
+
+    def set(self, clave, valor, ttl: float = None):
+        self._datos[clave] = (valor, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.maxsize:
+            self._datos.popitem(last=False)
+
+    def invalidate(self, clave):
+        self._datos.pop(clave, None)
+
+    def clear(self):
+        self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
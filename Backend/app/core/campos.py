@@ -0,0 +1,33 @@
+"""Sparse fieldsets: parámetro `?fields=` de los listados.
+
+Cada endpoint declara qué campos se pueden pedir (lista blanca) y cuáles
+devuelve por defecto (forma resumida, sin las líneas de los pedidos). Los
+campos pedidos se traducen a una proyección de Mongo, así que lo que no se
+pide ni se lee de la base de datos ni se serializa.
+
+    campos = campos_solicitados(fields, CAMPOS_MIS_ORDENES, RESUMEN_MIS_ORDENES)
+    pedidos = await collection_pedidos.find(filtro, proyeccion(campos)).to_list(500)
+"""
+from fastapi import HTTPException
+
+DESCRIPCION_FIELDS = "Campos a devolver separados por coma (por defecto, la vista resumida)"
+
+
+def campos_solicitados(fields: str | None, permitidos: tuple, por_defecto: tuple) -> tuple:
+    """Campos pedidos en `fields`, en el orden de `permitidos`; 400 si alguno no está permitido"""
+    if not fields:
+        return por_defecto
+    pedidos = {campo.strip() for campo in fields.split(",") if campo.strip()}
+    desconocidos = pedidos - set(permitidos)
+    if desconocidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos no permitidos: {', '.join(sorted(desconocidos))}. "
+                   f"Disponibles: {', '.join(permitidos)}"
+        )
+    return tuple(campo for campo in permitidos if campo in pedidos)
+
+
+def proyeccion(campos, obligatorios: tuple = ()) -> dict:
+    """Proyección de Mongo con los campos pedidos más los que el endpoint necesita siempre"""
+    return {campo: 1 for campo in (*obligatorios, *campos)}
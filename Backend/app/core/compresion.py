@@ -0,0 +1,242 @@
+"""Compresión de respuestas (gzip y, si están instaladas, brotli / zstd).
+
+Middleware ASGI que comprime las respuestas JSON/texto según Accept-Encoding
+cuando el cuerpo supera COMPRESION_MINIMO_BYTES. El algoritmo se elige por el
+orden de COMPRESION_ALGORITMOS entre los que acepta el cliente; brotli
+(`brotli`) y zstd (`zstandard`) son opcionales y solo se ofrecen si el paquete
+está instalado.
+
+Los cuerpos de más de COMPRESION_HILO_BYTES se comprimen en un hilo para no
+bloquear el event loop (zlib, brotli y zstd liberan el GIL). Las respuestas
+en streaming pasan sin comprimir.
+
+Un endpoint puede excluirse con `@sin_compresion` (p. ej. los que devuelven
+tokens, para no exponerlos a ataques tipo BREACH):
+
+    @router.post("/token")
+    @sin_compresion
+    async def login(...):
+        ...
+"""
+import asyncio
+import gzip
+import os
+import time
+from collections import deque
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+COMPRESION_MINIMO_BYTES = int(os.getenv("COMPRESION_MINIMO_BYTES", 1024))
+COMPRESION_HILO_BYTES = int(os.getenv("COMPRESION_HILO_BYTES", 256 * 1024))
+COMPRESION_ALGORITMOS = [
+    a.strip() for a in os.getenv("COMPRESION_ALGORITMOS", "br,zstd,gzip").split(",") if a.strip()
+]
+# Niveles rápidos: los cuerpos son JSON muy repetitivo y casi todo el ahorro llega pronto
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", 6))
+COMPRESION_NIVEL_BROTLI = int(os.getenv("COMPRESION_NIVEL_BROTLI", 4))
+COMPRESION_NIVEL_ZSTD = int(os.getenv("COMPRESION_NIVEL_ZSTD", 3))
+
+TIPOS_COMPRIMIBLES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+def _gzip(cuerpo: bytes) -> bytes:
+    # mtime=0: misma entrada, mismos bytes (útil para cachés intermedias)
+    return gzip.compress(cuerpo, compresslevel=COMPRESION_NIVEL_GZIP, mtime=0)
+
+
+def _brotli(cuerpo: bytes) -> bytes:
+    return brotli.compress(cuerpo, quality=COMPRESION_NIVEL_BROTLI, mode=brotli.MODE_TEXT)
+
+
+def _zstd(cuerpo: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=COMPRESION_NIVEL_ZSTD).compress(cuerpo)
+
+
+def compresores_disponibles() -> dict:
+    """{content-encoding: función} de los algoritmos utilizables en este proceso"""
+    compresores = {"gzip": _gzip}
+    if brotli is not None:
+        compresores["br"] = _brotli
+    if zstandard is not None:
+        compresores["zstd"] = _zstd
+    return compresores
+
+
+_COMPRESORES = compresores_disponibles()
+
+
+def sin_compresion(endpoint):
+    """Marca un endpoint para que sus respuestas nunca se compriman"""
+    endpoint.sin_compresion = True
+    return endpoint
+
+
+def elegir_codificacion(accept_encoding: str) -> str | None:
+    """Primer algoritmo de COMPRESION_ALGORITMOS que el cliente acepta (q > 0)"""
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        if nombre:
+            aceptadas[nombre] = calidad
+    for algoritmo in COMPRESION_ALGORITMOS:
+        # Una entrada explícita (incluso q=0) manda sobre el comodín
+        calidad = aceptadas.get(algoritmo, aceptadas.get("*", 0.0))
+        if algoritmo in _COMPRESORES and calidad > 0:
+            return algoritmo
+    return None
+
+
+class MetricasCompresion:
+    def __init__(self, muestras: int = 512):
+        self.respuestas = 0
+        self.bytes_entrada = 0
+        self.bytes_salida = 0
+        self.en_hilo = 0
+        self.por_codificacion = {}
+        self.tiempo_cpu = deque(maxlen=muestras)
+
+    def registrar(self, codificacion: str, entrada: int, salida: int, segundos: float, en_hilo: bool):
+        self.respuestas += 1
+        self.bytes_entrada += entrada
+        self.bytes_salida += salida
+        self.en_hilo += en_hilo
+        self.por_codificacion[codificacion] = self.por_codificacion.get(codificacion, 0) + 1
+        self.tiempo_cpu.append(segundos)
+
+    def resumen(self) -> dict:
+        ordenadas = sorted(self.tiempo_cpu)
+
+        def percentil(p):
+            return round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))] * 1000, 2) if ordenadas else 0.0
+
+        return {
+            "disponibles": sorted(_COMPRESORES),
+            "respuestas": self.respuestas,
+            "por_codificacion": self.por_codificacion,
+            "en_hilo": self.en_hilo,
+            "bytes_entrada": self.bytes_entrada,
+            "bytes_salida": self.bytes_salida,
+            "ratio": round(self.bytes_salida / self.bytes_entrada, 3) if self.bytes_entrada else None,
+            "compresion_ms": {"p50": percentil(0.50), "p99": percentil(0.99)},
+        }
+
+
+metricas_compresion = MetricasCompresion()
+
+
+class CompresionMiddleware:
+    def __init__(self, app, minimo_bytes: int = COMPRESION_MINIMO_BYTES, hilo_bytes: int = COMPRESION_HILO_BYTES):
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+        self.hilo_bytes = hilo_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cabeceras = dict(scope.get("headers") or [])
+        codificacion = elegir_codificacion(cabeceras.get(b"accept-encoding", b"").decode("latin-1"))
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio_respuesta = None
+        partes = []
+        pasar_directo = False
+
+        async def enviar(mensaje):
+            nonlocal inicio_respuesta, pasar_directo
+            if pasar_directo:
+                await send(mensaje)
+                return
+
+            if mensaje["type"] == "http.response.start":
+                # Se retiene hasta ver el cuerpo; el router ya resolvió el endpoint en `scope`
+                inicio_respuesta = mensaje
+                return
+
+            if mensaje["type"] != "http.response.body":
+                await send(mensaje)
+                return
+
+            partes.append(mensaje.get("body", b""))
+            if mensaje.get("more_body", False):
+                # Streaming: se envía tal cual lo acumulado y el resto sin comprimir
+                pasar_directo = True
+                await send(inicio_respuesta)
+                await send({"type": "http.response.body", "body": b"".join(partes), "more_body": True})
+                return
+
+            cuerpo = b"".join(partes)
+            if not self._comprimible(scope, inicio_respuesta, cuerpo):
+                await send(inicio_respuesta)
+                await send({"type": "http.response.body", "body": cuerpo})
+                return
+
+            await self._enviar_comprimido(send, inicio_respuesta, cuerpo, codificacion)
+
+        await self.app(scope, receive, enviar)
+
+    def _comprimible(self, scope, inicio: dict, cuerpo: bytes) -> bool:
+        if len(cuerpo) < self.minimo_bytes:
+            return False
+        if inicio["status"] < 200 or inicio["status"] in (204, 304):
+            return False
+        if getattr(scope.get("endpoint"), "sin_compresion", False):
+            return False
+        tipo = ""
+        for nombre, valor in inicio.get("headers", []):
+            nombre = nombre.lower()
+            if nombre == b"content-encoding":
+                return False  # ya viene comprimida
+            if nombre == b"content-type":
+                tipo = valor.decode("latin-1").lower()
+        return tipo.startswith(TIPOS_COMPRIMIBLES)
+
+    async def _enviar_comprimido(self, send, inicio: dict, cuerpo: bytes, codificacion: str):
+        compresor = _COMPRESORES[codificacion]
+        en_hilo = len(cuerpo) >= self.hilo_bytes
+        inicio_cpu = time.perf_counter()
+        if en_hilo:
+            comprimido = await asyncio.to_thread(compresor, cuerpo)
+        else:
+            comprimido = compresor(cuerpo)
+        metricas_compresion.registrar(
+            codificacion, len(cuerpo), len(comprimido), time.perf_counter() - inicio_cpu, en_hilo
+        )
+
+        cabeceras = []
+        vary = None
+        for nombre, valor in inicio.get("headers", []):
+            nombre_min = nombre.lower()
+            if nombre_min == b"content-length":
+                continue
+            if nombre_min == b"vary":
+                vary = valor
+                continue
+            if nombre_min == b"etag" and not valor.startswith(b"W/"):
+                # Otra representación de los mismos datos: el ETag pasa a débil
+                valor = b"W/" + valor
+            cabeceras.append((nombre, valor))
+        cabeceras.append((b"content-encoding", codificacion.encode()))
+        cabeceras.append((b"content-length", str(len(comprimido)).encode()))
+        cabeceras.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+
+        await send({**inicio, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": comprimido})
@@ -1,4 +1,6 @@
-from fastapi import FastAPI
+import hmac
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware  # Importa el middleware CORS
 from dotenv import load_dotenv
 
@@ -8,10 +10,52 @@ from app.users.routes import router as users_router
 from app.orders.routes import router as orders_router
 from app.products.routes import router as products_router
 from app.store.routes import router as store_router
+from app.core.database import connect_to_mongo, close_mongo_connection, ensure_indexes
+from app.core.outbox import iniciar_worker_outbox, detener_worker_outbox
+from app.core.hashing import detener_executor_hashing
+from app.orders.contadores import iniciar_reconciliacion_contadores, detener_reconciliacion_contadores
+from app.auth.controllers import iniciar_worker_accesos, detener_worker_accesos
+from app.core.respuestas import RespuestaJSON
+from app.core.compresion import CompresionMiddleware
+from app.core.logs import RequestIdMiddleware, configurar_logs
+from app.core.metricas import METRICAS_TOKEN, MetricasMiddleware, exportar_metricas
+from app.core.vigilante_loop import iniciar_vigilante_loop, detener_vigilante_loop
+from app.core.perfilado import CABECERA_PERFIL, PerfiladoMiddleware
+from app.core.consultas import CABECERA_DB_LLAMADAS, CABECERA_DB_TIEMPO, DB_CABECERAS, ConsumoDBMiddleware
 
 load_dotenv()
 
-app = FastAPI()
+# Logs JSON por cola + hilo escritor (se vacía al salir); nivel con LOG_LEVEL
+configurar_logs()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Conectar a MongoDB y crear índices antes de aceptar peticiones
+    await connect_to_mongo()
+    await ensure_indexes()
+    iniciar_vigilante_loop()
+    iniciar_worker_outbox()
+    iniciar_worker_accesos()
+    iniciar_reconciliacion_contadores()
+    yield
+    await detener_reconciliacion_contadores()
+    await detener_worker_accesos()
+    await detener_worker_outbox()
+    detener_executor_hashing()
+    await detener_vigilante_loop()
+    close_mongo_connection()
+
+
+# orjson con ObjectId/datetime/Decimal nativos para todas las respuestas
+app = FastAPI(lifespan=lifespan, default_response_class=RespuestaJSON)
+
+# gzip (o brotli/zstd si están instalados) para listados grandes; CORS queda por fuera
+app.add_middleware(CompresionMiddleware)
+
+# Fuera de producción: X-DB-Calls / X-DB-Time con los comandos de Mongo de cada petición
+if DB_CABECERAS:
+    app.add_middleware(ConsumoDBMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,12 +67,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permite todos los métodos HTTP
     allow_headers=["*"],  # Permite todos los headers
+    expose_headers=["ETag", "X-Catalogo-Version", "X-Request-ID", CABECERA_DB_LLAMADAS, CABECERA_DB_TIEMPO, CABECERA_PERFIL],  # Legibles desde el frontend
 )
+
+# Latencia, estado y peticiones en curso por ruta (incluye CORS y compresión)
+app.add_middleware(MetricasMiddleware)
+
+# Perfil de pyinstrument de una petición concreta si trae un token de perfilado (X-Perfilar)
+app.add_middleware(PerfiladoMiddleware)
+
+# El más externo: todo lo que se registre durante la petición lleva su request_id
+app.add_middleware(RequestIdMiddleware)
+
 # Health Check Endpoint
 @app.get("/")
 async def read_root():
     return {"message": "Bienvenido a la API de inventario"}
 
+# Métricas para Prometheus; con METRICAS_TOKEN exige "Authorization: Bearer <token>"
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICAS_TOKEN and not hmac.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICAS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    cuerpo, content_type = exportar_metricas()
+    return Response(content=cuerpo, media_type=content_type)
+
 # Incluir todos los routers
 app.include_router(auth_router, prefix="/auth", tags=["Auth"])
 app.include_router(users_router, prefix="/api", tags=["Users"])
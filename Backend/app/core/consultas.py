@@ -0,0 +1,129 @@
+"""Contabilidad de comandos de Mongo por petición (detector de N+1).
+
+Cada petición abre un `ConsumoDB` en una ContextVar y un `CommandListener` de
+pymongo le suma cada comando (número y tiempo). Motor ejecuta pymongo en su
+pool de hilos copiando el contexto de la tarea, así que el listener ve el
+`ConsumoDB` de la petición que lanzó el comando; los workers en segundo plano
+no tienen ninguno y no cuentan.
+
+Fuera de producción (ENTORNO distinto de "produccion", o DB_CABECERAS=true)
+las respuestas llevan:
+
+    X-DB-Calls: 3
+    X-DB-Time: 4.2        (milisegundos)
+
+Para fijar un presupuesto de consultas por endpoint (ver
+benchmarks/presupuesto_consultas.py):
+
+    with presupuesto_consultas(2, "GET /orders/detalles-pedidos"):
+        await cliente.get(f"/orders/detalles-pedidos/{pedido_id}")
+"""
+import os
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+ENTORNO = os.getenv("ENTORNO", "produccion")
+DB_CABECERAS = os.getenv("DB_CABECERAS", str(ENTORNO != "produccion")).lower() == "true"
+
+CABECERA_DB_LLAMADAS = "X-DB-Calls"
+CABECERA_DB_TIEMPO = "X-DB-Time"
+
+
+class ConsumoDB:
+    """Comandos y tiempo de Mongo acumulados; se propagan al consumo que lo contiene"""
+
+    def __init__(self, padre: "ConsumoDB | None" = None):
+        self.padre = padre
+        self.llamadas = 0
+        self.segundos = 0.0
+        self.comandos = Counter()
+
+    def registrar(self, comando: str, coleccion: str):
+        consumo = self
+        while consumo is not None:
+            consumo.llamadas += 1
+            consumo.comandos[f"{comando} {coleccion}".strip()] += 1
+            consumo = consumo.padre
+
+    def sumar_tiempo(self, segundos: float):
+        consumo = self
+        while consumo is not None:
+            consumo.segundos += segundos
+            consumo = consumo.padre
+
+    @property
+    def milisegundos(self) -> float:
+        return round(self.segundos * 1000, 1)
+
+
+consumo_actual: ContextVar[ConsumoDB | None] = ContextVar("consumo_db", default=None)
+
+
+@contextmanager
+def medir_consumo():
+    """Abre un ConsumoDB para el bloque (anidable: el exterior también suma)"""
+    consumo = ConsumoDB(padre=consumo_actual.get())
+    token = consumo_actual.set(consumo)
+    try:
+        yield consumo
+    finally:
+        consumo_actual.reset(token)
+
+
+@contextmanager
+def presupuesto_consultas(maximo: int, descripcion: str = ""):
+    """AssertionError si el bloque lanza más de `maximo` comandos de Mongo"""
+    with medir_consumo() as consumo:
+        yield consumo
+    if consumo.llamadas > maximo:
+        detalle = ", ".join(f"{comando} x{veces}" for comando, veces in consumo.comandos.most_common())
+        raise AssertionError(
+            f"{descripcion or 'Bloque'}: {consumo.llamadas} comandos de Mongo (presupuesto {maximo}): {detalle}"
+        )
+
+
+class ListenerConsumo(monitoring.CommandListener):
+    """Suma cada comando al ConsumoDB del contexto que lo lanzó (si hay uno)"""
+
+    def started(self, event):
+        consumo = consumo_actual.get()
+        if consumo is None:
+            return
+        coleccion = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            coleccion = event.command.get("collection")
+        consumo.registrar(event.command_name, coleccion if isinstance(coleccion, str) else "")
+
+    def succeeded(self, event):
+        consumo = consumo_actual.get()
+        if consumo is not None:
+            consumo.sumar_tiempo(event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+class ConsumoDBMiddleware:
+    """Añade X-DB-Calls / X-DB-Time con lo consumido hasta enviar la respuesta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with medir_consumo() as consumo:
+            async def enviar(mensaje):
+                if mensaje["type"] == "http.response.start":
+                    cabeceras = list(mensaje.get("headers", []))
+                    cabeceras.append((CABECERA_DB_LLAMADAS.lower().encode(), str(consumo.llamadas).encode()))
+                    cabeceras.append((CABECERA_DB_TIEMPO.lower().encode(), str(consumo.milisegundos).encode()))
+                    mensaje = {**mensaje, "headers": cabeceras}
+                await send(mensaje)
+
+            await self.app(scope, receive, enviar)
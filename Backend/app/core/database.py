@@ -1,7 +1,14 @@
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.core.consultas import ListenerConsumo
+from app.core.metricas import ListenerComandos
 import os
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 uri = os.getenv("MONGODB_URI")
@@ -10,16 +17,167 @@ db_name = os.getenv("MONGODB_NAME", "DatabaseInvetary")
 if not uri:
     raise RuntimeError("MONGODB_URI no está definida en .env")
 
-client = AsyncIOMotorClient(uri)
-db = client[db_name]
-collection_productos = db["productos"]
-collection_pedidos = db["pedidos"]
-collection_distribuidores = db["distribuidores"]
-collection_facturas = db["facturadores"]
-collection_produccion = db["produccion"]
-collection_admin = db["admin"]
-collection_bodegas = db["bodega"]
-collection_ordenes = db["purchase_orders"]
-
-def connect_to_mongo():
-    pass
+# Parámetros del pool de conexiones (ajustar según el número de workers de uvicorn)
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 100))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 10))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", 300000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000))
+# Compresores en orden de preferencia, ej. "zstd,snappy" (requieren zstandard / python-snappy)
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "")
+
+client: AsyncIOMotorClient | None = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    if client is None:
+        raise RuntimeError("El cliente de MongoDB no está inicializado (connect_to_mongo no se ha ejecutado)")
+    return client
+
+
+def get_db():
+    return get_client()[db_name]
+
+
+class _Coleccion:
+    """Referencia perezosa a una colección.
+
+    Los módulos importan las colecciones al cargarse, pero el cliente se crea
+    en el lifespan de la app; cada acceso se resuelve contra el cliente actual.
+    """
+
+    def __init__(self, nombre: str):
+        self._nombre = nombre
+
+    def __getattr__(self, atributo):
+        return getattr(get_db()[self._nombre], atributo)
+
+    def __repr__(self):
+        return f"<Coleccion {db_name}.{self._nombre}>"
+
+
+collection_productos = _Coleccion("productos")
+collection_pedidos = _Coleccion("pedidos")
+collection_distribuidores = _Coleccion("distribuidores")
+collection_facturas = _Coleccion("facturadores")
+collection_produccion = _Coleccion("produccion")
+collection_admin = _Coleccion("admin")
+collection_bodegas = _Coleccion("bodega")
+collection_ordenes = _Coleccion("purchase_orders")
+collection_outbox = _Coleccion("email_outbox")
+collection_ventas_diarias = _Coleccion("ventas_diarias")
+collection_contadores = _Coleccion("contadores_estado")
+collection_versiones = _Coleccion("versiones")
+collection_productos_eliminados = _Coleccion("productos_eliminados")
+
+# Registro declarativo de índices por colección.
+# Cada entrada se aplica con create_indexes al arrancar; si el índice ya existe
+# con la misma especificación MongoDB no hace nada, así que es idempotente.
+INDEXES = {
+    # Login y resolución del usuario autenticado por correo
+    "admin": [
+        IndexModel([("correo_electronico", ASCENDING)], unique=True, name="correo_unico"),
+    ],
+    "distribuidores": [
+        IndexModel([("correo_electronico", ASCENDING)], unique=True, name="correo_unico"),
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("cdi", ASCENDING)], name="cdi"),
+    ],
+    "bodega": [
+        IndexModel([("correo_electronico", ASCENDING)], unique=True, name="correo_unico"),
+    ],
+    "produccion": [
+        IndexModel([("correo_electronico", ASCENDING)], unique=True, name="correo_unico"),
+        IndexModel([("id", ASCENDING)], name="id"),
+    ],
+    "facturadores": [
+        IndexModel([("correo_electronico", ASCENDING)], unique=True, name="correo_unico"),
+        IndexModel([("id", ASCENDING)], name="id"),
+    ],
+    # El id de producto (P001, P002...) es secuencial por admin
+    "productos": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("admin_id", ASCENDING), ("id", DESCENDING)], name="admin_id_id"),
+        # Consultas de stock bajo / sin stock del dashboard de bodega
+        IndexModel([("stock.medellin", ASCENDING)], name="stock_medellin"),
+        IndexModel([("stock.guarne", ASCENDING)], name="stock_guarne"),
+        IndexModel([("revision", ASCENDING)], name="revision"),
+    ],
+    # Marcas de productos eliminados para la sincronización incremental del catálogo
+    "productos_eliminados": [
+        IndexModel([("revision", ASCENDING)], name="revision"),
+    ],
+    # Los listados se paginan por (fecha, _id) descendente
+    "pedidos": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("fecha", DESCENDING), ("_id", DESCENDING)], name="fecha_id"),
+        IndexModel([("distribuidor_id", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)], name="distribuidor_fecha_id"),
+        IndexModel([("estado", ASCENDING), ("fecha", DESCENDING)], name="estado_fecha"),
+        IndexModel([("tipo_precio", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)], name="tipo_precio_fecha_id"),
+        # Índice multikey sobre las líneas del pedido
+        IndexModel([("productos.id", ASCENDING)], name="productos_id"),
+    ],
+    "purchase_orders": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("fecha", DESCENDING), ("_id", DESCENDING)], name="fecha_id"),
+        IndexModel([("distribuidor_id", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)], name="distribuidor_fecha_id"),
+        IndexModel([("tipo_precio", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)], name="tipo_precio_fecha_id"),
+        IndexModel([("estado", ASCENDING), ("tipo_precio", ASCENDING)], name="estado_tipo_precio"),
+        IndexModel([("productos.id", ASCENDING)], name="productos_id"),
+    ],
+    # Cola de correos: el worker reclama por estado y fecha de próximo intento
+    "email_outbox": [
+        IndexModel([("estado", ASCENDING), ("proximo_intento", ASCENDING)], name="estado_proximo_intento"),
+        IndexModel([("enviado_en", ASCENDING)], expireAfterSeconds=30 * 24 * 3600, name="enviado_en_ttl"),
+    ],
+    # Rollup de ventas: clave única para los $inc con upsert y el $merge de reconstrucción;
+    # el prefijo por día sirve las consultas por rango del mes
+    "ventas_diarias": [
+        IndexModel(
+            [("dia", ASCENDING), ("cdi", ASCENDING), ("tipo_precio", ASCENDING),
+             ("producto_id", ASCENDING), ("distribuidor_id", ASCENDING)],
+            unique=True,
+            name="clave_unica"
+        ),
+    ],
+}
+
+
+async def ensure_indexes():
+    """Crea los índices de INDEXES. Un fallo en una colección no impide el arranque."""
+    for nombre_coleccion, indices in INDEXES.items():
+        try:
+            creados = await get_db()[nombre_coleccion].create_indexes(indices)
+            logger.info("🗂️ Índices verificados en %s: %s", nombre_coleccion, ', '.join(creados))
+        except OperationFailure as e:
+            # Ej.: correos duplicados que impiden un índice único, o un índice
+            # existente con el mismo nombre y otra especificación.
+            logger.error("❌ No se pudieron crear índices en %s: %s", nombre_coleccion, e)
+
+
+async def connect_to_mongo():
+    """Crea el cliente con el pool configurado y lo calienta con un ping."""
+    global client
+    opciones = {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    }
+    if MONGODB_COMPRESSORS:
+        opciones["compressors"] = MONGODB_COMPRESSORS
+
+    # Latencia por comando y colección para /metrics
+    client = AsyncIOMotorClient(uri, event_listeners=[ListenerComandos(), ListenerConsumo()], **opciones)
+
+    # El ping obliga a resolver el servidor y abrir la primera conexión antes
+    # de aceptar tráfico; minPoolSize rellena el resto del pool en segundo plano.
+    await client.admin.command("ping")
+    logger.info("✅ Conectado a MongoDB (%s) con pool %s-%s", db_name, MONGODB_MIN_POOL_SIZE, MONGODB_MAX_POOL_SIZE)
+
+
+def close_mongo_connection():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+        logger.info("🔌 Conexión a MongoDB cerrada")
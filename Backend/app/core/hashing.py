@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+
+from app.core.security import pwd_context
+
+logger = logging.getLogger(__name__)
+
+# bcrypt libera el GIL, así que un pool de hilos basta; "process" aísla la CPU
+# del proceso del servidor a costa de serializar argumentos entre procesos
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread").lower()
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Operaciones en espera + en curso a partir de las cuales se responde 503
+HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", 32))
+HASH_RETRY_AFTER = os.getenv("HASH_RETRY_AFTER", "2")
+
+_executor = None
+_pendientes = 0
+
+
+def _verificar(password: str, hashed_password: str):
+    inicio = time.perf_counter()
+    resultado = pwd_context.verify(password, hashed_password)
+    return resultado, time.perf_counter() - inicio
+
+
+def _hashear(password: str):
+    inicio = time.perf_counter()
+    resultado = pwd_context.hash(password)
+    return resultado, time.perf_counter() - inicio
+
+
+def _percentil(muestras, p: float) -> float:
+    if not muestras:
+        return 0.0
+    ordenadas = sorted(muestras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+class MetricasHashing:
+    """Tiempo en cola frente a tiempo de bcrypt, sobre las últimas operaciones"""
+
+    def __init__(self, muestras: int = 1024):
+        self.completadas = 0
+        self.rechazadas = 0
+        self.errores = 0
+        self.espera = deque(maxlen=muestras)
+        self.hash = deque(maxlen=muestras)
+
+    def registrar(self, espera: float, duracion: float):
+        self.completadas += 1
+        self.espera.append(espera)
+        self.hash.append(duracion)
+
+    def resumen(self) -> dict:
+        return {
+            "executor": HASH_EXECUTOR,
+            "workers": HASH_WORKERS,
+            "max_pendientes": HASH_MAX_PENDIENTES,
+            "pendientes": _pendientes,
+            "completadas": self.completadas,
+            "rechazadas": self.rechazadas,
+            "errores": self.errores,
+            "espera_ms": {
+                "p50": round(_percentil(self.espera, 0.50) * 1000, 1),
+                "p99": round(_percentil(self.espera, 0.99) * 1000, 1),
+            },
+            "hash_ms": {
+                "p50": round(_percentil(self.hash, 0.50) * 1000, 1),
+                "p99": round(_percentil(self.hash, 0.99) * 1000, 1),
+            },
+        }
+
+
+metricas = MetricasHashing()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        if HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+        logger.info("🔐 Executor de hashing iniciado (%s, %s workers)", HASH_EXECUTOR, HASH_WORKERS)
+    return _executor
+
+
+async def _ejecutar(funcion, *args):
+    global _pendientes
+    if _pendientes >= HASH_MAX_PENDIENTES:
+        # Mejor rechazar rápido que dejar crecer la cola y que todos esperen
+        metricas.rechazadas += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta de nuevo en unos segundos",
+            headers={"Retry-After": HASH_RETRY_AFTER},
+        )
+
+    _pendientes += 1
+    inicio = time.perf_counter()
+    try:
+        resultado, duracion = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), funcion, *args
+        )
+    except Exception:
+        metricas.errores += 1
+        raise
+    finally:
+        _pendientes -= 1
+
+    metricas.registrar(max(0.0, time.perf_counter() - inicio - duracion), duracion)
+    return resultado
+
+
+async def verificar_password(password: str, hashed_password: str) -> bool:
+    """pwd_context.verify fuera del event loop"""
+    return await _ejecutar(_verificar, password, hashed_password)
+
+
+async def hashear_password(password: str) -> str:
+    """pwd_context.hash fuera del event loop"""
+    return await _ejecutar(_hashear, password)
+
+
+def metricas_hashing() -> dict:
+    return metricas.resumen()
+
+
+def detener_executor_hashing():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
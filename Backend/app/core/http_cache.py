@@ -0,0 +1,63 @@
+"""GET condicional (ETag / If-None-Match) y Cache-Control.
+
+El ETag se calcula a partir de una revisión del documento o de la versión del
+catálogo (nunca del cuerpo), así que un 304 se responde antes de construir o
+serializar la respuesta:
+
+    etag = calcular_etag("pedido", pedido["_id"], pedido.get("revision", 0))
+    if etag_coincide(request, etag):
+        return respuesta_no_modificada(etag, cache_control)
+    aplicar_cabeceras(response, etag, cache_control)
+"""
+import hashlib
+import os
+
+from fastapi import Request, Response
+
+# Segundos que el navegador de un distribuidor puede reutilizar su vista sin revalidar
+CACHE_MAX_AGE_DISTRIBUIDOR = int(os.getenv("CACHE_MAX_AGE_DISTRIBUIDOR", 30))
+
+# Revalidar siempre (con 304 es barato); nunca en cachés compartidas
+SIN_CACHE = "private, no-cache"
+
+
+def calcular_etag(*partes) -> str:
+    """ETag fuerte a partir de los valores que identifican la representación"""
+    clave = "|".join(str(p) for p in partes)
+    return '"' + hashlib.sha1(clave.encode()).hexdigest() + '"'
+
+
+def etag_coincide(request: Request, etag: str) -> bool:
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return False
+    if cabecera.strip() == "*":
+        return True
+    # If-None-Match usa comparación débil: se ignora el prefijo W/
+    candidatos = [c.strip().removeprefix("W/") for c in cabecera.split(",")]
+    return etag in candidatos
+
+
+def cache_control(rol: str, max_age_distribuidor: int = 0) -> str:
+    """Cache-Control según la vista del rol.
+
+    Los distribuidores solo leen (pueden reutilizar su vista unos segundos);
+    admin y bodega editan precios y stock, así que siempre revalidan.
+    """
+    if max_age_distribuidor and rol.startswith("distribuidor"):
+        return f"private, max-age={max_age_distribuidor}, must-revalidate"
+    return SIN_CACHE
+
+
+def aplicar_cabeceras(response: Response, etag: str, control: str = SIN_CACHE):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = control
+    # La representación depende del usuario autenticado
+    response.headers["Vary"] = "Authorization"
+
+
+def respuesta_no_modificada(etag: str, control: str = SIN_CACHE) -> Response:
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": control, "Vary": "Authorization"}
+    )
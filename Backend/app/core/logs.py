@@ -0,0 +1,155 @@
+"""Logging asíncrono con salida JSON y correlación por petición.
+
+Los módulos usan `logging.getLogger(__name__)` (todos cuelgan del logger
+`app`). Los registros se encolan con un QueueHandler y un hilo
+(QueueListener) los formatea y escribe en stdout, así que una petición nunca
+se bloquea escribiendo en la tubería.
+
+Cada línea es un objeto JSON con nivel, logger, mensaje y el `request_id` de
+la petición en curso (cabecera X-Request-ID, o uno generado). Con
+LOG_FORMATO=texto se escribe una línea legible para desarrollo.
+
+Los mensajes de depuración usan argumentos `%s`, que solo se formatean si
+el nivel DEBUG está activo:
+
+    logger.debug("🛍️ Procesando producto: %s", producto)
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMATO = os.getenv("LOG_FORMATO", "json")
+
+CABECERA_REQUEST_ID = "X-Request-ID"
+
+request_id_actual: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# Atributos estándar de LogRecord; el resto se trata como campo extra
+_ATRIBUTOS_RECORD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener: logging.handlers.QueueListener | None = None
+_formato_base = logging.Formatter()
+
+
+class FiltroRequestId(logging.Filter):
+    """Copia el request_id del contexto al registro (en el hilo que emite, no en el listener)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_actual.get()
+        return True
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        datos = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            datos["request_id"] = request_id
+        # Campos pasados con extra={...}
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD:
+                datos[clave] = valor
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            datos["excepcion"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not getattr(record, "request_id", None):
+            record.request_id = "-"
+        return super().format(record)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Mensaje y traceback se resuelven en el hilo que emite (los argumentos
+        # pueden cambiar después); el formato JSON lo aplica el listener
+        mensaje = record.getMessage()
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = _formato_base.formatException(record.exc_info)
+        record.msg = mensaje
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def configurar_logs(nivel: str = LOG_LEVEL, formato: str = LOG_FORMATO):
+    """Configura el logger `app` con cola + hilo escritor (idempotente)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormatoJSON() if formato == "json" else FormatoTexto())
+
+    cola = queue.SimpleQueue()
+    manejador = _QueueHandler(cola)
+    manejador.addFilter(FiltroRequestId())
+
+    logger = logging.getLogger("app")
+    logger.setLevel(nivel)
+    logger.handlers = [manejador]
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    _listener.start()
+    # Los scripts (migraciones, reconstrucciones) no pasan por el lifespan
+    atexit.register(detener_logs)
+
+
+def detener_logs():
+    """Vacía la cola y detiene el hilo escritor"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+
+
+class RequestIdMiddleware:
+    """Asigna un request_id a cada petición (o reutiliza X-Request-ID) y lo devuelve en la respuesta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recibido = dict(scope.get("headers") or []).get(CABECERA_REQUEST_ID.lower().encode())
+        request_id = recibido.decode("latin-1")[:64] if recibido else uuid.uuid4().hex
+        token = request_id_actual.set(request_id)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                cabeceras = list(mensaje.get("headers", []))
+                cabeceras.append((CABECERA_REQUEST_ID.lower().encode(), request_id.encode("latin-1")))
+                mensaje = {**mensaje, "headers": cabeceras}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            request_id_actual.reset(token)
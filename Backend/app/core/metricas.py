@@ -0,0 +1,163 @@
+"""Métricas en formato Prometheus (GET /metrics).
+
+- HTTP: histograma de latencia y contador de respuestas por (método, ruta,
+  estado) y peticiones en curso, desde `MetricasMiddleware`. La ruta es la
+  plantilla de FastAPI (`/orders/ordenes/{pedido_id}`), no la URL, para no
+  disparar la cardinalidad.
+- Mongo: latencia por (comando, colección) con un `CommandListener` de
+  pymongo registrado en el cliente (`connect_to_mongo`).
+- Outbox de correos y cachés en memoria (aciertos, fallos, entradas).
+- Event loop: retraso del latido y bloqueos por encima del umbral
+  (`app/core/vigilante_loop.py`).
+
+Cada worker de uvicorn tiene sus propios contadores. Con varios workers se
+puede definir PROMETHEUS_MULTIPROC_DIR (modo multiproceso de
+prometheus_client); en ese modo las métricas de cachés, que se leen del
+proceso que atiende el scrape, no se exportan.
+
+Si METRICAS_TOKEN está definido, /metrics exige `Authorization: Bearer <token>`.
+"""
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+
+from app.core.cache import caches_registradas
+
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+SIN_RUTA = "sin_ruta"
+
+# --- HTTP ---
+PETICIONES_SEGUNDOS = Histogram(
+    "http_peticion_segundos", "Latencia de las peticiones HTTP", ["metodo", "ruta"]
+)
+RESPUESTAS_TOTAL = Counter(
+    "http_respuestas_total", "Respuestas HTTP por código de estado", ["metodo", "ruta", "estado"]
+)
+PETICIONES_EN_CURSO = Gauge(
+    "http_peticiones_en_curso", "Peticiones HTTP en curso", ["metodo"], multiprocess_mode="livesum"
+)
+
+# --- Mongo ---
+MONGO_COMANDO_SEGUNDOS = Histogram(
+    "mongo_comando_segundos", "Latencia de los comandos de MongoDB", ["comando", "coleccion"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+MONGO_COMANDOS_FALLIDOS = Counter(
+    "mongo_comandos_fallidos_total", "Comandos de MongoDB que devolvieron error", ["comando", "coleccion"]
+)
+
+# --- Outbox de correos ---
+CORREOS_ENCOLADOS = Counter("outbox_correos_encolados_total", "Correos insertados en la outbox")
+CORREOS_ENVIADOS = Counter("outbox_correos_enviados_total", "Correos entregados al servidor SMTP")
+CORREOS_REINTENTOS = Counter("outbox_correos_reintentos_total", "Envíos fallidos que se reintentarán")
+CORREOS_DESCARTADOS = Counter("outbox_correos_descartados_total", "Correos descartados tras agotar los intentos")
+
+# --- Catálogo en memoria ---
+CATALOGO_RECONSTRUCCIONES = Counter(
+    "catalogo_reconstrucciones_total", "Recargas del catálogo de productos desde Mongo"
+)
+
+# --- Event loop ---
+EVENT_LOOP_LAG_SEGUNDOS = Histogram(
+    "event_loop_lag_segundos", "Retraso del latido del event loop respecto a lo programado",
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+EVENT_LOOP_BLOQUEOS = Counter(
+    "event_loop_bloqueos_total", "Veces que el event loop estuvo bloqueado por encima del umbral"
+)
+
+
+class _CachesCollector:
+    """Aciertos, fallos y tamaño de cada TTLCache con nombre"""
+
+    def collect(self):
+        aciertos = CounterMetricFamily("cache_aciertos", "Lecturas de caché con dato vigente", labels=["cache"])
+        fallos = CounterMetricFamily("cache_fallos", "Lecturas de caché sin dato o expirado", labels=["cache"])
+        entradas = GaugeMetricFamily("cache_entradas", "Entradas en la caché", labels=["cache"])
+        for cache in caches_registradas():
+            aciertos.add_metric([cache.nombre], cache.hits)
+            fallos.add_metric([cache.nombre], cache.misses)
+            entradas.add_metric([cache.nombre], len(cache))
+        yield aciertos
+        yield fallos
+        yield entradas
+
+
+REGISTRY.register(_CachesCollector())
+
+
+class ListenerComandos(monitoring.CommandListener):
+    """Latencia de cada comando de Mongo por (comando, colección).
+
+    pymongo llama a estos métodos en el hilo que ejecuta el comando; solo
+    observan la duración que trae el evento, sin E/S.
+    """
+
+    def __init__(self):
+        self._colecciones = {}
+
+    def started(self, event):
+        # El nombre de la colección solo viene en el comando de inicio
+        valor = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            valor = event.command.get("collection")
+        self._colecciones[(event.connection_id, event.request_id)] = valor if isinstance(valor, str) else ""
+
+    def _coleccion(self, event) -> str:
+        return self._colecciones.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        MONGO_COMANDO_SEGUNDOS.labels(event.command_name, self._coleccion(event)).observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def failed(self, event):
+        coleccion = self._coleccion(event)
+        MONGO_COMANDO_SEGUNDOS.labels(event.command_name, coleccion).observe(event.duration_micros / 1_000_000)
+        MONGO_COMANDOS_FALLIDOS.labels(event.command_name, coleccion).inc()
+
+
+class MetricasMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        estado = 500
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        PETICIONES_EN_CURSO.labels(metodo).inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            PETICIONES_EN_CURSO.labels(metodo).dec()
+            # El router deja en `scope` la ruta que resolvió
+            ruta = getattr(scope.get("route"), "path", SIN_RUTA)
+            PETICIONES_SEGUNDOS.labels(metodo, ruta).observe(time.perf_counter() - inicio)
+            RESPUESTAS_TOTAL.labels(metodo, ruta, str(estado)).inc()
+
+
+def exportar_metricas() -> tuple[bytes, str]:
+    """Cuerpo y content-type del scrape"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
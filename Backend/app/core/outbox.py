@@ -0,0 +1,251 @@
+"""Cola de salida (outbox) de correos respaldada en MongoDB.
+
+Los endpoints solo insertan los correos en la colección `email_outbox` y
+regresan; un worker asyncio los entrega en segundo plano reutilizando la
+conexión SMTP, con reintentos exponenciales y un límite de envíos por minuto.
+
+Para probar en local contra un servidor SMTP de prueba (ej. aiosmtpd):
+
+    python -m aiosmtpd -n -l localhost:8025
+    SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_SSL=false uvicorn ...
+
+Si EMAIL_CONTRASENA no está definida no se hace login en el servidor SMTP.
+"""
+import asyncio
+import logging
+import os
+import random
+import smtplib
+import ssl
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+
+from app.core.database import collection_outbox
+from app.core.metricas import CORREOS_DESCARTADOS, CORREOS_ENCOLADOS, CORREOS_ENVIADOS, CORREOS_REINTENTOS
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+EMAIL_SENDER = os.getenv("EMAIL_REMITENTE")
+EMAIL_PASSWORD = os.getenv("EMAIL_CONTRASENA")  # Contraseña de aplicación generada en Gmail
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 465))  # Puerto seguro con SSL
+SMTP_SSL = os.getenv("SMTP_SSL", "true").lower() == "true"
+
+# Desactivar en procesos que no deben enviar correos (scripts, benchmarks)
+OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "true").lower() == "true"
+OUTBOX_MAX_INTENTOS = int(os.getenv("OUTBOX_MAX_INTENTOS", 6))
+OUTBOX_BACKOFF_SEGUNDOS = float(os.getenv("OUTBOX_BACKOFF_SEGUNDOS", 30))
+OUTBOX_MAX_POR_MINUTO = int(os.getenv("OUTBOX_MAX_POR_MINUTO", 20))
+OUTBOX_INTERVALO_SONDEO = float(os.getenv("OUTBOX_INTERVALO_SONDEO", 10))
+OUTBOX_LEASE_SEGUNDOS = int(os.getenv("OUTBOX_LEASE_SEGUNDOS", 120))
+SMTP_INACTIVIDAD_SEGUNDOS = float(os.getenv("SMTP_INACTIVIDAD_SEGUNDOS", 60))
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_ENVIANDO = "enviando"
+ESTADO_ENVIADO = "enviado"
+ESTADO_FALLIDO = "fallido"
+
+_despertar = asyncio.Event()
+_tarea_worker: asyncio.Task | None = None
+
+
+def correo(destinatario: str, asunto: str, mensaje: str) -> dict:
+    """Construye un documento de la outbox listo para insertar."""
+    ahora = datetime.utcnow()
+    return {
+        "destinatario": destinatario,
+        "asunto": asunto,
+        "mensaje": mensaje,
+        "estado": ESTADO_PENDIENTE,
+        "intentos": 0,
+        "creado_en": ahora,
+        "proximo_intento": ahora,
+    }
+
+
+async def encolar_correos(correos: list, session=None):
+    """Inserta los correos en la outbox y despierta al worker.
+
+    Acepta una sesión para que la inserción forme parte de la misma
+    transacción que la escritura que origina los correos.
+    """
+    correos = [c for c in correos if c.get("destinatario")]
+    if not correos:
+        return
+    await collection_outbox.insert_many(correos, session=session)
+    CORREOS_ENCOLADOS.inc(len(correos))
+    _despertar.set()
+
+
+class _ConexionSMTP:
+    """Conexión SMTP reutilizable entre envíos; se cierra tras un rato inactiva.
+
+    Sus métodos son bloqueantes y se ejecutan fuera del event loop.
+    """
+
+    def __init__(self):
+        self._servidor = None
+        self._ultimo_uso = 0.0
+
+    def _conectar(self):
+        if SMTP_SSL:
+            contexto = ssl.create_default_context()
+            servidor = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, context=contexto, timeout=30)
+        else:
+            servidor = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+        if EMAIL_PASSWORD:
+            servidor.login(EMAIL_SENDER, EMAIL_PASSWORD)
+        self._servidor = servidor
+
+    def enviar(self, destinatario: str, asunto: str, mensaje: str):
+        msg = EmailMessage()
+        msg["Subject"] = asunto
+        msg["From"] = EMAIL_SENDER
+        msg["To"] = destinatario
+        msg.set_content(mensaje, subtype="html")  # Enviar contenido en HTML
+
+        if self._servidor is None:
+            self._conectar()
+        try:
+            self._servidor.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # El servidor cerró la conexión reutilizada: reconectar una vez
+            self._servidor = None
+            self._conectar()
+            self._servidor.send_message(msg)
+        self._ultimo_uso = time.monotonic()
+
+    def cerrar_si_inactiva(self):
+        if self._servidor and time.monotonic() - self._ultimo_uso > SMTP_INACTIVIDAD_SEGUNDOS:
+            self.cerrar()
+
+    def cerrar(self):
+        if self._servidor is None:
+            return
+        try:
+            self._servidor.quit()
+        except smtplib.SMTPException:
+            pass
+        finally:
+            self._servidor = None
+
+
+async def _descartar_leases_agotados(ahora: datetime):
+    """Marca como fallidos los correos cuyo envío venció el lease sin intentos restantes.
+
+    Un envío que se cuelga o tumba el worker nunca pasa por `_registrar_fallo`;
+    sin esto se reclamaría indefinidamente.
+    """
+    resultado = await collection_outbox.update_many(
+        {"estado": ESTADO_ENVIANDO, "lease_hasta": {"$lt": ahora}, "intentos": {"$gte": OUTBOX_MAX_INTENTOS}},
+        {"$set": {"estado": ESTADO_FALLIDO, "error": "Lease vencido sin intentos restantes"},
+         "$unset": {"lease_hasta": ""}}
+    )
+    if resultado.modified_count:
+        CORREOS_DESCARTADOS.inc(resultado.modified_count)
+        logger.error("❌ %s correos descartados: el envío venció el lease en todos sus intentos", resultado.modified_count)
+
+
+async def _reclamar_siguiente():
+    """Toma el siguiente correo pendiente, o uno cuyo lease haya vencido y le queden intentos."""
+    ahora = datetime.utcnow()
+    await _descartar_leases_agotados(ahora)
+    return await collection_outbox.find_one_and_update(
+        {"$or": [
+            {"estado": ESTADO_PENDIENTE, "proximo_intento": {"$lte": ahora}},
+            {"estado": ESTADO_ENVIANDO, "lease_hasta": {"$lt": ahora}, "intentos": {"$lt": OUTBOX_MAX_INTENTOS}},
+        ]},
+        {
+            "$set": {"estado": ESTADO_ENVIANDO, "lease_hasta": ahora + timedelta(seconds=OUTBOX_LEASE_SEGUNDOS)},
+            "$inc": {"intentos": 1},
+        },
+        sort=[("proximo_intento", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _registrar_fallo(doc: dict, error: Exception):
+    intentos = doc["intentos"]
+    if intentos >= OUTBOX_MAX_INTENTOS:
+        cambios = {"estado": ESTADO_FALLIDO, "error": str(error)}
+        CORREOS_DESCARTADOS.inc()
+        logger.error("❌ Correo a %s descartado tras %s intentos: %s", doc['destinatario'], intentos, error)
+    else:
+        espera = OUTBOX_BACKOFF_SEGUNDOS * 2 ** (intentos - 1) * random.uniform(0.8, 1.2)
+        cambios = {
+            "estado": ESTADO_PENDIENTE,
+            "proximo_intento": datetime.utcnow() + timedelta(seconds=espera),
+            "error": str(error),
+        }
+        CORREOS_REINTENTOS.inc()
+        logger.warning("⚠️ Error enviando correo a %s (intento %s), reintento en %.0fs: %s", doc['destinatario'], intentos, espera, error)
+    await collection_outbox.update_one({"_id": doc["_id"]}, {"$set": cambios, "$unset": {"lease_hasta": ""}})
+
+
+async def _procesar_outbox():
+    conexion = _ConexionSMTP()
+    intervalo_minimo = 60 / OUTBOX_MAX_POR_MINUTO if OUTBOX_MAX_POR_MINUTO > 0 else 0
+    ultimo_envio = 0.0
+
+    try:
+        while True:
+            _despertar.clear()
+            try:
+                doc = await _reclamar_siguiente()
+            except Exception as e:
+                logger.error("❌ Error leyendo la outbox: %s", e)
+                doc = None
+
+            if doc is None:
+                await asyncio.to_thread(conexion.cerrar_si_inactiva)
+                try:
+                    await asyncio.wait_for(_despertar.wait(), timeout=OUTBOX_INTERVALO_SONDEO)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Límite de envíos por minuto
+            espera = ultimo_envio + intervalo_minimo - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(espera)
+
+            try:
+                await asyncio.to_thread(conexion.enviar, doc["destinatario"], doc["asunto"], doc["mensaje"])
+            except Exception as e:
+                await asyncio.to_thread(conexion.cerrar)
+                await _registrar_fallo(doc, e)
+            else:
+                await collection_outbox.update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {"estado": ESTADO_ENVIADO, "enviado_en": datetime.utcnow()}, "$unset": {"lease_hasta": ""}}
+                )
+                CORREOS_ENVIADOS.inc()
+                logger.info("📧 Correo enviado a %s", doc['destinatario'])
+            finally:
+                ultimo_envio = time.monotonic()
+    finally:
+        await asyncio.to_thread(conexion.cerrar)
+
+
+def iniciar_worker_outbox():
+    global _tarea_worker
+    if OUTBOX_WORKER_ENABLED and _tarea_worker is None:
+        _tarea_worker = asyncio.create_task(_procesar_outbox())
+
+
+async def detener_worker_outbox():
+    global _tarea_worker
+    if _tarea_worker is None:
+        return
+    _tarea_worker.cancel()
+    try:
+        await _tarea_worker
+    except asyncio.CancelledError:
+        pass
+    _tarea_worker = None
@@ -0,0 +1,174 @@
+"""Perfilado bajo demanda de peticiones individuales (pyinstrument).
+
+Un Admin pide un token firmado (POST /auth/perfilado/token, válido
+PERFILADO_TOKEN_MINUTOS y opcionalmente limitado a un prefijo de ruta) y lo
+envía en la petición que quiere perfilar:
+
+    GET /orders/get-all-orders/?limit=100
+    X-Perfilar: <token>              (o ?perfilar=<token>)
+
+Solo esa petición se ejecuta bajo el profiler de muestreo de pyinstrument
+(modo async: el tiempo esperando a Mongo se atribuye al `await` que lo
+espera). El perfil se guarda en formato speedscope (https://speedscope.app) en
+PERFILADO_DIR, y la respuesta lleva su identificador en X-Perfil para
+descargarlo con GET /auth/perfilado/{perfil_id}.
+
+Las peticiones sin token solo pagan la búsqueda de la cabecera / parámetro.
+pyinstrument está en requirements.txt; si falta en un entorno, los tokens se
+ignoran y POST /auth/perfilado/token responde 501.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+
+import jwt
+
+from app.core.security import ALGORITHM, SECRET_KEY, create_access_token
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pragma: no cover - dependencia opcional
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PERFILADO_DIR = os.getenv("PERFILADO_DIR", "/tmp/perfiles")
+PERFILADO_TOKEN_MINUTOS = int(os.getenv("PERFILADO_TOKEN_MINUTOS", 10))
+# Segundos entre muestras; 1 ms da detalle suficiente sin inflar la petición
+PERFILADO_INTERVALO = float(os.getenv("PERFILADO_INTERVALO", 0.001))
+PERFILADO_MAX_ARCHIVOS = int(os.getenv("PERFILADO_MAX_ARCHIVOS", 50))
+
+CABECERA_PERFILAR = b"x-perfilar"
+PARAMETRO_PERFILAR = b"perfilar="
+CABECERA_PERFIL = "X-Perfil"
+USO_TOKEN = "perfilado"
+EXTENSION = ".speedscope.json"
+
+_perfilando = False
+
+
+def perfilado_disponible() -> bool:
+    return Profiler is not None
+
+
+def crear_token_perfilado(email: str, ruta: str | None = None) -> str:
+    """Token firmado para perfilar peticiones; sin `rol`, así que no sirve como token de acceso"""
+    datos = {"sub": email, "uso": USO_TOKEN}
+    if ruta:
+        datos["ruta"] = ruta
+    return create_access_token(datos, timedelta(minutes=PERFILADO_TOKEN_MINUTOS))
+
+
+def _token_solicitado(scope) -> str | None:
+    for nombre, valor in scope.get("headers") or []:
+        if nombre == CABECERA_PERFILAR:
+            return valor.decode("latin-1")
+    consulta = scope.get("query_string", b"")
+    if PARAMETRO_PERFILAR in consulta:
+        for parte in consulta.split(b"&"):
+            if parte.startswith(PARAMETRO_PERFILAR):
+                return parte[len(PARAMETRO_PERFILAR):].decode("latin-1")
+    return None
+
+
+def _token_valido(token: str, ruta: str) -> dict | None:
+    try:
+        datos = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    if datos.get("uso") != USO_TOKEN or not ruta.startswith(datos.get("ruta", "")):
+        return None
+    return datos
+
+
+def ruta_perfil(perfil_id: str) -> str | None:
+    """Archivo del perfil, o None si el id no es válido o ya no existe"""
+    try:
+        perfil_id = uuid.UUID(perfil_id).hex
+    except ValueError:
+        return None
+    ruta = os.path.join(PERFILADO_DIR, perfil_id + EXTENSION)
+    return ruta if os.path.exists(ruta) else None
+
+
+def listar_perfiles() -> list:
+    if not os.path.isdir(PERFILADO_DIR):
+        return []
+    archivos = [a for a in os.scandir(PERFILADO_DIR) if a.name.endswith(EXTENSION)]
+    archivos.sort(key=lambda a: a.stat().st_mtime, reverse=True)
+    return [
+        {
+            "id": a.name[:-len(EXTENSION)],
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(a.stat().st_mtime)),
+            "bytes": a.stat().st_size,
+        }
+        for a in archivos
+    ]
+
+
+def _guardar_perfil(perfil_id: str, profiler):
+    contenido = profiler.output(SpeedscopeRenderer())
+    os.makedirs(PERFILADO_DIR, exist_ok=True)
+    with open(os.path.join(PERFILADO_DIR, perfil_id + EXTENSION), "w", encoding="utf-8") as archivo:
+        archivo.write(contenido)
+    # Se conservan solo los más recientes
+    for antiguo in listar_perfiles()[PERFILADO_MAX_ARCHIVOS:]:
+        try:
+            os.remove(os.path.join(PERFILADO_DIR, antiguo["id"] + EXTENSION))
+        except OSError:
+            pass
+
+
+class PerfiladoMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = _token_solicitado(scope) if scope["type"] == "http" else None
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        global _perfilando
+        datos = _token_valido(token, scope["path"])
+        if datos is None or Profiler is None or _perfilando:
+            motivo = "token inválido" if datos is None else (
+                "pyinstrument no está instalado" if Profiler is None else "ya hay otro perfilado en curso"
+            )
+            logger.warning("⚠️ Perfilado ignorado en %s: %s", scope["path"], motivo)
+            await self.app(scope, receive, send)
+            return
+
+        perfil_id = uuid.uuid4().hex
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                cabeceras = list(mensaje.get("headers", []))
+                cabeceras.append((CABECERA_PERFIL.lower().encode(), perfil_id.encode()))
+                mensaje = {**mensaje, "headers": cabeceras}
+            await send(mensaje)
+
+        # Un perfilado a la vez por worker: acota el sobrecoste si llegan varios tokens
+        _perfilando = True
+        profiler = Profiler(interval=PERFILADO_INTERVALO, async_mode="enabled")
+        try:
+            profiler.start()
+            await self.app(scope, receive, enviar)
+        finally:
+            if profiler.is_running:
+                profiler.stop()
+            _perfilando = False
+            # Renderizar y escribir fuera del event loop; la respuesta ya se envió,
+            # así que un error aquí solo se registra
+            try:
+                await asyncio.to_thread(_guardar_perfil, perfil_id, profiler)
+                logger.info(
+                    "🔬 Perfil %s de %s %s (solicitado por %s)",
+                    perfil_id, scope["method"], scope["path"], datos.get("sub")
+                )
+            except Exception as e:
+                logger.error("❌ No se pudo guardar el perfil %s de %s: %s", perfil_id, scope["path"], e)
@@ -0,0 +1,71 @@
+"""Serialización JSON de las respuestas.
+
+`RespuestaJSON` es la clase de respuesta por defecto de la app: usa orjson y
+codifica directamente los tipos que devuelve Mongo (ObjectId, datetime,
+Decimal/Decimal128), así que los handlers ya no convierten documento a
+documento. Si orjson no está instalado se usa el módulo json estándar con el
+mismo `default`.
+
+Los endpoints con `response_model` se validan y serializan en el núcleo
+compilado de pydantic (sin pasar por `jsonable_encoder`); `ObjectIdStr`
+acepta un ObjectId y lo emite como string.
+"""
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Annotated, Any, Union
+
+from bson import Decimal128, ObjectId
+from fastapi.encoders import ENCODERS_BY_TYPE
+from fastapi.responses import JSONResponse
+from pydantic import BeforeValidator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+
+def _por_defecto(valor: Any):
+    """Tipos que ni orjson ni json saben codificar por sí mismos"""
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, Decimal128):
+        valor = valor.to_decimal()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date, time)):
+        # Solo llega aquí con el módulo json; orjson los codifica de forma nativa
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+
+def a_json(contenido: Any) -> bytes:
+    if orjson is not None:
+        # OPT_NON_STR_KEYS: algunos agregados usan claves numéricas
+        return orjson.dumps(contenido, default=_por_defecto, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        contenido, default=_por_defecto, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class RespuestaJSON(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return a_json(content)
+
+
+def _a_str(valor: Any):
+    return str(valor) if isinstance(valor, ObjectId) else valor
+
+
+# Campo de un modelo de respuesta que en Mongo puede ser ObjectId o string
+ObjectIdStr = Annotated[str, BeforeValidator(_a_str)]
+
+# Cantidades y precios se guardan como int o float según el origen del documento;
+# la unión conserva el tipo original al serializar
+Numero = Union[int, float]
+
+# Los endpoints sin response_model siguen pasando por jsonable_encoder:
+# así tampoco necesitan convertir los ObjectId a mano
+ENCODERS_BY_TYPE[ObjectId] = str
+ENCODERS_BY_TYPE[Decimal128] = lambda valor: float(valor.to_decimal())
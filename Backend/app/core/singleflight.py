@@ -0,0 +1,96 @@
+"""Single-flight: peticiones idénticas concurrentes comparten una sola ejecución.
+
+La primera petición para una clave (líder) lanza el cálculo; las que llegan
+mientras sigue en vuelo esperan ese mismo resultado (o excepción) en lugar de
+repetir la consulta. No es una caché: en cuanto el líder termina, la siguiente
+petición vuelve a calcular.
+
+    @router.get("/estadisticas")
+    @single_flight("estadisticas", lambda principal, **_: alcance_visibilidad(principal))
+    async def estadisticas(principal: Principal = Depends(get_principal)):
+        ...
+"""
+import asyncio
+import functools
+import time
+from collections import deque
+
+_grupos = {}
+
+
+def _percentil(muestras, p: float) -> float:
+    if not muestras:
+        return 0.0
+    ordenadas = sorted(muestras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+class SingleFlight:
+    def __init__(self, nombre: str, muestras: int = 512):
+        self.nombre = nombre
+        self._en_vuelo = {}
+        self.lideres = 0
+        self.compartidas = 0
+        self.esperando = 0
+        self.max_esperando = 0
+        self.latencia_lider = deque(maxlen=muestras)
+
+    def _terminar(self, clave, inicio: float, tarea: asyncio.Task):
+        self._en_vuelo.pop(clave, None)
+        self.latencia_lider.append(time.perf_counter() - inicio)
+
+    async def ejecutar(self, clave, fabrica):
+        """Ejecuta `fabrica()` una sola vez por clave entre las llamadas concurrentes"""
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            self.lideres += 1
+            # La tarea es independiente de la petición líder: si ese cliente se
+            # desconecta, los demás siguen recibiendo el resultado
+            tarea = asyncio.ensure_future(fabrica())
+            tarea.add_done_callback(functools.partial(self._terminar, clave, time.perf_counter()))
+            self._en_vuelo[clave] = tarea
+        else:
+            self.compartidas += 1
+
+        self.esperando += 1
+        self.max_esperando = max(self.max_esperando, self.esperando)
+        try:
+            return await asyncio.shield(tarea)
+        finally:
+            self.esperando -= 1
+
+    def resumen(self) -> dict:
+        return {
+            "lideres": self.lideres,
+            "compartidas": self.compartidas,
+            "en_vuelo": len(self._en_vuelo),
+            "esperando": self.esperando,
+            "max_esperando": self.max_esperando,
+            "latencia_lider_ms": {
+                "p50": round(_percentil(self.latencia_lider, 0.50) * 1000, 1),
+                "p99": round(_percentil(self.latencia_lider, 0.99) * 1000, 1),
+            },
+        }
+
+
+def grupo(nombre: str) -> SingleFlight:
+    if nombre not in _grupos:
+        _grupos[nombre] = SingleFlight(nombre)
+    return _grupos[nombre]
+
+
+def single_flight(nombre: str, clave):
+    """Decorador para endpoints async; `clave(**kwargs)` define qué peticiones son idénticas"""
+    def decorador(funcion):
+        sf = grupo(nombre)
+
+        @functools.wraps(funcion)
+        async def envoltura(*args, **kwargs):
+            return await sf.ejecutar(clave(**kwargs), lambda: funcion(*args, **kwargs))
+
+        return envoltura
+    return decorador
+
+
+def metricas_singleflight() -> dict:
+    return {nombre: sf.resumen() for nombre, sf in _grupos.items()}
@@ -0,0 +1,198 @@
+"""Vigilante del event loop: retraso continuo y pila de quien lo bloquea.
+
+Cada worker de uvicorn tiene un solo event loop; cualquier trabajo síncrono
+dentro de un handler (SMTP, bcrypt, bucles grandes en Python) congela todas
+las peticiones de ese worker.
+
+- Un latido (tarea asyncio) duerme LOOP_INTERVALO_MS y mide cuánto tarde se
+  despierta: ese retraso es el lag del loop (histograma en /metrics).
+- Un hilo vigilante revisa el último latido; si lleva más de LOOP_UMBRAL_MS
+  de retraso, el loop está bloqueado y captura la pila del hilo del loop
+  (`sys._current_frames`), que es la del código que lo retiene.
+- Cuando el loop vuelve a latir, el bloqueo se atribuye a la línea de la app
+  más profunda de esa pila con su duración total.
+
+Los peores bloqueos (por duración máxima) se consultan en
+GET /auth/metricas/event-loop (solo Admin).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from app.core.metricas import EVENT_LOOP_BLOQUEOS, EVENT_LOOP_LAG_SEGUNDOS
+
+logger = logging.getLogger(__name__)
+
+LOOP_VIGILANTE_ENABLED = os.getenv("LOOP_VIGILANTE_ENABLED", "true").lower() == "true"
+LOOP_INTERVALO_MS = float(os.getenv("LOOP_INTERVALO_MS", 100))
+LOOP_UMBRAL_MS = float(os.getenv("LOOP_UMBRAL_MS", 200))
+# Marcos de pila que se guardan por bloqueo y ubicaciones distintas que se recuerdan
+LOOP_PILA_MAX = int(os.getenv("LOOP_PILA_MAX", 30))
+LOOP_UBICACIONES_MAX = int(os.getenv("LOOP_UBICACIONES_MAX", 200))
+
+_DIRECTORIO_APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentil(muestras, p: float) -> float:
+    if not muestras:
+        return 0.0
+    ordenadas = sorted(muestras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+def _ubicacion(pila: traceback.StackSummary) -> str:
+    """Marco más profundo que pertenece a la app (o el más profundo, si no hay ninguno)"""
+    for marco in reversed(pila):
+        if marco.filename.startswith(_DIRECTORIO_APP) and marco.filename != __file__:
+            return f"{os.path.relpath(marco.filename, os.path.dirname(_DIRECTORIO_APP))}:{marco.lineno} en {marco.name}"
+    if pila:
+        marco = pila[-1]
+        return f"{marco.filename}:{marco.lineno} en {marco.name}"
+    return "desconocida"
+
+
+class VigilanteLoop:
+    def __init__(self, intervalo: float, umbral: float, muestras: int = 1024):
+        self.intervalo = intervalo
+        self.umbral = umbral
+        self.lag = deque(maxlen=muestras)
+        self.lag_max = 0.0
+        self.bloqueos = 0
+        self.ubicaciones = {}
+        self._lock = threading.Lock()
+        self._latido = time.monotonic()
+        self._captura = None
+        self._hilo_loop = None
+        self._tarea = None
+        self._hilo = None
+        self._parar = threading.Event()
+
+    # --- Lado del event loop ---
+
+    async def _latir(self):
+        while True:
+            esperado = time.monotonic() + self.intervalo
+            await asyncio.sleep(self.intervalo)
+            ahora = time.monotonic()
+            retraso = max(0.0, ahora - esperado)
+            EVENT_LOOP_LAG_SEGUNDOS.observe(retraso)
+            with self._lock:
+                self._latido = ahora
+                self.lag.append(retraso)
+                self.lag_max = max(self.lag_max, retraso)
+                captura, self._captura = self._captura, None
+            if captura is not None:
+                self._registrar_bloqueo(retraso, *captura)
+
+    def _registrar_bloqueo(self, retraso: float, ubicacion: str, pila: list):
+        EVENT_LOOP_BLOQUEOS.inc()
+        with self._lock:
+            self.bloqueos += 1
+            datos = self.ubicaciones.get(ubicacion)
+            if datos is None:
+                if len(self.ubicaciones) >= LOOP_UBICACIONES_MAX:
+                    # Se olvida la ubicación menos grave para dejar sitio
+                    menor = min(self.ubicaciones, key=lambda u: self.ubicaciones[u]["max_s"])
+                    del self.ubicaciones[menor]
+                datos = self.ubicaciones[ubicacion] = {"veces": 0, "max_s": 0.0, "total_s": 0.0, "pila": pila}
+            datos["veces"] += 1
+            datos["total_s"] += retraso
+            if retraso >= datos["max_s"]:
+                datos["max_s"] = retraso
+                datos["pila"] = pila
+        logger.warning("⚠️ Event loop bloqueado %.0f ms en %s", retraso * 1000, ubicacion)
+
+    # --- Lado del hilo vigilante ---
+
+    def _vigilar(self):
+        # Se revisa varias veces por umbral para capturar la pila mientras el bloqueo sigue activo
+        pausa = min(self.intervalo, self.umbral) / 4
+        capturado_en = None
+        while not self._parar.wait(pausa):
+            with self._lock:
+                latido = self._latido
+            if time.monotonic() - latido < self.intervalo + self.umbral or capturado_en == latido:
+                continue
+            marco = sys._current_frames().get(self._hilo_loop)
+            if marco is None:
+                continue
+            pila = traceback.extract_stack(marco, limit=LOOP_PILA_MAX)
+            captura = (_ubicacion(pila), [linea.rstrip() for linea in pila.format()])
+            with self._lock:
+                # Si el loop latió mientras se capturaba, la pila ya no es la del bloqueo
+                if self._latido == latido:
+                    self._captura = captura
+                    capturado_en = latido
+
+    # --- Ciclo de vida ---
+
+    def iniciar(self):
+        self._hilo_loop = threading.get_ident()
+        self._latido = time.monotonic()
+        self._parar.clear()
+        self._tarea = asyncio.create_task(self._latir())
+        self._hilo = threading.Thread(target=self._vigilar, name="vigilante-loop", daemon=True)
+        self._hilo.start()
+
+    async def detener(self):
+        self._parar.set()
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._hilo.join(timeout=1)
+
+    def resumen(self, peores: int = 10) -> dict:
+        with self._lock:
+            lag = list(self.lag)
+            ordenadas = sorted(self.ubicaciones.items(), key=lambda par: par[1]["max_s"], reverse=True)[:peores]
+            return {
+                "intervalo_ms": round(self.intervalo * 1000),
+                "umbral_ms": round(self.umbral * 1000),
+                "lag_ms": {
+                    "p50": round(_percentil(lag, 0.50) * 1000, 1),
+                    "p99": round(_percentil(lag, 0.99) * 1000, 1),
+                    "max": round(self.lag_max * 1000, 1),
+                },
+                "bloqueos": self.bloqueos,
+                "peores": [
+                    {
+                        "ubicacion": ubicacion,
+                        "veces": datos["veces"],
+                        "max_ms": round(datos["max_s"] * 1000, 1),
+                        "total_ms": round(datos["total_s"] * 1000, 1),
+                        "pila": datos["pila"],
+                    }
+                    for ubicacion, datos in ordenadas
+                ],
+            }
+
+
+_vigilante: VigilanteLoop | None = None
+
+
+def iniciar_vigilante_loop():
+    global _vigilante
+    if LOOP_VIGILANTE_ENABLED and _vigilante is None:
+        _vigilante = VigilanteLoop(LOOP_INTERVALO_MS / 1000, LOOP_UMBRAL_MS / 1000)
+        _vigilante.iniciar()
+
+
+async def detener_vigilante_loop():
+    global _vigilante
+    if _vigilante is None:
+        return
+    await _vigilante.detener()
+    _vigilante = None
+
+
+def metricas_event_loop() -> dict:
+    if _vigilante is None:
+        return {"activo": False}
+    return {"activo": True, **_vigilante.resumen()}
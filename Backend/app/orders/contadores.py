@@ -0,0 +1,172 @@
+"""Contadores de órdenes y pedidos por (colección, CDI, estado).
+
+Cada transición de estado aplica un $inc (-1 al estado anterior, +1 al nuevo)
+en la colección `contadores_estado`, dentro de la misma transacción cuando la
+hay. Así los badges de pendientes se leen con un find por _id en vez de un
+count_documents sobre todas las órdenes.
+
+Un worker reconcilia periódicamente los contadores con un conteo real para
+corregir cualquier desvío (escrituras fuera de la app, fallos a mitad de camino).
+La corrección es un $inc con la diferencia, condicionado a que el contador
+siga valiendo lo que se leyó antes del conteo: si una transición cae en medio,
+ese contador se deja para la siguiente pasada en vez de pisarla. Por eso varios
+workers pueden reconciliar a la vez sin estropear los totales.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.database import collection_contadores, collection_ordenes, collection_pedidos
+from app.orders.controllers import TIPOS_PRECIO_POR_CDI, cdi_de_tipo_precio
+
+logger = logging.getLogger(__name__)
+
+CONTADORES_RECONCILIAR_SEGUNDOS = float(os.getenv("CONTADORES_RECONCILIAR_SEGUNDOS", 3600))
+
+ESTADO_ORDEN_CREADA = "Orden de compra creada"
+SIN_CDI = "sin_cdi"
+
+COLECCIONES_CONTADAS = {
+    "purchase_orders": collection_ordenes,
+    "pedidos": collection_pedidos,
+}
+
+_tarea_reconciliacion: asyncio.Task | None = None
+
+
+def id_contador(coleccion: str, cdi: str, estado: str) -> str:
+    return f"{coleccion}:{cdi or SIN_CDI}:{estado}"
+
+
+def operaciones_transicion(coleccion: str, tipo_precio: str, anterior: str = None, nuevo: str = None) -> list:
+    cdi = cdi_de_tipo_precio(tipo_precio) or SIN_CDI
+    operaciones = []
+    for estado, delta in ((anterior, -1), (nuevo, 1)):
+        if estado is None:
+            continue
+        operaciones.append(UpdateOne(
+            {"_id": id_contador(coleccion, cdi, estado)},
+            {
+                "$inc": {"total": delta},
+                "$setOnInsert": {"coleccion": coleccion, "cdi": cdi, "estado": estado},
+            },
+            upsert=True
+        ))
+    return operaciones
+
+
+async def registrar_transicion(coleccion: str, tipo_precio: str, anterior: str = None, nuevo: str = None, session=None):
+    """Mueve una orden/pedido de `anterior` a `nuevo` (None = creado / eliminado)"""
+    if anterior == nuevo:
+        return
+    operaciones = operaciones_transicion(coleccion, tipo_precio, anterior, nuevo)
+    if operaciones:
+        await collection_contadores.bulk_write(operaciones, ordered=False, session=session)
+
+
+async def leer_contadores(coleccion: str, estado: str, cdis: list) -> dict:
+    """{cdi: total} para un estado; los contadores que no existen valen 0"""
+    ids = {id_contador(coleccion, cdi, estado): cdi for cdi in cdis}
+    totales = {cdi: 0 for cdi in cdis}
+    async for doc in collection_contadores.find({"_id": {"$in": list(ids)}}, {"total": 1}):
+        totales[ids[doc["_id"]]] = max(0, doc.get("total", 0))
+    return totales
+
+
+def _corregir(clave: str, leido: int, real: int) -> UpdateOne:
+    """Suma la diferencia solo si el contador sigue valiendo lo leído"""
+    return UpdateOne(
+        {"_id": clave, "total": leido},
+        {"$inc": {"total": real - leido}, "$set": {"reconciliado_en": datetime.utcnow()}}
+    )
+
+
+async def reconciliar_contadores():
+    """Recalcula todos los contadores con un conteo real y corrige los que difieran"""
+    tipos_a_cdi = {tipo: cdi for cdi, tipos in TIPOS_PRECIO_POR_CDI.items() for tipo in tipos}
+    corregidos = 0
+
+    for nombre, coleccion in COLECCIONES_CONTADAS.items():
+        # Los contadores se leen antes del conteo: cualquier transición posterior
+        # cambia su total y hace fallar la condición de la corrección
+        actuales = {
+            doc["_id"]: doc.get("total", 0)
+            async for doc in collection_contadores.find({"coleccion": nombre}, {"total": 1})
+        }
+
+        reales = {}  # _id del contador -> (cdi, estado, total)
+        async for grupo in coleccion.aggregate([
+            {"$group": {"_id": {"tipo_precio": "$tipo_precio", "estado": "$estado"}, "total": {"$sum": 1}}}
+        ]):
+            cdi = tipos_a_cdi.get(grupo["_id"].get("tipo_precio"), SIN_CDI)
+            estado = grupo["_id"].get("estado")
+            if estado is None:
+                continue
+            clave = id_contador(nombre, cdi, estado)
+            # Varios tipos de precio pueden caer en el mismo CDI
+            total = grupo["total"] + (reales[clave][2] if clave in reales else 0)
+            reales[clave] = (cdi, estado, total)
+
+        operaciones = []
+        for clave, (cdi, estado, total) in reales.items():
+            leido = actuales.get(clave)
+            if leido == total:
+                continue
+            if leido is None:
+                # Contador inexistente: si otro lo crea entretanto, el insert choca con su _id
+                operaciones.append(UpdateOne(
+                    {"_id": clave, "total": {"$exists": False}},
+                    {"$set": {"coleccion": nombre, "cdi": cdi, "estado": estado, "total": total,
+                              "reconciliado_en": datetime.utcnow()}},
+                    upsert=True
+                ))
+            else:
+                operaciones.append(_corregir(clave, leido, total))
+        # Estados que ya no tienen documentos quedan en cero
+        operaciones += [
+            _corregir(clave, leido, 0)
+            for clave, leido in actuales.items()
+            if clave not in reales and leido != 0
+        ]
+        if operaciones:
+            try:
+                resultado = await collection_contadores.bulk_write(operaciones, ordered=False)
+                corregidos += resultado.modified_count + resultado.upserted_count
+            except BulkWriteError as e:
+                # Contadores creados por una transición durante el conteo
+                corregidos += e.details.get("nModified", 0) + e.details.get("nUpserted", 0)
+
+    logger.info("🧮 Contadores reconciliados (%s corregidos)", corregidos)
+    return corregidos
+
+
+async def _procesar_reconciliacion():
+    while True:
+        try:
+            await reconciliar_contadores()
+        except Exception as e:
+            logger.warning("⚠️ Error reconciliando contadores: %s", e)
+        await asyncio.sleep(CONTADORES_RECONCILIAR_SEGUNDOS)
+
+
+def iniciar_reconciliacion_contadores():
+    # La primera pasada al arrancar también sirve de backfill inicial
+    global _tarea_reconciliacion
+    if CONTADORES_RECONCILIAR_SEGUNDOS > 0 and _tarea_reconciliacion is None:
+        _tarea_reconciliacion = asyncio.create_task(_procesar_reconciliacion())
+
+
+async def detener_reconciliacion_contadores():
+    global _tarea_reconciliacion
+    if _tarea_reconciliacion is None:
+        return
+    _tarea_reconciliacion.cancel()
+    try:
+        await _tarea_reconciliacion
+    except asyncio.CancelledError:
+        pass
+    _tarea_reconciliacion = None
@@ -0,0 +1,162 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+LIMITE_PAGINA_DEFECTO = 50
+LIMITE_PAGINA_MAXIMO = 200
+
+# Campos de los listados paginados (?fields=); por defecto, sin las líneas del pedido
+CAMPOS_LISTADO_PEDIDOS = (
+    "id", "fecha", "estado", "tipo_precio", "distribuidor_id", "distribuidor_nombre",
+    "distribuidor_telefono", "distribuidor_email", "total", "total_iva", "productos"
+)
+RESUMEN_LISTADO_PEDIDOS = tuple(c for c in CAMPOS_LISTADO_PEDIDOS if c != "productos")
+CAMPOS_DISTRIBUIDOR = {"distribuidor_nombre", "distribuidor_telefono", "distribuidor_email"}
+
+# Campos de /mis-ordenes (documentos de pedido tal cual están guardados)
+CAMPOS_MIS_ORDENES = (
+    "id", "fecha", "estado", "tipo_precio", "subtotal", "iva", "total", "direccion", "notas",
+    "distribuidor_nombre", "distribuidor_phone", "bodega_procesadora", "fecha_procesado",
+    "notas_procesamiento", "notas_orden_original", "productos"
+)
+RESUMEN_MIS_ORDENES = ("id", "fecha", "estado", "tipo_precio", "subtotal", "iva", "total", "direccion")
+
+# Cada CDI atiende los pedidos de ciertos tipos de precio
+TIPOS_PRECIO_POR_CDI = {
+    "medellin": ["sin_iva", "con_iva"],
+    "guarne": ["sin_iva_internacional"],
+}
+
+
+def filtro_tipo_precio_cdi(cdi: str):
+    """Filtro de pedidos que ve una bodega según su CDI, o None si el CDI no es válido"""
+    tipos = TIPOS_PRECIO_POR_CDI.get(cdi)
+    if tipos is None:
+        return None
+    return {"tipo_precio": tipos[0] if len(tipos) == 1 else {"$in": tipos}}
+
+
+def cdi_de_tipo_precio(tipo_precio: str):
+    for cdi, tipos in TIPOS_PRECIO_POR_CDI.items():
+        if tipo_precio in tipos:
+            return cdi
+    return None
+
+
+def codificar_cursor(fecha: datetime, _id: ObjectId) -> str:
+    """Cursor opaco con la posición (fecha, _id) del último pedido de la página"""
+    valor = json.dumps({"f": fecha.isoformat() if fecha else None, "i": str(_id)})
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+
+def decodificar_cursor(cursor: str) -> tuple:
+    try:
+        valor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        fecha = datetime.fromisoformat(valor["f"]) if valor["f"] else None
+        return fecha, ObjectId(valor["i"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+
+def filtro_despues_de_cursor(cursor: str) -> dict:
+    """Condición para continuar después del cursor en orden (fecha desc, _id desc)"""
+    fecha, _id = decodificar_cursor(cursor)
+    if fecha is None:
+        return {"fecha": None, "_id": {"$lt": _id}}
+    return {"$or": [
+        {"fecha": {"$lt": fecha}},
+        {"fecha": fecha, "_id": {"$lt": _id}},
+        {"fecha": None}
+    ]}
+
+
+def pipeline_listado_pedidos(filtro: dict, limite: int, cursor: str = None, precios_sin_iva: bool = False,
+                             campos: tuple = CAMPOS_LISTADO_PEDIDOS) -> list:
+    """Pipeline para listar pedidos u órdenes paginados por (fecha, _id).
+
+    Filtra, ordena, une la información del distribuidor y calcula los totales
+    en el servidor. Pide `limite + 1` documentos para saber si hay otra página.
+    Con `precios_sin_iva` cada línea muestra su precio sin IVA y sin IVA unitario
+    (vista de la bodega Guarne). Solo se proyectan los `campos` pedidos (más
+    `_id` y `fecha`, que forman el cursor); el $lookup del distribuidor se omite
+    si no se pide ninguno de sus datos.
+    """
+    match = dict(filtro)
+    if cursor:
+        match = {"$and": [match, filtro_despues_de_cursor(cursor)]}
+
+    productos = {"$ifNull": ["$productos", []]}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"fecha": -1, "_id": -1}},
+        {"$limit": limite + 1},
+    ]
+
+    if CAMPOS_DISTRIBUIDOR.intersection(campos):
+        pipeline += [
+            {"$set": {"_distribuidor_oid": {
+                "$convert": {"input": "$distribuidor_id", "to": "objectId", "onError": None, "onNull": None}
+            }}},
+            {"$lookup": {
+                "from": "distribuidores",
+                "localField": "_distribuidor_oid",
+                "foreignField": "_id",
+                "as": "_distribuidor"
+            }},
+            {"$set": {"_distribuidor": {"$arrayElemAt": ["$_distribuidor", 0]}}},
+        ]
+
+    # Los totales de Guarne también se calculan con el precio sin IVA
+    if precios_sin_iva and {"productos", "total", "total_iva"}.intersection(campos):
+        pipeline.append({"$set": {"productos": {"$map": {
+            "input": productos,
+            "as": "p",
+            "in": {"$mergeObjects": [
+                "$$p",
+                {"precio": {"$ifNull": ["$$p.precio_sin_iva", "$$p.precio"]}, "iva_unitario": 0}
+            ]}
+        }}}})
+
+    expresiones = {
+        "id": {"$ifNull": ["$id", {"$toString": "$_id"}]},
+        "fecha": 1,
+        "productos": productos,
+        "estado": {"$ifNull": ["$estado", "pendiente"]},
+        "tipo_precio": 1,
+        "distribuidor_nombre": {"$ifNull": ["$_distribuidor.nombre", "Desconocido"]},
+        "distribuidor_telefono": {"$ifNull": ["$_distribuidor.telefono", ""]},
+        "distribuidor_email": {"$ifNull": ["$_distribuidor.correo_electronico", ""]},
+        "distribuidor_id": 1,
+        "total": {"$sum": {"$map": {
+            "input": productos,
+            "as": "p",
+            "in": {"$multiply": ["$$p.precio", "$$p.cantidad"]}
+        }}},
+        "total_iva": {"$sum": {"$map": {
+            "input": productos,
+            "as": "p",
+            "in": {"$multiply": [{"$ifNull": ["$$p.iva_unitario", 0]}, "$$p.cantidad"]}
+        }}}
+    }
+    pipeline.append({"$project": {"_id": 1, "fecha": 1, **{campo: expresiones[campo] for campo in campos}}})
+    return pipeline
+
+
+async def listar_pedidos_paginados(coleccion, filtro: dict, limite: int, cursor: str = None, precios_sin_iva: bool = False,
+                                   campos: tuple = RESUMEN_LISTADO_PEDIDOS) -> dict:
+    """Ejecuta el pipeline de listado y devuelve la página con su `next_cursor`"""
+    pipeline = pipeline_listado_pedidos(filtro, limite, cursor, precios_sin_iva, campos)
+    pedidos = await coleccion.aggregate(pipeline).to_list(None)
+
+    next_cursor = None
+    if len(pedidos) > limite:
+        pedidos = pedidos[:limite]
+        ultimo = pedidos[-1]
+        next_cursor = codificar_cursor(ultimo.get("fecha"), ultimo["_id"])
+
+    # _id y fecha se serializan con el modelo de respuesta (PaginaPedidos)
+    return {"pedidos": pedidos, "next_cursor": next_cursor}
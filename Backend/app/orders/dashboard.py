@@ -0,0 +1,132 @@
+"""Consultas del dashboard (estadísticas, pedidos recientes, productos populares).
+
+Cada bloque es una corrutina independiente para que los endpoints sueltos y
+el snapshot compartan la misma lógica; el snapshot las lanza en paralelo y
+cachea el resultado por alcance (rol + CDI) durante unos segundos.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from app.auth.controllers import filtro_cdi_bodega
+from app.auth.models import Principal
+from app.core.cache import TTLCache
+from app.core.singleflight import grupo
+from app.core.database import collection_distribuidores, collection_pedidos, collection_productos
+from app.orders.ventas import productos_mas_vendidos, ventas_del_mes
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", 10))
+
+_snapshots = TTLCache(maxsize=64, ttl=DASHBOARD_CACHE_TTL, nombre="dashboard_snapshots")
+
+
+def filtro_dashboard(principal: Principal) -> dict:
+    """Solo la bodega ve los datos filtrados por su CDI"""
+    if principal.rol == "bodega":
+        return filtro_cdi_bodega(principal)
+    return {}
+
+
+async def _contar_productos_activos() -> int:
+    try:
+        return await collection_productos.count_documents({
+            "activo": True,
+            "eliminado": {"$ne": True}
+        })
+    except Exception as e:
+        logger.error("❌ Error al contar productos: %s", str(e))
+        return 0
+
+
+async def estadisticas_generales(filtro: dict, cdi: str = None) -> dict:
+    total_pedidos, total_productos, total_distribuidores, total_ventas = await asyncio.gather(
+        collection_pedidos.count_documents(filtro),
+        _contar_productos_activos(),
+        collection_distribuidores.count_documents({}),
+        ventas_del_mes(filtro)
+    )
+    return {
+        "pedidos_totales": total_pedidos,
+        "total_productos": total_productos,
+        "total_distribuidores": total_distribuidores,
+        "ventas_mensuales": total_ventas,
+        "cdi": cdi,
+        "fecha_consulta": datetime.now().isoformat()
+    }
+
+
+async def pedidos_recientes(filtro: dict, limite: int = 5) -> list:
+    pedidos = await collection_pedidos.find(filtro) \
+        .sort("fecha", -1) \
+        .limit(limite) \
+        .to_list(length=None)
+
+    for pedido in pedidos:
+        pedido["id"] = str(pedido["_id"])
+        pedido["total"] = sum(p["cantidad"] * p["precio"] for p in pedido["productos"])
+        del pedido["_id"]
+    return pedidos
+
+
+async def productos_populares(filtro: dict, solo_en_produccion: bool = False, limite: int = 5) -> list:
+    # Más vendidos del mes desde el rollup de ventas diarias
+    productos = await productos_mas_vendidos(filtro, limite=limite)
+
+    # Datos actuales de esos productos (stock, imagen...)
+    info_productos = {
+        p["id"]: p
+        async for p in collection_productos.find(
+            {"id": {"$in": [p["id"] for p in productos]}},
+            {"_id": 0, "id": 1, "stock": 1, "activo": 1, "imagen": 1, "en_produccion": 1}
+        )
+    }
+    productos = [
+        {**p, **{k: v for k, v in info_productos[p["id"]].items() if k != "id"}}
+        for p in productos
+        if p["id"] in info_productos
+    ]
+
+    if solo_en_produccion:
+        productos = [p for p in productos if p.get("en_produccion", False)]
+    return productos
+
+
+async def snapshot_dashboard(principal: Principal) -> dict:
+    """Los tres bloques del dashboard en paralelo, cacheados por alcance"""
+    rol = principal.rol
+    alcance = (rol, principal.cdi if rol == "bodega" else None)
+    snapshot = _snapshots.get(alcance)
+    if snapshot is not None:
+        return snapshot
+
+    # Si el snapshot expiró y llegan varias peticiones a la vez, solo una lo recalcula
+    return await grupo("dashboard_snapshot").ejecutar(alcance, lambda: _calcular_snapshot(principal, alcance))
+
+
+async def _calcular_snapshot(principal: Principal, alcance: tuple) -> dict:
+    rol = principal.rol
+    filtro = filtro_dashboard(principal)
+    # Facturación no tiene acceso a productos populares
+    populares = (
+        productos_populares(filtro, solo_en_produccion=rol == "produccion")
+        if rol != "facturacion"
+        else asyncio.sleep(0, result=None)
+    )
+    estadisticas, recientes, populares = await asyncio.gather(
+        estadisticas_generales(filtro, alcance[1]),
+        pedidos_recientes(filtro),
+        populares
+    )
+
+    snapshot = {
+        "estadisticas": estadisticas,
+        "pedidos_recientes": recientes,
+        "productos_populares": populares,
+        "generado_en": datetime.now().isoformat(),
+        "ttl_segundos": DASHBOARD_CACHE_TTL
+    }
+    _snapshots.set(alcance, snapshot)
+    return snapshot
@@ -0,0 +1,61 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Union
+from datetime import datetime
+from app.core.respuestas import Numero, ObjectIdStr
+
+
+# MODELOS DE RESPUESTA PARA PEDIDOS Y ÓRDENES
+class LineaPedido(BaseModel):
+    # Las líneas cambian según el flujo (orden, pedido procesado, vista Guarne)
+    model_config = ConfigDict(extra="allow")
+
+    id: Optional[str] = None
+    nombre: Optional[str] = None
+    cantidad: Numero = 0
+    precio: Numero = 0
+    iva_unitario: Optional[Numero] = None
+
+
+class PedidoListado(BaseModel):
+    """Fila de los listados paginados (ver pipeline_listado_pedidos), con los campos de ?fields="""
+    model_config = ConfigDict(populate_by_name=True)
+
+    mongo_id: ObjectIdStr = Field(alias="_id")
+    id: Optional[str] = None
+    fecha: Optional[Union[datetime, str]] = None  # Pedidos antiguos la guardan como texto
+    productos: Optional[List[LineaPedido]] = None
+    estado: Optional[str] = None
+    tipo_precio: Optional[str] = None
+    distribuidor_nombre: Optional[str] = None
+    distribuidor_telefono: Optional[str] = None
+    distribuidor_email: Optional[str] = None
+    distribuidor_id: Optional[ObjectIdStr] = None
+    total: Optional[Numero] = None
+    total_iva: Optional[Numero] = None
+
+
+class PaginaPedidos(BaseModel):
+    pedidos: List[PedidoListado]
+    next_cursor: Optional[str] = None
+
+
+class PedidoDocumento(BaseModel):
+    """Documento completo de un pedido tal como está en Mongo"""
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    mongo_id: ObjectIdStr = Field(alias="_id")
+    id: Optional[str] = None
+    fecha: Optional[Union[datetime, str]] = None  # Pedidos antiguos la guardan como texto
+    estado: Optional[str] = None
+    tipo_precio: Optional[str] = None
+    productos: List[LineaPedido] = []
+    distribuidor_id: Optional[ObjectIdStr] = None
+    admin_id: Optional[ObjectIdStr] = None
+
+
+class ListaPedidos(BaseModel):
+    pedidos: List[PedidoDocumento]
+
+
+class RespuestaPedido(BaseModel):
+    pedido: PedidoDocumento
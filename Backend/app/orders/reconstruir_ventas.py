@@ -0,0 +1,41 @@
+"""Reconstruye el rollup `ventas_diarias` a partir de los pedidos facturados.
+
+Sirve para el backfill inicial y para corregir el rollup si alguna vez se
+desvía. Sin --desde recalcula todo el histórico; con --desde, desde el
+inicio de ese día.
+
+No se coordina con las facturaciones en vivo: ejecutar con la app detenida
+(o sin pedidos pasando a facturado), o una venta registrada durante la
+reconstrucción puede perderse o duplicarse.
+
+Uso (desde Backend/):
+
+    python -m app.orders.reconstruir_ventas [--desde 2025-01-01]
+"""
+import argparse
+import asyncio
+from datetime import datetime
+
+from app.core.database import close_mongo_connection, connect_to_mongo, ensure_indexes
+from app.core.logs import configurar_logs
+from app.orders.ventas import reconstruir_ventas
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Reconstruye el rollup de ventas diarias")
+    parser.add_argument("--desde", type=datetime.fromisoformat, default=None,
+                        help="Fecha (YYYY-MM-DD) desde la que recalcular")
+    args = parser.parse_args()
+
+    configurar_logs(formato="texto")
+    await connect_to_mongo()
+    try:
+        # $merge necesita el índice único sobre la clave del rollup
+        await ensure_indexes()
+        await reconstruir_ventas(args.desde)
+    finally:
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,103 +1,103 @@
-from app.auth.routes import get_current_user
-from fastapi import APIRouter, HTTPException, Depends, Body, status
+import logging
+from app.auth.routes import get_current_user, get_principal
+from app.auth.models import Principal
+from app.auth.controllers import filtro_cdi_bodega, alcance_visibilidad
+from app.core.singleflight import single_flight
+from app.core.http_cache import aplicar_cabeceras, calcular_etag, etag_coincide, respuesta_no_modificada
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, Request, Response, status
 from bson import ObjectId
-from datetime import datetime, timedelta
-import os
-import smtplib
-import ssl
-from email.message import EmailMessage
+from datetime import datetime
+from typing import Optional
+from app.orders.controllers import (
+    CAMPOS_LISTADO_PEDIDOS,
+    CAMPOS_MIS_ORDENES,
+    LIMITE_PAGINA_DEFECTO,
+    LIMITE_PAGINA_MAXIMO,
+    RESUMEN_LISTADO_PEDIDOS,
+    RESUMEN_MIS_ORDENES,
+    listar_pedidos_paginados
+)
+from app.core.campos import DESCRIPCION_FIELDS, campos_solicitados, proyeccion
+from app.orders.models import ListaPedidos, PaginaPedidos, RespuestaPedido
+from app.core.outbox import correo, encolar_correos
+from app.orders.ventas import registrar_venta
+from app.orders.contadores import registrar_transicion
+from app.orders.dashboard import estadisticas_generales, pedidos_recientes, productos_populares, snapshot_dashboard
 from app.core.database import (
+    get_client,
     collection_pedidos,
     collection_productos,
     collection_distribuidores,
-    collection_admin,
-    collection_bodegas,
     collection_ordenes
 )
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-EMAIL_SENDER = os.getenv("EMAIL_REMITENTE")
-EMAIL_PASSWORD = os.getenv("EMAIL_CONTRASENA")  # Contraseña de aplicación generada en Gmail
-print("EMAIL_SENDER:", EMAIL_SENDER)  # Debe imprimir info@rizosfelices.co
-print("EMAIL_PASSWORD:", EMAIL_PASSWORD)
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 465  # Puerto seguro con SSL
-
-def enviar_correo(destinatario, asunto, mensaje):
-    msg = EmailMessage()
-    msg["Subject"] = asunto
-    msg["From"] = EMAIL_SENDER
-    msg["To"] = destinatario
-    msg.set_content(mensaje, subtype="html")  # Enviar contenido en HTML
-
-    context = ssl.create_default_context()
-    with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, context=context) as server:
-        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-        server.send_message(msg)
-    print(f"📧 Correo enviado a {destinatario}")
+router = APIRouter()
 
 @router.post("/create-purchase-order/")
-async def crear_orden_compra(orden: dict, current_user: dict = Depends(get_current_user)):
-    print("📢 Iniciando creación de ORDEN DE COMPRA")
+async def crear_orden_compra(orden: dict, principal: Principal = Depends(get_principal)):
+    logger.debug("📢 Iniciando creación de ORDEN DE COMPRA")
 
     # Verificar si el usuario tiene el rol de distribuidor
-    if current_user.get("rol") not in ["distribuidor", "distribuidor_nacional", "distribuidor_internacional"]:
-        print(f"❌ Acceso denegado: Rol no permitido: {current_user.get('rol')}")
+    if principal.rol not in ["distribuidor", "distribuidor_nacional", "distribuidor_internacional"]:
+        logger.warning("❌ Acceso denegado: Rol no permitido: %s", principal.rol)
         raise HTTPException(status_code=403, detail="Solo los distribuidores pueden crear órdenes de compra")
 
-    # Obtener distribuidor actual
-    distribuidor = await collection_distribuidores.find_one({"correo_electronico": current_user["email"]})
-    if not distribuidor:
-        print("❌ Distribuidor no encontrado")
-        raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
+    # Distribuidor actual (perfil cacheado)
+    distribuidor_id = principal.id
+    distribuidor_nombre = principal.nombre or "Desconocido"
+    distribuidor_phone = principal.phone or "No registrado"
+    tipo_precio = principal.tipo_precio or "con_iva"
 
-    distribuidor_id = str(distribuidor["_id"])
-    distribuidor_nombre = distribuidor.get("nombre", "Desconocido")
-    distribuidor_phone = distribuidor.get("phone", "No registrado")
-    tipo_precio = distribuidor.get("tipo_precio", "con_iva")
-
-    print(f"📢 Distribuidor encontrado: {distribuidor_nombre}, Tipo de precio: {tipo_precio}")
+    logger.debug("📢 Distribuidor encontrado: %s, Tipo de precio: %s", distribuidor_nombre, tipo_precio)
 
     # Validaciones básicas de la orden
     if "productos" not in orden or not isinstance(orden["productos"], list):
-        print("❌ Orden inválida: Falta lista de productos")
+        logger.warning("❌ Orden inválida: Falta lista de productos")
         raise HTTPException(status_code=400, detail="La orden de compra debe contener una lista de productos")
 
     if "direccion" not in orden:
-        print("❌ Orden inválida: Falta dirección")
+        logger.warning("❌ Orden inválida: Falta dirección")
         raise HTTPException(status_code=400, detail="La orden de compra debe incluir una dirección")
 
+    # Validar las líneas antes de consultar la base de datos
+    for producto in orden["productos"]:
+        if "id" not in producto or "cantidad" not in producto or "precio" not in producto:
+            logger.warning("❌ Producto inválido: %s", producto)
+            raise HTTPException(status_code=400, detail="Cada producto debe tener 'id', 'cantidad' y 'precio'")
+        if not isinstance(producto["id"], str) or not producto["id"]:
+            logger.warning("❌ Id de producto inválido: %s", producto["id"])
+            raise HTTPException(status_code=400, detail="El 'id' de cada producto debe ser un texto no vacío")
+
+    # Resolver todos los productos de la orden en una sola consulta
+    ids_solicitados = list({producto["id"] for producto in orden["productos"]})
+    productos_db = {
+        p["id"]: p
+        async for p in collection_productos.find(
+            {"id": {"$in": ids_solicitados}},
+            {"_id": 0, "id": 1, "nombre": 1}
+        )
+    }
+
+    faltantes = [producto_id for producto_id in ids_solicitados if producto_id not in productos_db]
+    if faltantes:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Productos no encontrados: {', '.join(sorted(str(i) for i in faltantes))}"
+        )
+
     productos_actualizados = []
     subtotal = 0
     iva_total = 0
 
     # Procesar cada producto de la orden
     for producto in orden["productos"]:
-        if "id" not in producto or "cantidad" not in producto or "precio" not in producto:
-            print(f"❌ Producto inválido: {producto}")
-            raise HTTPException(status_code=400, detail="Cada producto debe tener 'id', 'cantidad' y 'precio'")
-
         producto_id = producto["id"]
         cantidad_solicitada = int(producto["cantidad"])
         precio_sin_iva = float(producto["precio"])  # 💡 Precio enviado desde el frontend sin IVA
 
-        print(f"🔍 Verificando producto {producto_id}")
-
-        producto_db = await collection_productos.find_one({"id": producto_id})
-        if not producto_db:
-            raise HTTPException(status_code=404, detail=f"Producto con ID {producto_id} no encontrado")
-
-        # # Obtener el stock actual y convertirlo a int
-        # stock_actual = producto_db.get("stock", 0)
-        # if isinstance(stock_actual, dict):
-        #     # Si en tu esquema usas un dict por bodegas y aquí no segmentas por bodega, toma cualquier valor (o ajusta según tu lógica)
-        #     stock_actual = int(list(stock_actual.values())[0])
-        # else:
-        #     stock_actual = int(stock_actual)
-
-        # if cantidad_solicitada > stock_actual:
-        #     raise HTTPException(status_code=400, detail=f"Stock insuficiente para producto {producto_id}")
+        producto_db = productos_db[producto_id]
 
         # Calcular precio con o sin IVA
         if tipo_precio == "con_iva":
@@ -111,7 +111,7 @@ async def crear_orden_compra(orden: dict, current_user: dict = Depends(get_curre
         else:
             raise HTTPException(status_code=400, detail="Tipo de precio no válido")
 
-        print(f"✅ Producto {producto_id}: Sin IVA: {precio_sin_iva}, IVA unit: {iva}, Con IVA: {precio_con_iva}")
+        logger.debug("✅ Producto %s: Sin IVA: %s, IVA unit: %s, Con IVA: %s", producto_id, precio_sin_iva, iva, precio_con_iva)
 
 
         productos_actualizados.append({
@@ -130,13 +130,13 @@ async def crear_orden_compra(orden: dict, current_user: dict = Depends(get_curre
 
 
     total_orden = subtotal + iva_total
-    print(f"📦 Subtotal: {subtotal}, IVA Total: {iva_total}, Total Orden: {total_orden}")
+    logger.debug("📦 Subtotal: %s, IVA Total: %s, Total Orden: %s", subtotal, iva_total, total_orden)
 
     # ── Validar mínimo de compra ──────────────────────────────────────────────
     # El mínimo se evalúa sobre el subtotal (valor de mercancía SIN IVA), para que
     # el criterio sea consistente sin importar el tipo_precio del distribuidor y
     # el IVA no infle el total haciendo pasar pedidos que no alcanzan el mínimo.
-    minimo_compra = distribuidor.get("minimo_compra")
+    minimo_compra = principal.minimo_compra
     if minimo_compra is not None and subtotal < minimo_compra:
         raise HTTPException(
             status_code=400,
@@ -162,8 +162,17 @@ async def crear_orden_compra(orden: dict, current_user: dict = Depends(get_curre
         "tipo_precio": tipo_precio
     }
 
-    result = await collection_ordenes.insert_one(nueva_orden)
-    print(f"📦 Orden de compra creada con ID: {orden_compra_id} y guardada en 'purchase_orders'")
+    resultado = {}
+
+    async def registrar_orden(session):
+        insertada = await collection_ordenes.insert_one(dict(nueva_orden), session=session)
+        await registrar_transicion("purchase_orders", tipo_precio, nuevo=nueva_orden["estado"], session=session)
+        resultado["inserted_id"] = insertada.inserted_id
+
+    # Orden y contador de estado en una sola transacción
+    async with await get_client().start_session() as session:
+        await session.with_transaction(registrar_orden)
+    logger.debug("📦 Orden de compra creada con ID: %s y guardada en 'purchase_orders'", orden_compra_id)
 
     # Preparar mensajes de correo
     fecha_orden = datetime.now().strftime("%d/%m/%Y %H:%M")
@@ -314,39 +323,35 @@ async def crear_orden_compra(orden: dict, current_user: dict = Depends(get_curre
     </html>
     """
 
-    # Enviar a Tesorería
-    enviar_correo(
-        "tesoreria@rizosfelices.co",
-        f"📦 Nueva Orden de Compra: {orden_compra_id} - {distribuidor_nombre}",
-        mensaje_admin
-    )
-
-    # Enviar adicional al CDI según distribuidor
+    # Encolar correos: Tesorería, CDI según distribuidor y el propio distribuidor
     correos_cdi = {
         "medellin": "cdimedellin@rizosfelices.co",
         "guarne": "produccion@rizosfelices.co"
     }
-    cdi_distribuidor = distribuidor.get("cdi", "").lower()
+    cdi_distribuidor = principal.cdi or ""
+    correos = [correo(
+        "tesoreria@rizosfelices.co",
+        f"📦 Nueva Orden de Compra: {orden_compra_id} - {distribuidor_nombre}",
+        mensaje_admin
+    )]
     correo_cdi = correos_cdi.get(cdi_distribuidor)
     if correo_cdi:
-        enviar_correo(
+        correos.append(correo(
             correo_cdi,
             f"📦 Nueva Orden de Compra (CDI {cdi_distribuidor.capitalize()}): {orden_compra_id} - {distribuidor_nombre}",
             mensaje_admin
-        )
-        print(f"📧 Correo adicional enviado a {correo_cdi}")
-
-    # Correo al distribuidor
-    enviar_correo(
-        current_user["email"],
+        ))
+    correos.append(correo(
+        principal.email,
         f"✅ Confirmación de Orden de Compra: {orden_compra_id}",
         mensaje_distribuidor
-    )
+    ))
+    await encolar_correos(correos)
 
-    print(f"📧 Correos enviados para la orden {orden_compra_id}")
+    logger.debug("📧 Correos encolados para la orden %s", orden_compra_id)
 
     # Convertir ObjectId a string para la respuesta JSON
-    nueva_orden["_id"] = str(result.inserted_id)
+    nueva_orden["_id"] = str(resultado["inserted_id"])
 
     return {
         "message": "Orden de compra creada exitosamente",
@@ -354,138 +359,70 @@ async def crear_orden_compra(orden: dict, current_user: dict = Depends(get_curre
     }
 
 # ENDPOINT PARA OBTENER LOS PEDIDOS
-@router.get("/get-all-orders/")
-async def obtener_pedidos(current_user: dict = Depends(get_current_user)):
+@router.get("/get-all-orders/", response_model=PaginaPedidos, response_model_exclude_unset=True)
+async def obtener_pedidos(
+    limit: int = Query(LIMITE_PAGINA_DEFECTO, ge=1, le=LIMITE_PAGINA_MAXIMO),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description=DESCRIPCION_FIELDS),
+    principal: Principal = Depends(get_principal)
+):
     try:
-        email = current_user["email"]
-        rol = current_user["rol"]
-        filtro_pedidos = {}
-
-        # Lógica para distribuidores (solo ven sus propios pedidos)
-        if rol.startswith("distribuidor"):
-            distribuidor = await collection_distribuidores.find_one({"correo_electronico": email})
-            if not distribuidor:
-                raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-            
-            distribuidor_id = str(distribuidor["_id"])
-            filtro_pedidos = {"distribuidor_id": distribuidor_id}
-        
-        # Para admin, facturacion y produccion no aplicamos filtros (ven todos)
-        elif rol in ["Admin", "facturacion", "produccion"]:
-            pass  # No se aplica filtro
-        
-        # Lógica específica para bodegas
-        elif rol == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": email})
-            if not bodega:
-                raise HTTPException(status_code=404, detail="Bodega no encontrada")
-            
-            cdi = bodega.get("cdi")
-            if not cdi:
-                raise HTTPException(status_code=400, detail="La bodega no tiene un CDI asignado")
-            
-            if cdi == "guarne":
-                filtro_pedidos = {"tipo_precio": "sin_iva_internacional"}
-            elif cdi == "medellin":
-                filtro_pedidos = {"tipo_precio": {"$in": ["con_iva", "sin_iva"]}}
-            else:
-                raise HTTPException(status_code=400, detail="CDI de bodega no válido")
-
-        # Obtener pedidos según filtro
-        pedidos = await collection_pedidos.find(filtro_pedidos).to_list(None)
-        
-        # Obtener todos los distribuidores relevantes en una sola consulta
-        distribuidor_ids = list({pedido["distribuidor_id"] for pedido in pedidos})
-        distribuidores = await collection_distribuidores.find(
-            {"_id": {"$in": [ObjectId(id) for id in distribuidor_ids]}}
-        ).to_list(None)
-        
-        # Crear mapa rápido de distribuidores
-        distribuidor_map = {str(distribuidor["_id"]): {
-            "nombre": distribuidor.get("nombre", "Desconocido"),
-            "telefono": distribuidor.get("telefono", ""),
-            "email": distribuidor.get("correo_electronico", "")
-        } for distribuidor in distribuidores}
-        
-        # Formatear respuesta
-        pedidos_formateados = []
-        for pedido in pedidos:
-            info_distribuidor = distribuidor_map.get(pedido["distribuidor_id"], {
-                "nombre": "Desconocido",
-                "telefono": "",
-                "email": ""
-            })
-            
-            # Adaptar precios para bodega Guarne (mostrar siempre sin IVA)
-            if rol == "bodega" and bodega.get("cdi") == "guarne":
-                for producto in pedido.get("productos", []):
-                    producto["precio"] = producto.get("precio_sin_iva", producto["precio"])
-                    producto["iva_unitario"] = 0
-            
-            pedido_formateado = {
-                "id": pedido.get("id", str(pedido["_id"])),
-                "_id": str(pedido["_id"]),
-                "fecha": pedido.get("fecha", datetime.now()).isoformat(),
-                "productos": pedido.get("productos", []),
-                "estado": pedido.get("estado", "pendiente"),
-                "tipo_precio": pedido.get("tipo_precio"),
-                "distribuidor_nombre": info_distribuidor["nombre"],
-                "distribuidor_telefono": info_distribuidor["telefono"],
-                "distribuidor_email": info_distribuidor["email"],
-                "distribuidor_id": pedido["distribuidor_id"],
-                "total": sum(p["precio"] * p["cantidad"] for p in pedido.get("productos", [])),
-                "total_iva": sum(p.get("iva_unitario", 0) * p["cantidad"] for p in pedido.get("productos", []))
-            }
-            pedidos_formateados.append(pedido_formateado)
-        
-        # Ordenar por fecha descendente
-        pedidos_formateados.sort(key=lambda x: x["fecha"], reverse=True)
-        
-        return {"pedidos": pedidos_formateados}
+        campos = campos_solicitados(fields, CAMPOS_LISTADO_PEDIDOS, RESUMEN_LISTADO_PEDIDOS)
+
+        # Distribuidores solo ven sus propios pedidos y bodegas los de su CDI;
+        # admin, facturacion y produccion ven todos
+        if principal.rol == "bodega":
+            filtro_cdi_bodega(principal)
+        filtro_pedidos = principal.filtro_ordenes
+
+        # Filtrado, datos del distribuidor, totales y orden en una sola agregación
+        # Adaptar precios para bodega Guarne (mostrar siempre sin IVA)
+        return await listar_pedidos_paginados(
+            collection_pedidos,
+            filtro_pedidos,
+            limit,
+            cursor,
+            precios_sin_iva=principal.rol == "bodega" and principal.cdi == "guarne",
+            campos=campos
+        )
     
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error al obtener pedidos: {str(e)}")
+        logger.error("Error al obtener pedidos: %s", str(e))
         raise HTTPException(status_code=500, detail="Error interno al obtener pedidos")
 
 # Endpoint para obtener detalles de un pedido específico
-@router.get("/ordenes/{pedido_id}")
-async def obtener_detalles_pedido(pedido_id: str, current_user: dict = Depends(get_current_user)):
+@router.get("/ordenes/{pedido_id}", response_model=RespuestaPedido, response_model_exclude_unset=True)
+async def obtener_detalles_pedido(
+    pedido_id: str,
+    request: Request,
+    response: Response,
+    principal: Principal = Depends(get_principal)
+):
     try:
-        email = current_user["email"]
-        rol = current_user["rol"]
+        email = principal.email
+        rol = principal.rol
 
-        print(f"🔎 [DETALLE PEDIDO] Usuario autenticado: {email}, Rol: {rol}")
+        logger.debug("🔎 [DETALLE PEDIDO] Usuario autenticado: %s, Rol: %s", email, rol)
 
         # Buscar el pedido SOLAMENTE por su ID personalizado (no usar _id)
         pedido = await collection_pedidos.find_one({"id": pedido_id})
         if not pedido:
-            print(f"❌ Pedido con id {pedido_id} no encontrado")
+            logger.warning("❌ Pedido con id %s no encontrado", pedido_id)
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
 
-        # Convertir ObjectId a str para la respuesta JSON
-        pedido["_id"] = str(pedido["_id"])
-        print(f"📦 Pedido encontrado: {pedido.get('id')}")
+        logger.debug("📦 Pedido encontrado: %s", pedido.get('id'))
 
         # --- ADMIN ---
         if rol == "Admin":
-            admin = await collection_admin.find_one({"correo_electronico": email})
-            if not admin:
-                print("❌ Admin no encontrado")
-                raise HTTPException(status_code=404, detail="Admin no encontrado")
-            print("✅ Admin autorizado - Acceso completo a todos los pedidos")
+            logger.debug("✅ Admin autorizado - Acceso completo a todos los pedidos")
             # Eliminada la validación de admin_id para permitir acceso completo
 
         # --- DISTRIBUIDOR (nacional e internacional) ---
         elif rol.startswith("distribuidor_"):
-            distribuidor = await collection_distribuidores.find_one({"correo_electronico": email})
-            if not distribuidor:
-                print("❌ Distribuidor no encontrado")
-                raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-
-            if str(pedido["distribuidor_id"]) != str(distribuidor["_id"]):
-                print("⛔ Pedido no pertenece a este distribuidor")
+            if str(pedido["distribuidor_id"]) != principal.id:
+                logger.warning("⛔ Pedido no pertenece a este distribuidor")
                 raise HTTPException(status_code=403, detail="No tienes permisos para ver este pedido")
 
         # --- PRODUCCION / FACTURACION ---
@@ -494,38 +431,43 @@ async def obtener_detalles_pedido(pedido_id: str, current_user: dict = Depends(g
 
         # --- BODEGA (Medellín y Guarne) ---
         elif rol == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": email})
-            if not bodega:
-                print("❌ Bodega no encontrada")
-                raise HTTPException(status_code=404, detail="Bodega no encontrada")
-
-            cdi = bodega.get("cdi")
-            if not cdi:
-                print("❌ Bodega sin CDI asignado")
+            if not principal.cdi:
+                logger.warning("❌ Bodega sin CDI asignado")
                 raise HTTPException(status_code=400, detail="La bodega no tiene un CDI asignado")
 
-            print(f"🏭 Bodega {cdi} accediendo al pedido - Sin restricciones de tipo_precio")
+            logger.debug("🏭 Bodega %s accediendo al pedido - Sin restricciones de tipo_precio", principal.cdi)
 
         else:
-            print(f"⛔ Rol no autorizado: {rol}")
+            logger.warning("⛔ Rol no autorizado: %s", rol)
             raise HTTPException(status_code=403, detail="Rol no autorizado para ver pedidos")
 
         # Obtener información del distribuidor para la respuesta
-        distribuidor = await collection_distribuidores.find_one({"_id": ObjectId(pedido["distribuidor_id"])})
+        distribuidor = await collection_distribuidores.find_one(
+            {"_id": ObjectId(pedido["distribuidor_id"])}, {"nombre": 1, "telefono": 1}
+        )
         pedido["distribuidor_nombre"] = distribuidor.get("nombre") if distribuidor else "Desconocido"
         pedido["distribuidor_telefono"] = distribuidor.get("telefono") if distribuidor else ""
 
+        # GET condicional: revisión del pedido + datos del distribuidor incluidos
+        etag = calcular_etag(
+            "ordenes", pedido["_id"], pedido.get("revision", 0),
+            pedido["distribuidor_nombre"], pedido["distribuidor_telefono"]
+        )
+        if etag_coincide(request, etag):
+            return respuesta_no_modificada(etag)
+        aplicar_cabeceras(response, etag)
+
         # Calcular totales
         pedido["total"] = sum(p["precio"] * p["cantidad"] for p in pedido.get("productos", []))
         pedido["total_iva"] = sum(p.get("iva_unitario", 0) * p["cantidad"] for p in pedido.get("productos", []))
 
-        print("✅ Devolviendo detalles del pedido")
+        logger.debug("✅ Devolviendo detalles del pedido")
         return {"pedido": pedido}
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error crítico: {str(e)}")
+        logger.error("❌ Error crítico: %s", str(e))
         raise HTTPException(status_code=500, detail="Error interno al obtener detalles del pedido")
 
 # ENDPOINT PARA CAMBIAR ESTADO DE PEDIDO (facturado/en camino)
@@ -547,14 +489,37 @@ async def cambiar_estado_orden(
         if nuevo_estado not in ["facturado", "en camino"]:
             raise HTTPException(status_code=400, detail="Estado no válido")
 
-        # Buscar y actualizar usando el ID personalizado (no ObjectId)
-        resultado = await collection_pedidos.update_one(
-            {"id": pedido_id},  # Buscar por tu ID personalizado
-            {"$set": {"estado": nuevo_estado}}
-        )
+        async def actualizar_estado(session):
+            pedido = None
+            if nuevo_estado == "facturado":
+                # facturado_en garantiza que cada pedido sume al rollup una sola vez
+                pedido = await collection_pedidos.find_one_and_update(
+                    {"id": pedido_id, "facturado_en": {"$exists": False}},
+                    {"$set": {"estado": nuevo_estado, "facturado_en": datetime.utcnow()}, "$inc": {"revision": 1}},
+                    session=session
+                )
+                if pedido:
+                    await registrar_venta(pedido, session=session)
+
+            if pedido is None:
+                # Buscar y actualizar usando el ID personalizado (no ObjectId)
+                pedido = await collection_pedidos.find_one_and_update(
+                    {"id": pedido_id, "estado": {"$ne": nuevo_estado}},
+                    {"$set": {"estado": nuevo_estado}, "$inc": {"revision": 1}},
+                    projection={"estado": 1, "tipo_precio": 1},
+                    session=session
+                )
+            if pedido is None:
+                raise HTTPException(status_code=404, detail="Pedido no encontrado")
+
+            # find_one_and_update devuelve el documento anterior: estado previo -> nuevo
+            await registrar_transicion(
+                "pedidos", pedido.get("tipo_precio"), pedido.get("estado"), nuevo_estado, session=session
+            )
 
-        if resultado.modified_count == 0:
-            raise HTTPException(status_code=404, detail="Pedido no encontrado")
+        # Estado del pedido, rollup de ventas y contadores en una sola transacción
+        async with await get_client().start_session() as session:
+            await session.with_transaction(actualizar_estado)
 
         # Obtener pedido actualizado
         pedido_actualizado = await collection_pedidos.find_one({"id": pedido_id})
@@ -573,90 +538,33 @@ async def cambiar_estado_orden(
 
 # Endpoint de Estadísticas Generales
 @router.get("/estadisticas/generales")
-async def obtener_estadisticas_generales(current_user: dict = Depends(get_current_user)):
+@single_flight("estadisticas_generales", lambda principal, **_: alcance_visibilidad(principal))
+async def obtener_estadisticas_generales(principal: Principal = Depends(get_principal)):
     """
     Devuelve estadísticas generales.
     Solo 'bodega' ve datos filtrados por su CDI (medellin o guarne).
     """
     try:
-        email = current_user["email"]
-        rol = current_user["rol"]
+        email = principal.email
+        rol = principal.rol
         filtro_pedidos = {}
         cdi = None
 
-        print(f"📊 Usuario autenticado: {email}, Rol: {rol}")
+        logger.debug("📊 Usuario autenticado: %s, Rol: %s", email, rol)
 
         # --- FILTROS SOLO PARA BODEGA ---
         if rol == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": email})
-            if not bodega:
-                raise HTTPException(status_code=404, detail="Bodega no encontrada")
-            cdi = bodega.get("cdi", None)
-
-            if cdi == "medellin":
-                filtro_pedidos = {"tipo_precio": {"$in": ["sin_iva", "con_iva"]}}
-            elif cdi == "guarne":
-                filtro_pedidos = {"tipo_precio": "sin_iva_internacional"}
-            else:
-                raise HTTPException(status_code=400, detail="CDI de bodega no válido")
+            cdi = principal.cdi
+            filtro_pedidos = filtro_cdi_bodega(principal)
 
         elif rol not in ["Admin", "produccion", "facturacion", "distribuidor"]:
             raise HTTPException(status_code=403, detail="Rol no autorizado para ver estadísticas")
 
-        # --- 1. Pedidos totales ---
-        total_pedidos = await collection_pedidos.count_documents(filtro_pedidos)
-
-        # --- 2. Productos activos ---
-        try:
-            total_productos = await collection_productos.count_documents({
-                "activo": True,
-                "eliminado": {"$ne": True}
-            })
-        except Exception as e:
-            print(f"❌ Error al contar productos: {str(e)}")
-            total_productos = 0
-
-        # --- 3. Distribuidores ---
-        total_distribuidores = await collection_distribuidores.count_documents({})
-
-        # --- 4. Ventas mensuales ---
-        fecha_inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        fecha_fin_mes = (fecha_inicio_mes + timedelta(days=32)).replace(day=1)
-
-        pipeline_ventas = [
-            {
-                "$match": {
-                    "fecha": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-                    "estado": "facturado",
-                    **filtro_pedidos
-                }
-            },
-            {"$unwind": "$productos"},
-            {
-                "$group": {
-                    "_id": None,
-                    "total_ventas": {
-                        "$sum": {"$multiply": ["$productos.cantidad", "$productos.precio"]}
-                    },
-                    "count_ventas": {"$sum": 1}
-                }
-            }
-        ]
-
-        ventas_mensuales = await collection_pedidos.aggregate(pipeline_ventas).to_list(length=1)
-        total_ventas = ventas_mensuales[0]["total_ventas"] if ventas_mensuales and "total_ventas" in ventas_mensuales[0] else 0
-
-        return {
-            "pedidos_totales": total_pedidos,
-            "total_productos": total_productos,
-            "total_distribuidores": total_distribuidores,
-            "ventas_mensuales": total_ventas,
-            "cdi": cdi,
-            "fecha_consulta": datetime.now().isoformat()
-        }
+        # Conteos y ventas del mes en paralelo
+        return await estadisticas_generales(filtro_pedidos, cdi)
 
     except Exception as e:
-        print(f"❌ Error al obtener estadísticas: {e}")
+        logger.error("❌ Error al obtener estadísticas: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Error al obtener estadísticas: {str(e)}"
@@ -664,261 +572,155 @@ async def obtener_estadisticas_generales(current_user: dict = Depends(get_curren
 
 ## Endpoint de Pedidos Recientes
 @router.get("/api/pedidos/recientes")
-async def obtener_pedidos_recientes(current_user: dict = Depends(get_current_user)):
+async def obtener_pedidos_recientes(principal: Principal = Depends(get_principal)):
     """
     Devuelve los 5 pedidos más recientes.
     Solo el rol bodega ve pedidos filtrados por CDI y tipo_precio.
     """
     try:
-        email = current_user["email"]
-        rol = current_user["rol"]
+        email = principal.email
+        rol = principal.rol
 
-        print(f"📢 Usuario autenticado: {email}, Rol: {rol}")
+        logger.debug("📢 Usuario autenticado: %s, Rol: %s", email, rol)
 
         filtro_pedidos = {}
 
         # --- FILTROS SOLO PARA BODEGA ---
         if rol == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": email})
-            if not bodega:
-                raise HTTPException(status_code=404, detail="Bodega no encontrada")
-
-            cdi = bodega.get("cdi", None)
-            print(f"🏢 Bodega CDI: {cdi}")
-
-            if cdi == "medellin":
-                filtro_pedidos = {"tipo_precio": {"$in": ["sin_iva", "con_iva"]}}
-            elif cdi == "guarne":
-                filtro_pedidos = {"tipo_precio": "sin_iva_internacional"}
-            else:
-                raise HTTPException(status_code=400, detail="CDI de bodega no válido")
+            logger.debug("🏢 Bodega CDI: %s", principal.cdi)
+            filtro_pedidos = filtro_cdi_bodega(principal)
 
         # --- OTROS ROLES ---
         elif rol not in ["Admin", "distribuidor", "produccion", "facturacion"]:
             raise HTTPException(status_code=403, detail="Rol no autorizado para ver pedidos recientes")
 
         # --- OBTENER PEDIDOS RECIENTES ---
-        pedidos = await collection_pedidos.find(filtro_pedidos) \
-            .sort("fecha", -1) \
-            .limit(5) \
-            .to_list(length=None)
-
-        # --- FORMATEAR RESPUESTA ---
-        for pedido in pedidos:
-            pedido["id"] = str(pedido["_id"])
-            pedido["total"] = sum(p["cantidad"] * p["precio"] for p in pedido["productos"])
-            del pedido["_id"]
-
-        return pedidos
+        return await pedidos_recientes(filtro_pedidos)
 
     except Exception as e:
-        print(f"❌ Error al obtener pedidos recientes: {e}")
+        logger.error("❌ Error al obtener pedidos recientes: %s", e)
         raise HTTPException(status_code=500, detail="Error al obtener pedidos recientes")
 
 @router.get("/productos/populares")
-async def obtener_productos_populares(current_user: dict = Depends(get_current_user)):
+async def obtener_productos_populares(principal: Principal = Depends(get_principal)):
     """
     Devuelve los 5 productos más vendidos en el mes actual.
     Solo 'bodega' ve datos filtrados por CDI y tipo_precio.
     """
     try:
-        email = current_user["email"]
-        rol = current_user["rol"].lower()
-        print(f"🔍 Consulta de productos populares por {email} (Rol: {rol})")
+        email = principal.email
+        rol = principal.rol.lower()
+        logger.debug("🔍 Consulta de productos populares por %s (Rol: %s)", email, rol)
 
         # --- Validación de roles ---
         if rol == "facturacion":
-            print("⛔ Acceso denegado a facturación")
+            logger.warning("⛔ Acceso denegado a facturación")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="No tienes permisos para ver esta información"
             )
 
-        # --- Fechas para el mes actual ---
-        hoy = datetime.now()
-        fecha_inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        fecha_fin_mes = (fecha_inicio_mes + timedelta(days=32)).replace(day=1)
-        print(f"📅 Rango del mes: {fecha_inicio_mes} a {fecha_fin_mes}")
-
-        # --- Filtro base para pedidos facturados ---
-        filtro_match = {
-            "fecha": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-            "estado": "facturado",
-            "productos": {"$exists": True, "$not": {"$size": 0}}
-        }
-
         # --- Filtro adicional para BODEGA ---
+        filtro_ventas = {}
         if rol == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": email})
-            if not bodega:
-                raise HTTPException(status_code=404, detail="Bodega no encontrada")
-
-            cdi = bodega.get("cdi")
-            print(f"🏢 Bodega CDI: {cdi}")
-
-            if cdi == "medellin":
-                filtro_match["tipo_precio"] = {"$in": ["sin_iva", "con_iva"]}
-            elif cdi == "guarne":
-                filtro_match["tipo_precio"] = "sin_iva_internacional"
-            else:
-                raise HTTPException(status_code=400, detail="CDI de bodega no válido")
-
-        # --- Pipeline de agregación ---
-        pipeline = [
-            {"$match": filtro_match},
-            {"$unwind": "$productos"},
-            {"$match": {"productos.id": {"$exists": True}, "productos.cantidad": {"$gt": 0}}},
-            {
-                "$group": {
-                    "_id": "$productos.id",
-                    "nombre": {"$first": "$productos.nombre"},
-                    "categoria": {"$first": "$productos.categoria"},
-                    "precio": {"$avg": "$productos.precio"},
-                    "vendidos": {"$sum": "$productos.cantidad"},
-                    "num_pedidos": {"$sum": 1}
-                }
-            },
-            {"$sort": {"vendidos": -1}},
-            {"$limit": 5},
-            {
-                "$lookup": {
-                    "from": "productos",
-                    "localField": "_id",
-                    "foreignField": "id",
-                    "as": "producto_info"
-                }
-            },
-            {"$unwind": "$producto_info"},
-            {
-                "$addFields": {
-                    "stock": "$producto_info.stock",
-                    "activo": "$producto_info.activo",
-                    "imagen": "$producto_info.imagen",
-                    "en_produccion": "$producto_info.en_produccion"
-                }
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "id": "$_id",
-                    "nombre": 1,
-                    "categoria": 1,
-                    "precio": 1,
-                    "vendidos": 1,
-                    "stock": 1,
-                    "activo": 1,
-                    "imagen": 1,
-                    "num_pedidos": 1,
-                    "en_produccion": 1
-                }
-            }
-        ]
-
-        print("🔎 Ejecutando pipeline de agregación...")
-        productos = await collection_pedidos.aggregate(pipeline).to_list(length=None)
-        print(f"✅ Productos encontrados: {len(productos)}")
-
-        # --- Filtrado adicional para producción ---
-        if rol == "produccion":
-            productos = [p for p in productos if p.get("en_produccion", False)]
-            print(f"🛠️ Filtrados para producción: {len(productos)}")
+            logger.debug("🏢 Bodega CDI: %s", principal.cdi)
+            filtro_ventas = filtro_cdi_bodega(principal)
 
+        # --- Más vendidos del mes (rollup) con su stock actual ---
+        productos = await productos_populares(filtro_ventas, solo_en_produccion=rol == "produccion")
+        logger.debug("✅ Productos encontrados: %s", len(productos))
         return productos
 
     except Exception as e:
-        print(f"❌ Error en agregación: {str(e)}")
+        logger.error("❌ Error en agregación: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Error al obtener productos populares: {str(e)}"
         )
 
-@router.get("/mis-ordenes")  # Si el prefijo es "/orders/pedidos"
-async def obtener_mis_pedidos(current_user: dict = Depends(get_current_user)):
-    print("🚀 Entrando en obtener_mis_pedidos")
-    try:
-        print(f"📢 Usuario autenticado: {current_user}")
-
-        if not current_user["rol"].startswith("distribuidor"):
-            print("❌ No es distribuidor")
-            raise HTTPException(status_code=403, detail="Solo los distribuidores pueden acceder a sus pedidos.")
+# Snapshot del dashboard: estadísticas, pedidos recientes y productos populares en una llamada
+@router.get("/dashboard/snapshot")
+async def obtener_snapshot_dashboard(principal: Principal = Depends(get_principal)):
+    if principal.rol not in ["Admin", "produccion", "facturacion", "distribuidor", "bodega"]:
+        raise HTTPException(status_code=403, detail="Rol no autorizado para ver el dashboard")
 
-        distribuidor = await collection_distribuidores.find_one({"correo_electronico": current_user["email"]})
-        print(f"🔍 Distribuidor encontrado: {distribuidor}")
+    try:
+        return await snapshot_dashboard(principal)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("❌ Error al obtener el snapshot del dashboard: %s", e)
+        raise HTTPException(status_code=500, detail="Error al obtener el dashboard")
 
-        if not distribuidor:
-            raise HTTPException(status_code=404, detail="Distribuidor no encontrado.")
+@router.get("/mis-ordenes", response_model=ListaPedidos, response_model_exclude_unset=True)  # Si el prefijo es "/orders/pedidos"
+async def obtener_mis_pedidos(
+    fields: Optional[str] = Query(None, description=DESCRIPCION_FIELDS),
+    principal: Principal = Depends(get_principal)
+):
+    logger.debug("🚀 Entrando en obtener_mis_pedidos")
+    campos = campos_solicitados(fields, CAMPOS_MIS_ORDENES, RESUMEN_MIS_ORDENES)
+    try:
+        logger.debug("📢 Usuario autenticado: %s (%s)", principal.email, principal.rol)
 
-        distribuidor_id = str(distribuidor["_id"])
-        print(f"📦 Buscando pedidos con distribuidor_id: {distribuidor_id}")
+        if not principal.es_distribuidor:
+            logger.warning("❌ No es distribuidor")
+            raise HTTPException(status_code=403, detail="Solo los distribuidores pueden acceder a sus pedidos.")
 
-        pedidos = await collection_pedidos.find({"distribuidor_id": distribuidor_id}).to_list(500)
-        print(f"📜 Pedidos encontrados: {len(pedidos)}")
+        distribuidor_id = principal.id
+        logger.debug("📦 Buscando pedidos con distribuidor_id: %s", distribuidor_id)
 
-        for pedido in pedidos:
-            pedido["_id"] = str(pedido["_id"])
-            if "fecha" in pedido and hasattr(pedido["fecha"], "isoformat"):
-                pedido["fecha"] = pedido["fecha"].isoformat()
+        # Solo se leen de Mongo los campos pedidos (por defecto, sin las líneas)
+        pedidos = await collection_pedidos.find(
+            {"distribuidor_id": distribuidor_id}, proyeccion(campos)
+        ).to_list(500)
+        logger.debug("📜 Pedidos encontrados: %s", len(pedidos))
 
         return {"pedidos": pedidos}
 
     except Exception as e:
-        print(f"❌ Error al obtener pedidos: {str(e)}")
+        logger.error("❌ Error al obtener pedidos: %s", str(e))
         raise HTTPException(status_code=500, detail=f"Error al obtener pedidos: {str(e)}")
         
 @router.get("/detalles-pedidos/{pedido_id}")
 async def obtener_detalles_pedido(
     pedido_id: str, 
-    current_user: dict = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    principal: Principal = Depends(get_principal)
 ):
     try:
-        print(f"🔍 Buscando pedido con ID: {pedido_id}")
-        
-        # 1. BUSCAR EL PEDIDO (por id personalizado o _id)
-        pedido = await collection_pedidos.find_one({"id": pedido_id})
-        
-        if not pedido:
-            try:
-                pedido = await collection_pedidos.find_one({"_id": ObjectId(pedido_id)})
-            except:
-                pass
+        logger.debug("🔍 Buscando pedido con ID: %s", pedido_id)
         
+        # 1. BUSCAR EL PEDIDO (por id personalizado o _id, en una sola consulta)
+        filtro_pedido = {"id": pedido_id}
+        if ObjectId.is_valid(pedido_id):
+            filtro_pedido = {"$or": [filtro_pedido, {"_id": ObjectId(pedido_id)}]}
+        pedido = await collection_pedidos.find_one(filtro_pedido)
+
         if not pedido:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
 
-        # Convertir ObjectId a string
-        pedido["_id"] = str(pedido.get("_id"))
-        print(f"📦 Pedido encontrado: {pedido.get('id')}")
+        logger.debug("📦 Pedido encontrado: %s", pedido.get('id'))
 
         # 2. VALIDACIÓN DE PERMISOS POR ROL
-        rol = current_user["rol"]
-        email = current_user["email"]
+        rol = principal.rol
+
+        # El distribuidor se lee una vez: sirve para el permiso del Admin y para la respuesta
+        distribuidor = await buscar_distribuidor_pedido(pedido.get("distribuidor_id"))
 
         # ADMINISTRADOR
         if rol == "Admin":
-            admin = await collection_admin.find_one({"correo_electronico": email})
-            if not admin:
-                raise HTTPException(status_code=404, detail="Admin no encontrado")
-
-            distribuidor = await collection_distribuidores.find_one({"_id": ObjectId(pedido.get("distribuidor_id"))})
-            if not distribuidor or str(distribuidor.get("admin_id")) != str(admin["_id"]):
+            if not distribuidor or str(distribuidor.get("admin_id")) != principal.id:
                 raise HTTPException(status_code=403, detail="No autorizado para este pedido")
 
         # DISTRIBUIDOR (nacional e internacional)
         elif rol.startswith("distribuidor_"):
-            distribuidor = await collection_distribuidores.find_one({"correo_electronico": email})
-            if not distribuidor:
-                raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-            
-            if str(pedido.get("distribuidor_id")) != str(distribuidor["_id"]):
+            if str(pedido.get("distribuidor_id")) != principal.id:
                 raise HTTPException(status_code=403, detail="Solo puedes ver tus propios pedidos")
 
         # BODEGA
         elif rol == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": email})
-            if not bodega:
-                raise HTTPException(status_code=404, detail="Bodega no encontrada")
-            
-            cdi = bodega.get("cdi")
+            cdi = principal.cdi
             tipo_precio = pedido.get("tipo_precio")
             
             if cdi == "medellin" and tipo_precio not in ["sin_iva", "con_iva"]:
@@ -932,7 +734,13 @@ async def obtener_detalles_pedido(
 
         # 3. FORMATEAR RESPUESTA
         productos = pedido.get("productos", [])
-        distribuidor_info = await obtener_info_distribuidor(pedido.get("distribuidor_id"))
+        distribuidor_info = info_distribuidor(distribuidor)
+
+        # GET condicional: revisión del pedido + datos del distribuidor incluidos
+        etag = calcular_etag("detalles-pedidos", pedido["_id"], pedido.get("revision", 0), distribuidor_info)
+        if etag_coincide(request, etag):
+            return respuesta_no_modificada(etag)
+        aplicar_cabeceras(response, etag)
 
         response = {
             "id": pedido.get("id"),
@@ -962,17 +770,23 @@ async def obtener_detalles_pedido(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error crítico: {str(e)}", exc_info=True)
+        logger.error("❌ Error crítico: %s", str(e), exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
-async def obtener_info_distribuidor(distribuidor_id: str):
-    if not distribuidor_id:
+async def buscar_distribuidor_pedido(distribuidor_id: str):
+    if not distribuidor_id or not ObjectId.is_valid(distribuidor_id):
         return None
-    
-    distribuidor = await collection_distribuidores.find_one({"_id": ObjectId(distribuidor_id)})
+
+    return await collection_distribuidores.find_one(
+        {"_id": ObjectId(distribuidor_id)},
+        {"admin_id": 1, "nombre": 1, "correo_electronico": 1, "pais": 1}
+    )
+
+
+def info_distribuidor(distribuidor: dict | None):
     if not distribuidor:
         return None
-    
+
     return {
         "nombre": distribuidor.get("nombre"),
         "email": distribuidor.get("correo_electronico"),
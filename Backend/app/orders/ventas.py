@@ -0,0 +1,201 @@
+"""Rollup de ventas diarias (colección `ventas_diarias`).
+
+Un documento por (día, CDI, tipo_precio, producto, distribuidor) con unidades,
+ingresos y número de líneas. Se actualiza con $inc cuando un pedido pasa a
+"facturado" y alimenta las estadísticas del dashboard sin recorrer pedidos.
+
+El día es el de la fecha del pedido, igual que el rango mensual que usaban
+las consultas originales sobre `pedidos`.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from app.core.database import collection_pedidos, collection_ventas_diarias
+from app.orders.controllers import TIPOS_PRECIO_POR_CDI, cdi_de_tipo_precio
+
+logger = logging.getLogger(__name__)
+
+# Estados de un pedido que ya fue facturado
+ESTADOS_FACTURADOS = ["facturado", "en camino"]
+
+
+def inicio_del_dia(fecha) -> datetime:
+    if isinstance(fecha, str):
+        fecha = datetime.fromisoformat(fecha)
+    return (fecha or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rango_mes_actual() -> tuple:
+    inicio = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    fin = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio, fin
+
+
+def operaciones_venta(pedido: dict) -> list:
+    """$inc sobre el rollup por cada línea del pedido (con upsert)"""
+    tipo_precio = pedido.get("tipo_precio")
+    cdi = cdi_de_tipo_precio(tipo_precio)
+    if cdi is None:
+        return []
+
+    clave_base = {
+        "dia": inicio_del_dia(pedido.get("fecha")),
+        "cdi": cdi,
+        "tipo_precio": tipo_precio,
+        "distribuidor_id": str(pedido.get("distribuidor_id")),
+    }
+
+    operaciones = []
+    for linea in pedido.get("productos", []):
+        cantidad = linea.get("cantidad", 0)
+        if not linea.get("id") or cantidad <= 0:
+            continue
+        precio = linea.get("precio", 0)
+        operaciones.append(UpdateOne(
+            {**clave_base, "producto_id": linea["id"]},
+            {
+                "$inc": {"unidades": cantidad, "ingresos": cantidad * precio, "lineas": 1, "suma_precios": precio},
+                "$set": {"nombre": linea.get("nombre"), "categoria": linea.get("categoria")},
+            },
+            upsert=True
+        ))
+    return operaciones
+
+
+async def registrar_venta(pedido: dict, session=None):
+    operaciones = operaciones_venta(pedido)
+    if operaciones:
+        await collection_ventas_diarias.bulk_write(operaciones, ordered=False, session=session)
+
+
+async def ventas_del_mes(filtro: dict) -> float:
+    """Ingresos facturados del mes; `filtro` admite las mismas claves de tipo_precio que los pedidos"""
+    inicio, fin = rango_mes_actual()
+    resultado = await collection_ventas_diarias.aggregate([
+        {"$match": {"dia": {"$gte": inicio, "$lt": fin}, **filtro}},
+        {"$group": {"_id": None, "total_ventas": {"$sum": "$ingresos"}}},
+    ]).to_list(length=1)
+    return resultado[0]["total_ventas"] if resultado else 0
+
+
+async def productos_mas_vendidos(filtro: dict, limite: int = 5) -> list:
+    """Productos con más unidades facturadas en el mes (id, nombre, categoria, precio, vendidos, num_pedidos)"""
+    inicio, fin = rango_mes_actual()
+    return await collection_ventas_diarias.aggregate([
+        {"$match": {"dia": {"$gte": inicio, "$lt": fin}, **filtro}},
+        {"$group": {
+            "_id": "$producto_id",
+            "nombre": {"$first": "$nombre"},
+            "categoria": {"$first": "$categoria"},
+            "suma_precios": {"$sum": "$suma_precios"},
+            "vendidos": {"$sum": "$unidades"},
+            "num_pedidos": {"$sum": "$lineas"},
+        }},
+        {"$sort": {"vendidos": -1}},
+        {"$limit": limite},
+        {"$project": {
+            "_id": 0,
+            "id": "$_id",
+            "nombre": 1,
+            "categoria": 1,
+            "precio": {"$divide": ["$suma_precios", {"$max": ["$num_pedidos", 1]}]},
+            "vendidos": 1,
+            "num_pedidos": 1,
+        }},
+    ]).to_list(length=None)
+
+
+def _dia_pedido(respaldo) -> dict:
+    """Expresión de agregación con el día de `fecha`, como `inicio_del_dia`.
+
+    Acepta fechas date y texto ISO; si no hay fecha o no se puede leer usa
+    `respaldo` (el registro en vivo usa el momento de facturar).
+    """
+    fecha = {"$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$type": "$fecha"}, "date"]}, "then": "$fecha"},
+            {"case": {"$eq": [{"$type": "$fecha"}, "string"]},
+             "then": {"$dateFromString": {"dateString": "$fecha", "onError": None, "onNull": None}}},
+        ],
+        "default": None,
+    }}
+    return {"$dateTrunc": {"date": {"$ifNull": [fecha, respaldo]}, "unit": "day"}}
+
+
+async def reconstruir_ventas(desde: datetime = None):
+    """Recalcula el rollup desde los pedidos facturados (backfill).
+
+    Marca `facturado_en` en los pedidos facturados que no lo tengan, para que
+    cambiar_estado_orden no los vuelva a sumar, y reemplaza los documentos del
+    rango con el resultado de una agregación $merge. El rango empieza en el
+    día de `desde` (se borra y se recalcula el día completo).
+
+    Sin bloqueo frente a `registrar_venta`: un pedido facturado entre el
+    borrado y el $merge puede perderse o contarse dos veces. Ejecutar con la
+    app detenida o sin facturaciones en curso.
+    """
+    dia_desde = inicio_del_dia(desde) if desde else None
+    tipos_precio = [t for tipos in TIPOS_PRECIO_POR_CDI.values() for t in tipos]
+
+    filtro_marcar = {"estado": {"$in": ESTADOS_FACTURADOS}, "facturado_en": {"$exists": False}}
+    if dia_desde:
+        filtro_marcar["$expr"] = {"$gte": [_dia_pedido("$$NOW"), dia_desde]}
+    marcados = await collection_pedidos.update_many(filtro_marcar, {"$set": {"facturado_en": datetime.utcnow()}})
+    logger.info("🏷️ %s pedidos facturados marcados con facturado_en", marcados.modified_count)
+
+    borrados = await collection_ventas_diarias.delete_many({"dia": {"$gte": dia_desde}} if dia_desde else {})
+    logger.info("🧹 %s documentos de ventas_diarias eliminados", borrados.deleted_count)
+
+    await collection_pedidos.aggregate([
+        {"$match": {
+            "facturado_en": {"$exists": True},
+            "tipo_precio": {"$in": tipos_precio},
+        }},
+        # Fechas date, texto o ausentes (estas últimas cuentan el día en que se facturó)
+        {"$addFields": {"dia_venta": _dia_pedido("$facturado_en")}},
+        *([{"$match": {"dia_venta": {"$gte": dia_desde}}}] if dia_desde else []),
+        {"$unwind": "$productos"},
+        {"$match": {"productos.id": {"$exists": True}, "productos.cantidad": {"$gt": 0}}},
+        {"$group": {
+            "_id": {
+                "dia": "$dia_venta",
+                "tipo_precio": "$tipo_precio",
+                "distribuidor_id": {"$toString": "$distribuidor_id"},
+                "producto_id": "$productos.id",
+            },
+            "unidades": {"$sum": "$productos.cantidad"},
+            "ingresos": {"$sum": {"$multiply": ["$productos.cantidad", {"$ifNull": ["$productos.precio", 0]}]}},
+            "lineas": {"$sum": 1},
+            "suma_precios": {"$sum": {"$ifNull": ["$productos.precio", 0]}},
+            "nombre": {"$last": "$productos.nombre"},
+            "categoria": {"$last": "$productos.categoria"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "dia": "$_id.dia",
+            "cdi": {"$switch": {"branches": [
+                {"case": {"$in": ["$_id.tipo_precio", tipos]}, "then": cdi}
+                for cdi, tipos in TIPOS_PRECIO_POR_CDI.items()
+            ]}},
+            "tipo_precio": "$_id.tipo_precio",
+            "distribuidor_id": "$_id.distribuidor_id",
+            "producto_id": "$_id.producto_id",
+            "unidades": 1,
+            "ingresos": 1,
+            "lineas": 1,
+            "suma_precios": 1,
+            "nombre": 1,
+            "categoria": 1,
+        }},
+        {"$merge": {
+            "into": "ventas_diarias",
+            "on": ["dia", "cdi", "tipo_precio", "producto_id", "distribuidor_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]).to_list(length=None)
+
+    total = await collection_ventas_diarias.count_documents({})
+    logger.info("✅ Rollup de ventas reconstruido: %s documentos", total)
@@ -0,0 +1,259 @@
+"""Catálogo de productos en memoria para /productos/disponibles.
+
+Los productos se cargan una vez en registros compactos (`__slots__`) y cada
+vista (tipo_precio, CDI) se materializa la primera vez que se pide. Cualquier
+cambio de producto o de stock incrementa un contador de versión en la
+colección `versiones`; cada worker lo consulta como mucho cada
+CATALOGO_VERIFICAR_SEGUNDOS y reconstruye el catálogo solo si cambió.
+
+Cada escritura de productos guarda en el documento la versión que obtuvo
+(`revision`) junto con `actualizado_en`, en la misma transacción que
+incrementa el contador (los descuentos de stock de los pedidos la publican
+justo después de confirmar el pedido, con `marcar_productos_modificados`),
+y los productos eliminados dejan una marca en
+`productos_eliminados`. Así un cliente que ya tiene la versión N puede pedir
+solo lo que cambió después (`revision > N`).
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from app.core.database import get_client, collection_productos, collection_productos_eliminados, collection_versiones
+from app.core.metricas import CATALOGO_RECONSTRUCCIONES
+from app.products.controllers import normalizar_stock
+
+logger = logging.getLogger(__name__)
+
+CATALOGO_VERIFICAR_SEGUNDOS = float(os.getenv("CATALOGO_VERIFICAR_SEGUNDOS", 2))
+# Intentos de publicar la revisión de productos escritos en otra transacción
+REVISION_INTENTOS = int(os.getenv("CATALOGO_REVISION_INTENTOS", 3))
+VERSION_CATALOGO = "catalogo"
+
+# Campo de precios según el tipo de precio del distribuidor
+CAMPO_PRECIO = {
+    "sin_iva": "sin_iva_colombia",
+    "con_iva": "con_iva_colombia",
+    "sin_iva_internacional": "internacional",
+}
+
+PROYECCION_CATALOGO = {
+    "_id": 0, "id": 1, "nombre": 1, "categoria": 1, "descripcion": 1, "imagen": 1, "activo": 1,
+    "tipo_codigo": 1, "descuento": 1, "precios": 1, "stock": 1, "margenes": 1, "revision": 1
+}
+
+
+class ProductoCatalogo:
+    __slots__ = (
+        "id", "nombre", "categoria", "descripcion", "imagen", "activo", "tipo_codigo",
+        "descuento", "precios", "stock", "margenes", "revision"
+    )
+
+    def __init__(self, doc: dict):
+        self.id = doc["id"]
+        self.nombre = doc["nombre"]
+        self.categoria = doc["categoria"]
+        self.descripcion = doc.get("descripcion", "")
+        self.imagen = doc.get("imagen", "")
+        self.activo = doc.get("activo", True)
+        self.tipo_codigo = doc.get("tipo_codigo", "")
+        self.descuento = doc.get("descuento", 0)
+        self.precios = doc.get("precios") or {}
+        self.stock = normalizar_stock(doc.get("stock"))
+        self.margenes = doc.get("margenes", {})
+        # Productos anteriores al control de revisiones cuentan como revisión 0
+        self.revision = doc.get("revision", 0)
+
+    def _base(self) -> dict:
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "categoria": self.categoria,
+            "descripcion": self.descripcion,
+            "imagen": self.imagen,
+            "activo": self.activo,
+            "tipo_codigo": self.tipo_codigo,
+            "descuento": self.descuento
+        }
+
+    def vista_distribuidor(self, tipo_precio: str, cdi: str) -> dict:
+        datos = self._base()
+        datos["stock"] = self.stock.get(cdi, 0)
+        campo = CAMPO_PRECIO.get(tipo_precio)
+        if campo:
+            datos["precio"] = self.precios.get(campo, 0)
+            datos["tipo_precio"] = tipo_precio
+        return datos
+
+    def vista_completa(self) -> dict:
+        # Admin u otros roles: ver todos los precios y stocks
+        datos = self._base()
+        datos.update({
+            "stock_medellin": self.stock["medellin"],
+            "stock_guarne": self.stock["guarne"],
+            "precio_sin_iva": self.precios.get("sin_iva_colombia", 0),
+            "precio_con_iva": self.precios.get("con_iva_colombia", 0),
+            "precio_internacional": self.precios.get("internacional", 0),
+            "margenes": self.margenes
+        })
+        return datos
+
+
+class Catalogo:
+    def __init__(self):
+        self.version = None
+        self._productos = None
+        self._eliminados = []
+        self._vistas = {}
+        self._verificado_en = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _version_db(self) -> int:
+        doc = await collection_versiones.find_one({"_id": VERSION_CATALOGO})
+        return doc.get("version", 0) if doc else 0
+
+    async def _sincronizar(self):
+        if self._productos is not None and time.monotonic() - self._verificado_en < CATALOGO_VERIFICAR_SEGUNDOS:
+            return
+        async with self._lock:
+            if self._productos is not None and time.monotonic() - self._verificado_en < CATALOGO_VERIFICAR_SEGUNDOS:
+                return
+            # La versión se lee antes que los productos: si algo cambia entre
+            # ambas lecturas, la siguiente verificación vuelve a reconstruir
+            version = await self._version_db()
+            if self._productos is None or version != self.version:
+                documentos = await collection_productos.find({}, PROYECCION_CATALOGO).to_list(None)
+                self._productos = [ProductoCatalogo(doc) for doc in documentos]
+                self._eliminados = await collection_productos_eliminados.find(
+                    {}, {"_id": 0, "id": 1, "revision": 1}
+                ).to_list(None)
+                self._vistas = {}
+                self.version = version
+                CATALOGO_RECONSTRUCCIONES.inc()
+                logger.info("📚 Catálogo reconstruido: %s productos (versión %s)", len(self._productos), version)
+            self._verificado_en = time.monotonic()
+
+    async def version_actual(self) -> int:
+        await self._sincronizar()
+        return self.version
+
+    async def vista(self, tipo_precio: str = None, cdi: str = None) -> list:
+        """Lista de productos para un (tipo_precio, CDI); sin argumentos, la vista completa"""
+        await self._sincronizar()
+        clave = (tipo_precio, cdi)
+        vista = self._vistas.get(clave)
+        if vista is None:
+            if tipo_precio is None:
+                vista = [p.vista_completa() for p in self._productos]
+            else:
+                vista = [p.vista_distribuidor(tipo_precio, cdi) for p in self._productos]
+            self._vistas[clave] = vista
+        return vista
+
+    async def cambios(self, tipo_precio: str = None, cdi: str = None, desde: int = 0) -> dict:
+        """Productos modificados y eliminados con revisión posterior a `desde`"""
+        await self._sincronizar()
+        if desde > self.version:
+            # Versión desconocida (ej. base de datos restaurada): sincronización completa
+            return {"version": self.version, "completo": True,
+                    "productos": await self.vista(tipo_precio, cdi), "eliminados": []}
+
+        modificados = [p for p in self._productos if p.revision > desde]
+        # Un id eliminado y vuelto a crear se envía como modificado, no como eliminado
+        ids_actuales = {p.id for p in self._productos}
+        return {
+            "version": self.version,
+            "completo": False,
+            "productos": [
+                p.vista_completa() if tipo_precio is None else p.vista_distribuidor(tipo_precio, cdi)
+                for p in modificados
+            ],
+            "eliminados": [
+                e["id"] for e in self._eliminados
+                if e.get("revision", 0) > desde and e["id"] not in ids_actuales
+            ]
+        }
+
+    def caducar(self):
+        self._verificado_en = 0.0
+
+
+catalogo = Catalogo()
+
+
+async def siguiente_revision(session=None) -> int:
+    """Incrementa la versión del catálogo; usar dentro de la transacción de la escritura"""
+    doc = await collection_versiones.find_one_and_update(
+        {"_id": VERSION_CATALOGO},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    return doc["version"]
+
+
+def campos_revision(revision: int) -> dict:
+    return {"revision": revision, "actualizado_en": datetime.utcnow()}
+
+
+async def registrar_eliminacion(producto_id: str, revision: int, session=None):
+    await collection_productos_eliminados.update_one(
+        {"id": producto_id},
+        {"$set": {"revision": revision, "eliminado_en": datetime.utcnow()}},
+        upsert=True,
+        session=session
+    )
+
+
+async def escribir_con_revision(escritura):
+    """Ejecuta `escritura(session, revision)` en una transacción con el incremento de versión.
+
+    El contador y los documentos se confirman juntos, así que quien lea la
+    versión N ya ve todos los productos con revision <= N.
+    """
+    async def transaccion(session):
+        revision = await siguiente_revision(session)
+        return await escritura(session, revision)
+
+    async with await get_client().start_session() as session:
+        resultado = await session.with_transaction(transaccion)
+    catalogo.caducar()
+    return resultado
+
+
+async def marcar_productos_modificados(ids: list):
+    """Nueva revisión para productos ya escritos en otra transacción (ej. descuentos de stock).
+
+    El cambio ya está confirmado; esta transacción corta solo publica la
+    revisión. Un worker que recargue entre ambas ve el stock nuevo con la
+    revisión antigua y una versión menor, así que el cambio le llega igual
+    en el siguiente delta.
+    """
+    async def escritura(session, revision):
+        await collection_productos.update_many(
+            {"id": {"$in": ids}}, {"$set": campos_revision(revision)}, session=session
+        )
+
+    for intento in range(1, REVISION_INTENTOS + 1):
+        try:
+            await escribir_con_revision(escritura)
+            return
+        except Exception as e:
+            logger.warning("⚠️ Error publicando la revisión de %s (intento %s): %s", ids, intento, e)
+
+    # Último recurso: al menos la versión se mueve, así los workers recargan el
+    # stock y el ETag cambia (los clientes con delta lo verán en su próxima
+    # sincronización completa)
+    version = await invalidar_catalogo()
+    logger.error("❌ Revisión de %s no publicada; catálogo invalidado a la versión %s", ids, version)
+
+
+async def invalidar_catalogo() -> int:
+    """Marca el catálogo como modificado para todos los workers; devuelve la nueva versión"""
+    version = await siguiente_revision()
+    catalogo.caducar()
+    return version
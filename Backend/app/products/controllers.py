@@ -0,0 +1,36 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+CDIS = ("medellin", "guarne")
+
+
+def parse_stock(value):
+    """Convierte el stock a entero, manejando strings y enteros"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        logger.debug("parse_stock: value=%s -> 0 (error)", value)
+        return 0
+
+
+def normalizar_stock(stock) -> dict:
+    """Convierte cualquier formato de stock a {"medellin": int, "guarne": int}"""
+    if isinstance(stock, (int, float)):
+        stock = {"medellin": stock, "guarne": 0}
+    elif not isinstance(stock, dict):
+        stock = {}
+    return {cdi: parse_stock(stock.get(cdi)) for cdi in CDIS}
+
+
+def stock_en_cdi(stock, cdi: str) -> int:
+    return normalizar_stock(stock).get(cdi, 0)
+
+
+def stock_es_numerico(stock) -> bool:
+    """True si el stock ya tiene el formato normalizado con enteros"""
+    return (
+        isinstance(stock, dict)
+        and set(stock) == set(CDIS)
+        and all(type(stock[cdi]) is int for cdi in CDIS)
+    )
@@ -0,0 +1,141 @@
+"""Migración: normaliza el stock de todos los productos a {"medellin": int, "guarne": int}.
+
+Históricamente el stock se guardó como entero suelto, como diccionario de
+enteros o como diccionario de strings. La migración recorre los productos por
+_id en lotes y guarda un checkpoint en la colección `migraciones`, así que si se
+interrumpe se puede volver a lanzar y continúa donde quedó. Cada documento se
+reescribe condicionado al valor leído, por lo que es segura con la app en marcha.
+
+Al terminar instala un validador $jsonSchema en `productos` para que ninguna
+escritura vuelva a guardar stock con otro formato.
+
+Uso (desde Backend/):
+
+    python -m app.products.migrar_stock [--lote 500] [--reiniciar] [--sin-validador]
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from app.core.database import close_mongo_connection, connect_to_mongo, get_db
+from app.core.logs import configurar_logs
+from app.products.catalogo import invalidar_catalogo
+from app.products.controllers import normalizar_stock, stock_es_numerico
+
+logger = logging.getLogger(__name__)
+
+MIGRACION_ID = "stock_numerico"
+
+VALIDADOR_STOCK = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["stock"],
+        "properties": {
+            "stock": {
+                "bsonType": "object",
+                "required": ["medellin", "guarne"],
+                "properties": {
+                    "medellin": {"bsonType": ["int", "long"]},
+                    "guarne": {"bsonType": ["int", "long"]},
+                },
+            },
+        },
+    }
+}
+
+
+async def migrar(tamano_lote: int, reiniciar: bool):
+    db = get_db()
+    productos = db["productos"]
+    migraciones = db["migraciones"]
+
+    if reiniciar:
+        await migraciones.delete_one({"_id": MIGRACION_ID})
+
+    checkpoint = await migraciones.find_one({"_id": MIGRACION_ID}) or {}
+    ultimo_id = checkpoint.get("ultimo_id")
+    revisados = checkpoint.get("revisados", 0)
+    modificados = checkpoint.get("modificados", 0)
+    if ultimo_id:
+        logger.info("⏩ Reanudando migración desde _id %s (%s revisados)", ultimo_id, revisados)
+
+    while True:
+        filtro = {"_id": {"$gt": ultimo_id}} if ultimo_id else {}
+        lote = await productos.find(filtro, {"_id": 1, "stock": 1}).sort("_id", 1).limit(tamano_lote).to_list(None)
+        if not lote:
+            break
+
+        operaciones = [
+            UpdateOne(
+                {"_id": p["_id"], "stock": p["stock"]} if "stock" in p else {"_id": p["_id"], "stock": {"$exists": False}},
+                {"$set": {"stock": normalizar_stock(p.get("stock"))}}
+            )
+            for p in lote
+            if not stock_es_numerico(p.get("stock"))
+        ]
+        if operaciones:
+            resultado = await productos.bulk_write(operaciones, ordered=False)
+            modificados += resultado.modified_count
+            if resultado.matched_count != len(operaciones):
+                # Alguien modificó esos productos entre la lectura y la escritura;
+                # se reintentan en la siguiente ejecución con --reiniciar
+                logger.warning("⚠️ %s productos cambiaron durante el lote", len(operaciones) - resultado.matched_count)
+
+        revisados += len(lote)
+        ultimo_id = lote[-1]["_id"]
+        await migraciones.update_one(
+            {"_id": MIGRACION_ID},
+            {"$set": {
+                "ultimo_id": ultimo_id,
+                "revisados": revisados,
+                "modificados": modificados,
+                "actualizado_en": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        logger.info("📦 %s productos revisados, %s normalizados", revisados, modificados)
+
+    await migraciones.update_one(
+        {"_id": MIGRACION_ID},
+        {"$set": {"completada_en": datetime.utcnow()}},
+        upsert=True
+    )
+    logger.info("✅ Migración completada: %s productos revisados, %s normalizados", revisados, modificados)
+    if modificados:
+        await invalidar_catalogo()
+
+
+async def instalar_validador():
+    # validationLevel "moderate": documentos antiguos inválidos no bloquean
+    # actualizaciones ajenas al stock, pero toda escritura nueva se valida
+    await get_db().command({
+        "collMod": "productos",
+        "validator": VALIDADOR_STOCK,
+        "validationLevel": "moderate",
+        "validationAction": "error",
+    })
+    logger.info("🛡️ Validador de stock instalado en productos")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Normaliza el stock de los productos a enteros por CDI")
+    parser.add_argument("--lote", type=int, default=500, help="Productos por lote")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el checkpoint y empezar desde el principio")
+    parser.add_argument("--sin-validador", action="store_true", help="No instalar el validador $jsonSchema al terminar")
+    args = parser.parse_args()
+
+    configurar_logs(formato="texto")
+    await connect_to_mongo()
+    try:
+        await migrar(args.lote, args.reiniciar)
+        if not args.sin_validador:
+            await instalar_validador()
+    finally:
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
+from app.core.respuestas import Numero, ObjectIdStr
 
 
 class ProductCreate(BaseModel):
@@ -44,3 +45,48 @@ class ProductoUpdate(BaseModel):
     activo: Optional[bool] = None
     creado_en: Optional[datetime] = None
     actualizado_en: Optional[datetime] = None
+
+
+# MODELOS DE RESPUESTA PARA PRODUCTOS
+class ProductoDisponible(BaseModel):
+    """Producto del catálogo en memoria (vista de distribuidor o vista completa)"""
+    id: str
+    nombre: Optional[str] = None
+    categoria: Optional[str] = None
+    descripcion: Optional[str] = None
+    imagen: Optional[str] = None
+    activo: Optional[bool] = None
+    tipo_codigo: Optional[Union[int, str]] = None
+    descuento: Optional[Numero] = None
+    # Vista de distribuidor
+    stock: Optional[Numero] = None
+    precio: Optional[Numero] = None
+    tipo_precio: Optional[str] = None
+    # Vista completa
+    stock_medellin: Optional[Numero] = None
+    stock_guarne: Optional[Numero] = None
+    precio_sin_iva: Optional[Numero] = None
+    precio_con_iva: Optional[Numero] = None
+    precio_internacional: Optional[Numero] = None
+    margenes: Optional[Dict[str, Any]] = None
+
+
+class CambiosCatalogo(BaseModel):
+    version: int
+    completo: bool
+    productos: List[ProductoDisponible]
+    eliminados: List[str]
+
+
+class ProductoDocumento(BaseModel):
+    """Documento de producto tal como está en Mongo (listado de admin y bodega)"""
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    mongo_id: ObjectIdStr = Field(alias="_id")
+    id: Optional[str] = None
+    admin_id: Optional[ObjectIdStr] = None
+    nombre: Optional[str] = None
+    categoria: Optional[str] = None
+    precios: Optional[Dict[str, Any]] = None
+    stock: Optional[Dict[str, Numero]] = None
+    activo: Optional[bool] = None
@@ -1,44 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from pydantic import ValidationError
 from datetime import datetime
-from typing import Dict
-from app.auth.routes import get_current_user
+from typing import Dict, List, Optional, Union
+from app.auth.routes import get_current_user, get_principal
+from app.auth.models import Principal
 from bson import ObjectId
 from app.core.database import ( 
-    collection_productos, collection_admin,
-    collection_distribuidores,
-    collection_bodegas
+    collection_productos
 )
+from app.products.controllers import normalizar_stock
+from app.core.http_cache import (
+    CACHE_MAX_AGE_DISTRIBUIDOR,
+    aplicar_cabeceras,
+    cache_control,
+    calcular_etag,
+    etag_coincide,
+    respuesta_no_modificada
+)
+from app.products.catalogo import catalogo, campos_revision, escribir_con_revision, registrar_eliminacion
 from app.products.models import ( 
+    CambiosCatalogo,
     ProductCreate,
+    ProductoDisponible,
+    ProductoDocumento,
     ProductoUpdate
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # Endpoint para obtener productos disponibles
-@router.get("/productos/disponibles")
+@router.get(
+    "/productos/disponibles",
+    response_model=Union[List[ProductoDisponible], CambiosCatalogo],
+    response_model_exclude_unset=True
+)
 async def obtener_productos_disponibles(
-    current_user: Dict = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    since: Optional[int] = Query(None, ge=0, description="Versión del catálogo que ya tiene el cliente"),
+    principal: Principal = Depends(get_principal)
 ):
     try:
-        print("📢 Iniciando obtención de productos disponibles")
+        logger.debug("📢 Iniciando obtención de productos disponibles")
 
         cdi = None
         tipo_precio = None
 
         # Detectar si es distribuidor
-        if current_user["rol"].startswith("distribuidor"):
-            print(f"🔍 Buscando distribuidor: {current_user['email']}")
-            distribuidor = await collection_distribuidores.find_one(
-                {"correo_electronico": current_user["email"]}
-            )
-            if not distribuidor:
-                raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-
-            tipo_precio = distribuidor.get("tipo_precio")
-            cdi = distribuidor.get("cdi", "").lower()
-            print(f"📢 Tipo de precio: {tipo_precio}, CDI: {cdi}")
+        if principal.es_distribuidor:
+            tipo_precio = principal.tipo_precio
+            cdi = principal.cdi
+            logger.debug("📢 Tipo de precio: %s, CDI: %s", tipo_precio, cdi)
 
             if not tipo_precio or not cdi:
                 raise HTTPException(
@@ -46,69 +61,40 @@ async def obtener_productos_disponibles(
                     detail="El distribuidor no tiene configurado tipo_precio o CDI"
                 )
 
-        # Obtener productos
-        productos = await collection_productos.find({}).to_list(200)
-
-        productos_response = []
-        for producto in productos:
-            precios = producto.get("precios", {})
-            stock_data = producto.get("stock", {})
-            
-            # Convertir stock a diccionario si es un número
-            if isinstance(stock_data, (int, float)):
-                stock_data = {"medellin": stock_data, "guarne": 0}
-
-            producto_data = {
-                "id": producto["id"],  # Usamos el campo id personalizado
-                "nombre": producto["nombre"],
-                "categoria": producto["categoria"],
-                "descripcion": producto.get("descripcion", ""),
-                "imagen": producto.get("imagen", ""),
-                "activo": producto.get("activo", True),
-                "tipo_codigo": producto.get("tipo_codigo", ""),
-                "descuento": producto.get("descuento", 0)
-            }
-
-            # Filtrar precios y stock según rol
-            if current_user["rol"].startswith("distribuidor"):
-                # Stock por CDI
-                producto_data["stock"] = stock_data.get(cdi, 0)
-
-                # Asignar precio según tipo_precio
-                if tipo_precio == "sin_iva":
-                    producto_data["precio"] = precios.get("sin_iva_colombia", 0)
-                    producto_data["tipo_precio"] = "sin_iva"
-                elif tipo_precio == "con_iva":
-                    producto_data["precio"] = precios.get("con_iva_colombia", 0)
-                    producto_data["tipo_precio"] = "con_iva"
-                elif tipo_precio == "sin_iva_internacional":
-                    producto_data["precio"] = precios.get("internacional", 0)
-                    producto_data["tipo_precio"] = "sin_iva_internacional"
-
-            else:
-                # Admin u otros roles: ver todos los precios y stocks
-                producto_data.update({
-                    "stock_medellin": stock_data.get("medellin", 0),
-                    "stock_guarne": stock_data.get("guarne", 0),
-                    "precio_sin_iva": precios.get("sin_iva_colombia", 0),
-                    "precio_con_iva": precios.get("con_iva_colombia", 0),
-                    "precio_internacional": precios.get("internacional", 0),
-                    "margenes": producto.get("margenes", {})
-                })
-
-            productos_response.append(producto_data)
-
-        return productos_response
-
+        # ETag por versión del catálogo y vista: si el cliente ya la tiene, 304 sin serializar nada
+        version = await catalogo.version_actual()
+        etag = calcular_etag("disponibles", version, tipo_precio, cdi, since)
+        control = cache_control(principal.rol, CACHE_MAX_AGE_DISTRIBUIDOR)
+        if etag_coincide(request, etag):
+            return respuesta_no_modificada(etag, control)
+        aplicar_cabeceras(response, etag, control)
+
+        # Con `since` solo se devuelve lo modificado o eliminado después de esa versión
+        if since is not None:
+            cambios = await catalogo.cambios(tipo_precio, cdi, desde=since)
+            response.headers["X-Catalogo-Version"] = str(cambios["version"])
+            return cambios
+
+        # Vista materializada del catálogo en memoria (todo el catálogo, sin tope)
+        productos = await catalogo.vista(tipo_precio, cdi)
+        response.headers["X-Catalogo-Version"] = str(catalogo.version)
+        return productos
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error al obtener productos: {str(e)}")
+        logger.error("❌ Error al obtener productos: %s", str(e))
         raise HTTPException(status_code=500, detail=f"Error al obtener productos: {str(e)}")    
 
 # Endpoint para obtener productos
-@router.get("/productos/")
-async def obtener_productos(current_user: dict = Depends(get_current_user)):
+@router.get("/productos/", response_model=List[ProductoDocumento], response_model_exclude_unset=True)
+async def obtener_productos(
+    request: Request,
+    response: Response,
+    principal: Principal = Depends(get_principal)
+):
     # --- Validar permisos ---
-    if current_user["rol"] not in ["Admin", "bodega"]:
+    if principal.rol not in ["Admin", "bodega"]:
         raise HTTPException(
             status_code=403,
             detail="Solo los administradores o usuarios de bodega pueden ver los productos"
@@ -116,34 +102,32 @@ async def obtener_productos(current_user: dict = Depends(get_current_user)):
 
     # --- Construir filtro según rol ---
     filtro = {}
-    if current_user["rol"] == "Admin":
-        admin = await collection_admin.find_one({"correo_electronico": current_user["email"]})
-        if not admin:
-            raise HTTPException(status_code=404, detail="Administrador no encontrado")
-        filtro["admin_id"] = str(admin["_id"])
+    cdi = None
+    if principal.rol == "Admin":
+        filtro["admin_id"] = principal.id
+    else:
+        # El CDI de la bodega se valida una sola vez, no por cada producto
+        cdi = principal.cdi
+        if not cdi:
+            raise HTTPException(status_code=404, detail="Bodega no encontrada o sin CDI asignado")
+        if cdi not in ["medellin", "guarne"]:
+            raise HTTPException(status_code=400, detail="CDI de bodega no válido")
+
+    # --- GET condicional: la versión del catálogo cubre toda escritura de productos ---
+    etag = calcular_etag("productos", await catalogo.version_actual(), principal.rol, filtro.get("admin_id"), cdi)
+    if etag_coincide(request, etag):
+        return respuesta_no_modificada(etag)
+    aplicar_cabeceras(response, etag)
 
     # --- Obtener productos ---
     productos = await collection_productos.find(filtro).to_list(100)
 
     for producto in productos:
-        producto["_id"] = str(producto["_id"])
-
-        # Asegurar estructura de stock
-        if isinstance(producto.get("stock"), int):
-            producto["stock"] = {"medellin": producto["stock"], "guarne": 0}
-        elif "stock" not in producto:
-            producto["stock"] = {"medellin": 0, "guarne": 0}
+        # Asegurar estructura de stock (valores antiguos como "" o None pasan a 0)
+        producto["stock"] = normalizar_stock(producto.get("stock"))
 
         # --- Reglas para usuarios bodega ---
-        if current_user["rol"] == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": current_user["email"]})
-            if not bodega or "cdi" not in bodega:
-                raise HTTPException(status_code=404, detail="Bodega no encontrada o sin CDI asignado")
-
-            cdi = bodega["cdi"].lower()
-            if cdi not in ["medellin", "guarne"]:
-                raise HTTPException(status_code=400, detail="CDI de bodega no válido")
-
+        if cdi:
             # Filtrar stock según CDI
             producto["stock"] = {cdi: producto["stock"].get(cdi, 0)}
 
@@ -168,24 +152,17 @@ async def obtener_productos(current_user: dict = Depends(get_current_user)):
 async def actualizar_producto(
     producto_id: str,
     producto_data: ProductoUpdate,
-    current_user: dict = Depends(get_current_user)
+    principal: Principal = Depends(get_principal)
 ):
     # 1. Verificar permisos de administrador
-    if current_user["rol"] != "Admin":
+    if principal.rol != "Admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los administradores pueden modificar productos"
         )
 
-    # 2. Obtener el administrador autenticado
-    admin = await collection_admin.find_one({"correo_electronico": current_user["email"]})
-    if not admin:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Administrador no encontrado"
-        )
-
-    admin_id = str(admin["_id"])
+    # 2. Administrador autenticado (perfil cacheado)
+    admin_id = principal.id
 
     # 3. Construir filtro de búsqueda flexible (ObjectId o id personalizado)
     filtro = {"admin_id": admin_id}
@@ -227,24 +204,40 @@ async def actualizar_producto(
             if value is not None:
                 update_data[f"margenes.{key}"] = value
 
+    # El stock se actualiza por CDI y siempre como entero
+    if 'stock' in producto_dict and producto_dict['stock']:
+        for cdi, value in producto_dict['stock'].items():
+            if value is not None:
+                update_data[f"stock.{cdi}"] = int(value)
+
     # 7. Manejar campos directos
-    campos_directos = ['nombre', 'categoria', 'stock']
+    campos_directos = ['nombre', 'categoria']
     for campo in campos_directos:
         if campo in producto_dict and producto_dict[campo] is not None:
             update_data[campo] = producto_dict[campo]
 
-    # 8. Realizar la actualización en MongoDB
-    result = await collection_productos.update_one(
-        filtro,
-        {"$set": update_data}
-    )
+    # 8. Realizar la actualización en MongoDB (con nueva revisión del catálogo)
+    async def actualizar(session, revision):
+        result = await collection_productos.update_one(
+            filtro,
+            {"$set": update_data},
+            session=session
+        )
 
-    if result.modified_count == 0:
-        raise HTTPException(
-            status_code=status.HTTP_304_NOT_MODIFIED,
-            detail="No se realizaron cambios en el producto"
+        if result.modified_count == 0:
+            raise HTTPException(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                detail="No se realizaron cambios en el producto"
+            )
+
+        await collection_productos.update_one(
+            {"_id": producto["_id"]},
+            {"$set": campos_revision(revision)},
+            session=session
         )
 
+    await escribir_con_revision(actualizar)
+
     return {
         "mensaje": "Producto actualizado correctamente",
         "producto_id": producto_id
@@ -262,8 +255,12 @@ async def eliminar_producto(producto_id: str, current_user: Dict = Depends(get_c
     if not producto_existente:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
-    # Eliminar el producto
-    await collection_productos.delete_one({"id": producto_id})
+    # Eliminar el producto y dejar la marca para la sincronización incremental
+    async def eliminar(session, revision):
+        await collection_productos.delete_one({"id": producto_id}, session=session)
+        await registrar_eliminacion(producto_id, revision, session=session)
+
+    await escribir_con_revision(eliminar)
 
     return {"message": "Producto eliminado exitosamente"}
 
@@ -271,12 +268,12 @@ async def eliminar_producto(producto_id: str, current_user: Dict = Depends(get_c
 @router.post("/productoss/", status_code=status.HTTP_201_CREATED)
 async def crear_producto(
     producto_data: dict,
-    current_user: dict = Depends(get_current_user)
+    principal: Principal = Depends(get_principal)
 ):
-    print("📢 Iniciando creación de producto")
+    logger.debug("📢 Iniciando creación de producto")
 
     # 1. Verificar permisos (solo admin)
-    if current_user["rol"] != "Admin":
+    if principal.rol != "Admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo administradores pueden crear productos"
@@ -291,15 +288,8 @@ async def crear_producto(
             detail=e.errors()
         )
 
-    # 3. Obtener admin
-    admin = await collection_admin.find_one({"correo_electronico": current_user["email"]})
-    if not admin:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Administrador no encontrado"
-        )
-
-    admin_id = str(admin["_id"])
+    # 3. Administrador autenticado (perfil cacheado)
+    admin_id = principal.id
 
     # 4. Generar ID secuencial desde la colección de productos
     ultimo_producto = await collection_productos.find_one(
@@ -323,14 +313,19 @@ async def crear_producto(
             "internacional": float(producto.precio_internacional),
             "fecha_actualizacion": datetime.now()
         },
-        "stock": int(producto.stock),
+        "stock": normalizar_stock(int(producto.stock)),
         "activo": True,
         "creado_en": datetime.now()
     }
 
+    async def insertar(session, revision):
+        return await collection_productos.insert_one(
+            {**nuevo_producto, **campos_revision(revision)}, session=session
+        )
+
     # 6. Insertar en MongoDB
     try:
-        result = await collection_productos.insert_one(nuevo_producto)
+        result = await escribir_con_revision(insertar)
         if not result.inserted_id:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,16 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.auth.routes import get_current_user
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.auth.routes import get_principal
+from app.auth.models import Principal
+from app.auth.controllers import filtro_cdi_bodega, alcance_visibilidad
+from app.core.singleflight import single_flight
 from datetime import datetime
+from typing import Optional
 from bson import ObjectId
-from app.orders.routes import enviar_correo
+from pymongo import UpdateOne
+from app.core.outbox import correo, encolar_correos
+from app.orders.contadores import ESTADO_ORDEN_CREADA, leer_contadores, registrar_transicion
+from app.orders.controllers import (
+    CAMPOS_LISTADO_PEDIDOS,
+    LIMITE_PAGINA_DEFECTO,
+    LIMITE_PAGINA_MAXIMO,
+    RESUMEN_LISTADO_PEDIDOS,
+    listar_pedidos_paginados
+)
+from app.core.campos import DESCRIPCION_FIELDS, campos_solicitados, proyeccion
+from app.orders.models import PaginaPedidos
+from app.products.controllers import normalizar_stock, stock_en_cdi
+from app.products.catalogo import marcar_productos_modificados
 from app.core.database import (
+    get_client,
     collection_productos,
     collection_pedidos,
-    collection_bodegas,
     collection_distribuidores,
     collection_ordenes
 )
 
+logger = logging.getLogger(__name__)
+
 
 router = APIRouter()
 
@@ -18,41 +38,30 @@ router = APIRouter()
 STOCK_BAJO_MIN = 1
 STOCK_BAJO_MAX = 40
 
+
 @router.get("/dashboard")
-async def get_dashboard_bodega(current_user: dict = Depends(get_current_user)):
-    print("current_user:", current_user)
-    email = current_user["email"]
-    rol = current_user["rol"]
-    print("email:", email)
-    print("rol:", rol)
+@single_flight("store_dashboard", lambda principal, **_: alcance_visibilidad(principal))
+async def get_dashboard_bodega(principal: Principal = Depends(get_principal)):
+    email = principal.email
+    rol = principal.rol
+    logger.debug("email: %s", email)
+    logger.debug("rol: %s", rol)
 
     # Para admin se muestra todo
     if rol == "Admin":
         total_productos = await collection_productos.count_documents({})
-        print("total_productos (Admin):", total_productos)
+        logger.debug("total_productos (Admin): %s", total_productos)
 
-        # ✅ CORREGIDO: Buscar en collection_ordenes
-        # Pedidos Medellín (con IVA o sin IVA)
-        ordenes_pendientes_medellin = await collection_ordenes.count_documents(
-            {"estado": "Orden de compra creada", "tipo_precio": {"$in": ["con_iva", "sin_iva"]}}
-        )
+        # Órdenes pendientes por CDI desde los contadores de estado (O(1))
+        pendientes = await leer_contadores("purchase_orders", ESTADO_ORDEN_CREADA, ["medellin", "guarne"])
+        ordenes_pendientes_medellin = pendientes["medellin"]
+        ordenes_pendientes_guarne = pendientes["guarne"]
 
-        # Pedidos Guarne (sin IVA internacional)
-        ordenes_pendientes_guarne = await collection_ordenes.count_documents(
-            {"estado": "Orden de compra creada", "tipo_precio": "sin_iva_internacional"}
-        )
-
-        # Productos con bajo stock
+        # Productos con bajo stock (consultas por rango sobre los índices de stock)
         stock_bajo_cursor = collection_productos.find(
             {"$or": [
-                {"$expr": {"$and": [
-                    {"$gte": [{"$toInt": "$stock.medellin"}, 1]},
-                    {"$lte": [{"$toInt": "$stock.medellin"}, 40]}
-                ]}},
-                {"$expr": {"$and": [
-                    {"$gte": [{"$toInt": "$stock.guarne"}, 1]},
-                    {"$lte": [{"$toInt": "$stock.guarne"}, 40]}
-                ]}}
+                {"stock.medellin": {"$gte": STOCK_BAJO_MIN, "$lte": STOCK_BAJO_MAX}},
+                {"stock.guarne": {"$gte": STOCK_BAJO_MIN, "$lte": STOCK_BAJO_MAX}}
             ]},
             {"_id": 0, "id": 1, "nombre": 1, "stock": 1}
         )
@@ -60,8 +69,8 @@ async def get_dashboard_bodega(current_user: dict = Depends(get_current_user)):
         # Productos sin stock
         sin_stock_cursor = collection_productos.find(
             {"$or": [
-                {"$expr": {"$eq": [{"$toInt": "$stock.medellin"}, 0]}},
-                {"$expr": {"$eq": [{"$toInt": "$stock.guarne"}, 0]}}
+                {"stock.medellin": 0},
+                {"stock.guarne": 0}
             ]},
             {"_id": 0, "id": 1, "nombre": 1, "stock": 1}
         )
@@ -79,40 +88,31 @@ async def get_dashboard_bodega(current_user: dict = Depends(get_current_user)):
             }
         }
 
-    # Para bodegas específicas
-    bodega = await collection_bodegas.find_one({"correo_electronico": email})
-    if not bodega:
+    # Para bodegas específicas (el resto de roles no tiene dashboard)
+    if rol != "bodega":
         raise HTTPException(status_code=404, detail="Bodega no encontrada")
+    filtro_cdi_bodega(principal)
 
-    cdi = bodega.get("cdi")  # "medellin" o "guarne"
-    print("cdi:", cdi)
+    cdi = principal.cdi  # "medellin" o "guarne"
+    logger.debug("cdi: %s", cdi)
 
     total_productos = await collection_productos.count_documents({})
-    print("total_productos (bodega):", total_productos)
+    logger.debug("total_productos (bodega): %s", total_productos)
 
-    # ✅ CORREGIDO: Buscar en collection_ordenes
-    # Ordenes pendientes según bodega
-    if cdi == "medellin":
-        ordenes_pendientes = await collection_ordenes.count_documents(
-            {"estado": "Orden de compra creada", "tipo_precio": {"$in": ["con_iva", "sin_iva"]}}
-        )
-    else:  # guarne
-        ordenes_pendientes = await collection_ordenes.count_documents(
-            {"estado": "Orden de compra creada", "tipo_precio": "sin_iva_internacional"}
-        )
+    # Ordenes pendientes según bodega, desde los contadores de estado
+    cdi_pendientes = "medellin" if cdi == "medellin" else "guarne"
+    pendientes = await leer_contadores("purchase_orders", ESTADO_ORDEN_CREADA, [cdi_pendientes])
+    ordenes_pendientes = pendientes[cdi_pendientes]
 
     # Productos con bajo stock
     stock_bajo_cursor = collection_productos.find(
-        {"$expr": {"$and": [
-            {"$gte": [{"$toInt": f"$stock.{cdi}"}, 1]},
-            {"$lte": [{"$toInt": f"$stock.{cdi}"}, 40]}
-        ]}},
+        {f"stock.{cdi}": {"$gte": STOCK_BAJO_MIN, "$lte": STOCK_BAJO_MAX}},
         {"_id": 0, "id": 1, "nombre": 1, f"stock.{cdi}": 1}
     )
 
     # Productos sin stock
     sin_stock_cursor = collection_productos.find(
-        {"$expr": {"$eq": [{"$toInt": f"$stock.{cdi}"}, 0]}},
+        {f"stock.{cdi}": 0},
         {"_id": 0, "id": 1, "nombre": 1, f"stock.{cdi}": 1}
     )
 
@@ -130,37 +130,35 @@ async def get_dashboard_bodega(current_user: dict = Depends(get_current_user)):
 async def procesar_pedido(
     orden_id: str,
     data: dict,
-    current_user: dict = Depends(get_current_user)
+    principal: Principal = Depends(get_principal)
 ):
-    print(f"Procesando pedido para orden_id: {orden_id}")
-    print(f"Usuario actual: {current_user}")
-    print(f"Data recibida: {data}")
+    logger.debug("Procesando pedido para orden_id: %s", orden_id)
+    logger.debug("Usuario actual: %s (%s)", principal.email, principal.rol)
+    logger.debug("Data recibida: %s", data)
 
     # 🔍 Buscar la orden en la colección de órdenes
     orden = await collection_ordenes.find_one({"id": orden_id})
     if not orden:
         raise HTTPException(status_code=404, detail="Orden no encontrada")
-    print(f"✅ Orden encontrada: {orden['id']}")
+    logger.debug("✅ Orden encontrada: %s", orden['id'])
 
     productos_actualizados = []
     subtotal, iva_total, total_orden = 0, 0, 0
     tipo_precio = orden.get("tipo_precio", "sin_iva")
-    print(f"💰 Tipo de precio: {tipo_precio}")
+    logger.debug("💰 Tipo de precio: %s", tipo_precio)
 
     # Productos originales de la orden
     productos_orden_original = orden.get("productos", [])
 
-    # 🔄 Obtener la bodega del usuario
-    bodega_usuario = await collection_bodegas.find_one(
-        {"correo_electronico": current_user["email"]}
-    )
-    if not bodega_usuario:
+    # 🔄 Bodega del usuario (perfil cacheado)
+    if principal.rol != "bodega":
         raise HTTPException(status_code=404, detail="Bodega no encontrada para el usuario")
 
-    cdi_bodega = bodega_usuario.get("cdi")
-    print(f"🏭 Bodega procesando: {cdi_bodega}")
+    cdi_bodega = principal.cdi
+    logger.debug("🏭 Bodega procesando: %s", cdi_bodega)
 
     # 🔄 Procesar productos
+    descuentos = {}  # producto_id -> unidades a descontar del stock de la bodega
     for p_data in data.get("productos", []):
         producto_id = p_data["id"]
 
@@ -170,10 +168,10 @@ async def procesar_pedido(
             None
         )
         if not producto_completo:
-            print(f"⚠️ Producto {producto_id} no encontrado en orden original")
+            logger.warning("⚠️ Producto %s no encontrado en orden original", producto_id)
             continue
 
-        print(f"🛍️ Procesando producto: {producto_completo}")
+        logger.debug("🛍️ Procesando producto: %s", producto_completo)
 
         if "cantidad_final" not in p_data:
             raise HTTPException(
@@ -184,38 +182,11 @@ async def procesar_pedido(
         cantidad_final = int(p_data["cantidad_final"])
         precio = float(p_data.get("precio", producto_completo.get("precio", 0)))
         iva_unitario = float(p_data.get("iva_unitario", producto_completo.get("iva_unitario", 0)))
-        nombre = producto_completo.get("nombre", "Producto sin nombre")
         cantidad_solicitada = producto_completo.get("cantidad", 0)
 
-        # 📦 Stock actual en la bodega
-        producto_db = await collection_productos.find_one({"id": producto_id})
-        if not producto_db:
-            raise HTTPException(status_code=404, detail=f"Producto {producto_id} no encontrado en inventario")
-
-        stock_actual = producto_db.get("stock", {}).get(cdi_bodega, "0")
-        try:
-            stock_actual = int(stock_actual) if isinstance(stock_actual, str) else int(stock_actual)
-        except (ValueError, TypeError):
-            stock_actual = 0
-
-        print(f"📦 Stock actual de {producto_id} en {cdi_bodega}: {stock_actual}")
-
-        # ⚠️ Verificar stock solo si cantidad_final > 0
-        if cantidad_final > 0 and cantidad_final > stock_actual:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Stock insuficiente para {nombre}. Disponible: {stock_actual}, solicitado: {cantidad_final}"
-            )
-
-        # ✅ Solo actualizar stock y cálculos si cantidad_final > 0
+        # ✅ Solo descontar stock y calcular totales si cantidad_final > 0
         if cantidad_final > 0:
-            # Restar solo lo procesado (cantidad_final)
-            nuevo_stock = stock_actual - cantidad_final
-            await collection_productos.update_one(
-                {"id": producto_id},
-                {"$set": {f"stock.{cdi_bodega}": str(nuevo_stock)}}
-            )
-            print(f"📦 Stock actualizado: {producto_id} en {cdi_bodega} de {stock_actual} a {nuevo_stock}")
+            descuentos[producto_id] = descuentos.get(producto_id, 0) + cantidad_final
 
             # ✅ Cálculos
             total_producto = precio * cantidad_final
@@ -236,12 +207,13 @@ async def procesar_pedido(
         
         productos_actualizados.append(producto_actualizado)
 
-    print(f"📦 Productos actualizados: {productos_actualizados}")
-    print(f"🧮 Subtotal: {subtotal}, IVA total: {iva_total}, Total orden: {total_orden}")
+    logger.debug("📦 Productos actualizados: %s", productos_actualizados)
+    logger.debug("🧮 Subtotal: %s, IVA total: %s, Total orden: %s", subtotal, iva_total, total_orden)
 
     # Obtener notas originales y notas de procesamiento
     notas_orden_original = orden.get("notas", "")  # ← Notas originales de la orden
     notas_procesamiento = data.get("notas", "")    # ← Notas del procesamiento
+    fecha_procesado = datetime.utcnow()
 
     # Crear pedido final con AMBAS notas
     pedido_final = {
@@ -251,32 +223,119 @@ async def procesar_pedido(
         "iva": iva_total,
         "total": total_orden,
         "estado": "Pedido creado",
-        "fecha_procesado": datetime.utcnow(),
+        "fecha_procesado": fecha_procesado,
         "notas_orden_original": notas_orden_original,  # ← Notas originales
         "notas_procesamiento": notas_procesamiento,    # ← Notas del procesamiento
-        "procesado_por": current_user["email"],
-        "bodega_procesadora": cdi_bodega
+        "procesado_por": principal.email,
+        "bodega_procesadora": cdi_bodega,
+        "revision": 1  # Se incrementa en cada cambio; base del ETag del detalle
     }
 
     if "_id" in pedido_final:
         del pedido_final["_id"]
 
-    # Guardar en colección pedidos
-    result_insert = await collection_pedidos.insert_one(pedido_final)
-    print(f"📝 Pedido insertado en collection_pedidos con ID: {result_insert.inserted_id}")
-
-    # Actualizar estado de la orden original
-    await collection_ordenes.update_one(
-        {"id": orden_id},
-        {"$set": {
-            "estado": "Pedido creado",
-            "fecha_procesado": datetime.utcnow(),
-            "procesado_por": current_user["email"],
-            "bodega_procesadora": cdi_bodega,
-            "notas_procesamiento": notas_procesamiento  # ← También guardar notas de procesamiento en la orden
-        }}
-    )
-    print(f"✅ Estado de orden {orden_id} actualizado a 'Pedido creado'")
+    resultado = {}
+
+    async def registrar_pedido(session):
+        # 📦 Stock actual de todos los productos a descontar, en una sola consulta
+        productos_db = {
+            p["id"]: p
+            async for p in collection_productos.find(
+                {"id": {"$in": list(descuentos)}},
+                {"_id": 0, "id": 1, "nombre": 1, "stock": 1},
+                session=session
+            )
+        }
+
+        faltantes = [producto_id for producto_id in descuentos if producto_id not in productos_db]
+        if faltantes:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Productos no encontrados en inventario: {', '.join(faltantes)}"
+            )
+
+        operaciones = []
+        insuficientes = []
+        for producto_id, cantidad in descuentos.items():
+            stock = productos_db[producto_id].get("stock")
+            stock_actual = stock_en_cdi(stock, cdi_bodega)
+            if cantidad > stock_actual:
+                insuficientes.append(
+                    f"{productos_db[producto_id].get('nombre', producto_id)} "
+                    f"(disponible: {stock_actual}, solicitado: {cantidad})"
+                )
+                continue
+
+            if isinstance(stock, dict) and isinstance(stock.get(cdi_bodega), int):
+                # Descuento atómico: solo aplica si sigue habiendo stock suficiente
+                operaciones.append(UpdateOne(
+                    {"id": producto_id, f"stock.{cdi_bodega}": {"$gte": cantidad}},
+                    {"$inc": {f"stock.{cdi_bodega}": -cantidad}}
+                ))
+            else:
+                # Stock en formato antiguo (entero suelto o strings): se reescribe
+                # normalizado, condicionado a que no haya cambiado desde la lectura
+                nuevo_stock = normalizar_stock(stock)
+                nuevo_stock[cdi_bodega] -= cantidad
+                operaciones.append(UpdateOne(
+                    {"id": producto_id, "stock": stock},
+                    {"$set": {"stock": nuevo_stock}}
+                ))
+
+        # ⚠️ Reportar todas las líneas sin stock suficiente en una sola respuesta
+        if insuficientes:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Stock insuficiente para: {'; '.join(insuficientes)}"
+            )
+
+        if operaciones:
+            resultado_bulk = await collection_productos.bulk_write(operaciones, ordered=False, session=session)
+            if resultado_bulk.matched_count != len(operaciones):
+                raise HTTPException(
+                    status_code=409,
+                    detail="El stock cambió mientras se procesaba el pedido, intenta de nuevo"
+                )
+
+        # Actualizar estado de la orden original, solo si nadie la procesó antes
+        resultado_orden = await collection_ordenes.update_one(
+            {"id": orden_id, "estado": orden.get("estado")},
+            {"$set": {
+                "estado": "Pedido creado",
+                "fecha_procesado": fecha_procesado,
+                "procesado_por": principal.email,
+                "bodega_procesadora": cdi_bodega,
+                "notas_procesamiento": notas_procesamiento  # ← También guardar notas de procesamiento en la orden
+            }},
+            session=session
+        )
+        if resultado_orden.matched_count == 0:
+            raise HTTPException(status_code=409, detail="La orden ya fue procesada")
+
+        # Guardar en colección pedidos
+        result_insert = await collection_pedidos.insert_one(dict(pedido_final), session=session)
+        resultado["inserted_id"] = result_insert.inserted_id
+
+        # Contadores de estado: la orden sale de su estado y nace el pedido
+        await registrar_transicion(
+            "purchase_orders", orden.get("tipo_precio"), orden.get("estado"), "Pedido creado", session=session
+        )
+        await registrar_transicion("pedidos", orden.get("tipo_precio"), nuevo=pedido_final["estado"], session=session)
+
+    # Descuento de stock, pedido y estado de la orden en una sola transacción
+    async with await get_client().start_session() as session:
+        await session.with_transaction(registrar_pedido)
+
+    # Nueva revisión del catálogo para los productos descontados, fuera de la transacción
+    # del pedido: el contador de versión es un único documento y dentro de ella cada
+    # pedido concurrente (o edición de producto) chocaría con los demás
+    # (reintenta y, si no lo consigue, invalida la versión del catálogo)
+    if descuentos:
+        await marcar_productos_modificados(list(descuentos))
+
+    logger.debug("📦 Stock descontado en %s: %s", cdi_bodega, descuentos)
+    logger.debug("📝 Pedido insertado en collection_pedidos con ID: %s", resultado['inserted_id'])
+    logger.debug("✅ Estado de orden %s actualizado a 'Pedido creado'", orden_id)
 
     # 📧 Datos para correo
     orden_compra_id = pedido_final["id"]
@@ -284,7 +343,7 @@ async def procesar_pedido(
     distribuidor_phone = orden.get("distribuidor_phone", orden.get("distribuidor_telefono", ""))
     fecha_orden = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    print(f"📧 Datos para correo: orden_compra_id={orden_compra_id}, distribuidor_nombre={distribuidor_nombre}")
+    logger.debug("📧 Datos para correo: orden_compra_id=%s, distribuidor_nombre=%s", orden_compra_id, distribuidor_nombre)
 
     estilo_correo = """
     <style>
@@ -444,63 +503,59 @@ async def procesar_pedido(
     </html>
     """
 
-    # ✅ CORREGIDO: Enviar los TRES correos como en el otro endpoint
-    print("📤 Enviando correo a admin...")
-    enviar_correo(
-        "tesoreria@rizosfelices.co",
-        f"📦 Nuevo Pedido: {orden_compra_id} - {distribuidor_nombre}",
-        mensaje_admin
-    )
-
     # ✅ CORREGIDO: Obtener CDI del distribuidor (no de la orden)
     distribuidor_info = await collection_distribuidores.find_one({"_id": ObjectId(orden["distribuidor_id"])})
     cdi_distribuidor = distribuidor_info.get("cdi", "").lower() if distribuidor_info else ""
     
-    print(f"🏢 CDI distribuidor: {cdi_distribuidor}")
+    logger.debug("🏢 CDI distribuidor: %s", cdi_distribuidor)
     correos_cdi = {
         "medellin": "cdimedellin@rizosfelices.co",
         "guarne": "produccion@rizosfelices.co"
     }
     correo_cdi = correos_cdi.get(cdi_distribuidor)
-    print(f"📧 Correo CDI: {correo_cdi}")
-    
+    logger.debug("📧 Correo CDI: %s", correo_cdi)
+
+    # ✅ Encolar los TRES correos como en el otro endpoint (admin, CDI y DISTRIBUIDOR)
+    correos = [correo(
+        "tesoreria@rizosfelices.co",
+        f"📦 Nuevo Pedido: {orden_compra_id} - {distribuidor_nombre}",
+        mensaje_admin
+    )]
     if correo_cdi:
-        print("📤 Enviando correo a CDI...")
-        enviar_correo(
+        correos.append(correo(
             correo_cdi,
             f"📦 Pedido (CDI {cdi_distribuidor.capitalize()}): {orden_compra_id} - {distribuidor_nombre}",
             mensaje_admin
-        )
-
-    # ✅ CORREGIDO: Enviar correo al DISTRIBUIDOR (no al usuario actual)
-    print("📤 Enviando correo a distribuidor...")
-    enviar_correo(
+        ))
+    correos.append(correo(
         distribuidor_info.get("correo_electronico", "") if distribuidor_info else orden.get("distribuidor_email", ""),
         f"✅ Confirmación de Pedido: {orden_compra_id}",
         mensaje_distribuidor
-    )
+    ))
+    await encolar_correos(correos)
 
-    print("✅ Pedido procesado correctamente y todos los correos enviados.")
+    logger.debug("✅ Pedido procesado correctamente y todos los correos encolados.")
     return {
         "message": "Pedido procesado y correos enviados",
-        "pedido": {**pedido_final, "_id": str(result_insert.inserted_id)}
+        "pedido": {**pedido_final, "_id": str(resultado["inserted_id"])}
     }
     
-@router.get("/get-all-orders/")
-async def obtener_ordenes(current_user: dict = Depends(get_current_user)):
+@router.get("/get-all-orders/", response_model=PaginaPedidos, response_model_exclude_unset=True)
+async def obtener_ordenes(
+    limit: int = Query(LIMITE_PAGINA_DEFECTO, ge=1, le=LIMITE_PAGINA_MAXIMO),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description=DESCRIPCION_FIELDS),
+    principal: Principal = Depends(get_principal)
+):
     try:
-        email = current_user["email"]
-        rol = current_user["rol"]
+        campos = campos_solicitados(fields, CAMPOS_LISTADO_PEDIDOS, RESUMEN_LISTADO_PEDIDOS)
+
+        rol = principal.rol
         filtro_pedidos = {}
 
         # Lógica para distribuidores (solo ven sus propios pedidos)
         if rol.startswith("distribuidor"):
-            distribuidor = await collection_distribuidores.find_one({"correo_electronico": email})
-            if not distribuidor:
-                raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-            
-            distribuidor_id = str(distribuidor["_id"])
-            filtro_pedidos = {"distribuidor_id": distribuidor_id}
+            filtro_pedidos = principal.filtro_ordenes
         
         # Para admin, facturacion y produccion no aplicamos filtros (ven todos)
         elif rol in ["Admin", "facturacion", "produccion"]:
@@ -508,138 +563,83 @@ async def obtener_ordenes(current_user: dict = Depends(get_current_user)):
         
         # Lógica específica para bodegas
         elif rol == "bodega":
-            bodega = await collection_bodegas.find_one({"correo_electronico": email})
-            if not bodega:
-                raise HTTPException(status_code=404, detail="Bodega no encontrada")
-            
-            cdi = bodega.get("cdi")
-            if not cdi:
-                raise HTTPException(status_code=400, detail="La bodega no tiene un CDI asignado")
-            
-            if cdi == "guarne":
-                filtro_pedidos = {"tipo_precio": "sin_iva_internacional"}
-            elif cdi == "medellin":
-                filtro_pedidos = {"tipo_precio": {"$in": ["con_iva", "sin_iva"]}}
-            else:
-                raise HTTPException(status_code=400, detail="CDI de bodega no válido")
-
-        # Obtener pedidos según filtro
-        pedidos = await collection_ordenes.find(filtro_pedidos).to_list(None)
-        
-        # Filtrar solo los pedidos cuyo ID empiece con "OC-"
-        pedidos = [pedido for pedido in pedidos if str(pedido.get("id", "")).startswith("OC-")]
-
-        # Obtener todos los distribuidores relevantes en una sola consulta
-        distribuidor_ids = list({pedido["distribuidor_id"] for pedido in pedidos})
-        distribuidores = await collection_distribuidores.find(
-            {"_id": {"$in": [ObjectId(id) for id in distribuidor_ids]}}
-        ).to_list(None)
-        
-        # Crear mapa rápido de distribuidores
-        distribuidor_map = {str(distribuidor["_id"]): {
-            "nombre": distribuidor.get("nombre", "Desconocido"),
-            "telefono": distribuidor.get("telefono", ""),
-            "email": distribuidor.get("correo_electronico", "")
-        } for distribuidor in distribuidores}
-        
-        # Formatear respuesta
-        pedidos_formateados = []
-        for pedido in pedidos:
-            info_distribuidor = distribuidor_map.get(pedido["distribuidor_id"], {
-                "nombre": "Desconocido",
-                "telefono": "",
-                "email": ""
-            })
-            
-            # Adaptar precios para bodega Guarne (mostrar siempre sin IVA)
-            if rol == "bodega" and bodega.get("cdi") == "guarne":
-                for producto in pedido.get("productos", []):
-                    producto["precio"] = producto.get("precio_sin_iva", producto["precio"])
-                    producto["iva_unitario"] = 0
-            
-            pedido_formateado = {
-                "id": pedido.get("id", str(pedido["_id"])),
-                "_id": str(pedido["_id"]),
-                "fecha": pedido.get("fecha", datetime.now()).isoformat(),
-                "productos": pedido.get("productos", []),
-                "estado": pedido.get("estado", "pendiente"),
-                "tipo_precio": pedido.get("tipo_precio"),
-                "distribuidor_nombre": info_distribuidor["nombre"],
-                "distribuidor_telefono": info_distribuidor["telefono"],
-                "distribuidor_email": info_distribuidor["email"],
-                "distribuidor_id": pedido["distribuidor_id"],
-                "total": sum(p["precio"] * p["cantidad"] for p in pedido.get("productos", [])),
-                "total_iva": sum(p.get("iva_unitario", 0) * p["cantidad"] for p in pedido.get("productos", []))
-            }
-            pedidos_formateados.append(pedido_formateado)
-        
-        # Ordenar por fecha descendente
-        pedidos_formateados.sort(key=lambda x: x["fecha"], reverse=True)
-        
-        return {"pedidos": pedidos_formateados}
+            filtro_pedidos = filtro_cdi_bodega(principal)
+
+        # Solo órdenes de compra (ID con prefijo "OC-"); el prefijo anclado usa el índice de id
+        filtro_pedidos = {**filtro_pedidos, "id": {"$regex": "^OC-"}}
+
+        # Filtrado, datos del distribuidor, totales y orden en una sola agregación
+        # Adaptar precios para bodega Guarne (mostrar siempre sin IVA)
+        return await listar_pedidos_paginados(
+            collection_ordenes,
+            filtro_pedidos,
+            limit,
+            cursor,
+            precios_sin_iva=rol == "bodega" and principal.cdi == "guarne",
+            campos=campos
+        )
     
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error al obtener pedidos: {str(e)}")
+        logger.error("Error al obtener pedidos: %s", str(e))
         raise HTTPException(status_code=500, detail="Error interno al obtener pedidos")
 
-def parse_stock(value):
-    """Convierte el stock a entero, manejando strings y enteros"""
-    try:
-        print(f"parse_stock: value={value}")
-        return int(value)
-    except (TypeError, ValueError):
-        print(f"parse_stock: value={value} -> 0 (error)")
-        return 0
+# Campos de /store/inventario; por defecto sin precios
+CAMPOS_INVENTARIO = ("id", "nombre", "categoria", "precios", "stock", "estado", "estado_class")
+RESUMEN_INVENTARIO = ("id", "nombre", "categoria", "stock", "estado", "estado_class")
+# Campos calculados: salen del stock, que se lee siempre para el estado
+CAMPOS_INVENTARIO_CALCULADOS = {"stock", "estado", "estado_class"}
+
 
 @router.get("/store/inventario")
-async def get_inventario(current_user: dict = Depends(get_current_user)):
-    rol = current_user.get("rol")
-    email = current_user.get("email")
-    print(f"Usuario: {email}, Rol: {rol}")
+@single_flight("store_inventario", lambda principal, fields=None, **_: (alcance_visibilidad(principal), fields))
+async def get_inventario(
+    fields: Optional[str] = Query(None, description=DESCRIPCION_FIELDS),
+    principal: Principal = Depends(get_principal)
+):
+    campos = campos_solicitados(fields, CAMPOS_INVENTARIO, RESUMEN_INVENTARIO)
+    rol = principal.rol
+    email = principal.email
+    logger.debug("Usuario: %s, Rol: %s", email, rol)
 
     if rol not in ["Admin", "bodega"]:
-        print("No autorizado")
+        logger.debug("No autorizado")
         raise HTTPException(status_code=403, detail="No autorizado")
 
     # Determinar CDI
     if rol == "Admin":
         cdi = None
-        bodega = None
-        print("Rol Admin, sin CDI")
+        logger.debug("Rol Admin, sin CDI")
     else:
-        bodega = await collection_bodegas.find_one({"correo_electronico": email})
-        print(f"Bodega encontrada: {bodega}")
-        if not bodega:
-            print("Bodega no encontrada")
-            raise HTTPException(status_code=404, detail="Bodega no encontrada")
-        cdi = bodega.get("cdi")  # "medellin" o "guarne"
-        print(f"CDI de bodega: {cdi}")
+        cdi = principal.cdi  # "medellin" o "guarne"
+        logger.debug("CDI de bodega: %s", cdi)
 
     # Filtrar productos solo del admin correspondiente
-    admin_id = str(bodega.get("admin_id")) if bodega else None
+    admin_id = principal.admin_id if rol == "bodega" else None
     query = {"admin_id": admin_id} if admin_id else {}
-    print(f"Query productos: {query}")
+    logger.debug("Query productos: %s", query)
 
-    productos_cursor = collection_productos.find(query)
+    productos_cursor = collection_productos.find(query, proyeccion(
+        [c for c in campos if c not in CAMPOS_INVENTARIO_CALCULADOS], obligatorios=("activo", "stock")
+    ))
     productos = await productos_cursor.to_list(length=None)
-    print(f"Productos encontrados: {len(productos)}")
+    logger.debug("Productos encontrados: %s", len(productos))
 
     inventario = []
     for p in productos:
-        print(f"Procesando producto: {p.get('id')} - {p.get('nombre')}")
+        logger.debug("Procesando producto: %s - %s", p.get('id'), p.get('nombre'))
 
         activo = p.get("activo", False)
-        print(f"Activo: {activo}")
+        logger.debug("Activo: %s", activo)
         if not activo:
-            print("Producto inactivo, skip")
+            logger.debug("Producto inactivo, skip")
             continue
 
-        s = p.get("stock", {})
-        stock_medellin = parse_stock(s.get("medellin"))
-        stock_guarne = parse_stock(s.get("guarne"))
-        print(f"Stock Medellin: {stock_medellin}, Stock Guarne: {stock_guarne}")
+        s = normalizar_stock(p.get("stock"))
+        stock_medellin = s["medellin"]
+        stock_guarne = s["guarne"]
+        logger.debug("Stock Medellin: %s, Stock Guarne: %s", stock_medellin, stock_guarne)
 
         # Mostrar solo el stock del CDI correspondiente
         if cdi == "medellin":
@@ -667,9 +667,9 @@ async def get_inventario(current_user: dict = Depends(get_current_user)):
             estado = "Stock Bajo"
             estado_class = "text-orange-600 font-bold"
 
-        print(f"Estado: {estado}, Estado class: {estado_class}")
+        logger.debug("Estado: %s, Estado class: %s", estado, estado_class)
 
-        inventario.append({
+        fila = {
             "_id": str(p["_id"]),
             "id": p.get("id"),
             "nombre": p.get("nombre"),
@@ -678,8 +678,9 @@ async def get_inventario(current_user: dict = Depends(get_current_user)):
             "stock": stock_info,
             "estado": estado,
             "estado_class": estado_class
-        })
+        }
+        inventario.append({"_id": fila["_id"], **{campo: fila[campo] for campo in campos}})
 
-    print(f"Inventario final: {len(inventario)} productos")
+    logger.debug("Inventario final: %s productos", len(inventario))
     return {"inventario": inventario}
 
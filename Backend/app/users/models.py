@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
+from app.core.respuestas import ObjectIdStr
 
 class UserBase(BaseModel):
     nombre: str
@@ -37,7 +38,7 @@ class UserResponse(BaseModel):
     phone: str
     estado: str
     fecha_ultimo_acceso: str
-    admin_id: str | None = None  # Puede ser opcional
+    admin_id: ObjectIdStr | None = None  # Puede ser opcional (ObjectId en Mongo)
     tipo_precio: str | None = None  # Solo para distribuidores
     unidades_individuales: bool | None = None  # Solo para distribuidores
     minimo_compra: float | None = None             # ← NUEVO
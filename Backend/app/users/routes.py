@@ -1,6 +1,9 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.security import pwd_context
-from app.auth.routes import get_current_user
+from app.core.hashing import hashear_password
+from app.auth.routes import get_current_user, get_principal
+from app.auth.models import Principal
+from app.auth.controllers import invalidar_principal
 from datetime import datetime
 from typing import Dict, List
 from bson import ObjectId
@@ -19,6 +22,8 @@ from app.core.database import (
     collection_bodegas
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # Endpoint para crear Admin (superusuario)
@@ -31,7 +36,7 @@ async def crear_admin(admin: AdminCreate):
             detail="El admin ya está registrado"
         )
     
-    hashed_password = pwd_context.hash(admin.password)
+    hashed_password = await hashear_password(admin.password)
     
     nuevo_admin = {
         "nombre": admin.nombre,
@@ -114,24 +119,17 @@ async def crear_admin(admin: AdminCreate):
 @router.post("/create-users/", response_model=UserResponse)
 async def crear_usuario(
     usuario: UserCreate,
-    current_user: Dict = Depends(get_current_user)
+    principal: Principal = Depends(get_principal)
 ):
     # --- Verificar permisos de admin o bodega ---
-    if current_user["rol"] not in ["Admin", "bodega"]:
+    if principal.rol not in ["Admin", "bodega"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los Admin o Bodega pueden crear usuarios"
         )
 
-    # --- Obtener admin o bodega creador ---
-    creador = await (collection_admin.find_one({"correo_electronico": current_user["email"]})
-                     if current_user["rol"] == "Admin"
-                     else collection_bodegas.find_one({"correo_electronico": current_user["email"]}))
-    if not creador:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"{current_user['rol']} no encontrado"
-        )
+    # --- Admin o bodega creador (perfil cacheado) ---
+    creador_id = ObjectId(principal.id)
 
     # --- Normalizar datos ---
     correo_normalizado = usuario.correo_electronico.lower()
@@ -222,11 +220,11 @@ async def crear_usuario(
         "pais": usuario.pais,
         "correo_electronico": correo_normalizado,
         "phone": usuario.phone,
-        "hashed_password": pwd_context.hash(usuario.password),
+        "hashed_password": await hashear_password(usuario.password),
         "rol": rol_normalizado,
         "estado": "Activo",
         "fecha_ultimo_acceso": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "admin_id": creador["_id"],
+        "admin_id": creador_id,
     }
 
     if rol_normalizado in ["distribuidor_nacional", "distribuidor_internacional"]:
@@ -266,7 +264,7 @@ async def crear_usuario(
         rol=rol_normalizado,
         estado="Activo",
         fecha_ultimo_acceso=nuevo_usuario["fecha_ultimo_acceso"],
-        admin_id=str(creador["_id"]),
+        admin_id=principal.id,
         phone=usuario.phone,
         tipo_precio=usuario.tipo_precio if rol_normalizado in ["distribuidor_nacional", "distribuidor_internacional"] else None,
         minimo_compra=usuario.minimo_compra
@@ -276,16 +274,16 @@ async def crear_usuario(
 # ENDPOINT PARA OBTENER LOS USUARIOS
 @router.get("/usuarios/", response_model=List[UserResponse])
 async def obtener_usuarios(
-    current_user: Dict = Depends(get_current_user)
+    principal: Principal = Depends(get_principal)
 ):
-    print("📢 Iniciando obtención de usuarios")  # Debug
+    logger.debug("📢 Iniciando obtención de usuarios")
 
-    rol = current_user["rol"]
-    email = current_user["email"]
+    rol = principal.rol
+    email = principal.email
 
     # --- ADMIN: ve todos los usuarios ---
     if rol == "Admin":
-        print("🔑 Rol Admin: viendo todos los usuarios")  # Debug
+        logger.debug("🔑 Rol Admin: viendo todos los usuarios")
 
         collections = {
             "distribuidor": collection_distribuidores,
@@ -297,7 +295,7 @@ async def obtener_usuarios(
         seen_ids = set()
 
         for rol_col, collection in collections.items():
-            print(f"🔍 Buscando usuarios en la colección: {rol_col}")
+            logger.debug("🔍 Buscando usuarios en la colección: %s", rol_col)
             async for user in collection.find():
                 if user["id"] not in seen_ids:
                     seen_ids.add(user["id"])
@@ -305,17 +303,13 @@ async def obtener_usuarios(
 
     # --- BODEGA: ve solo usuarios con su mismo CDI ---
     elif rol == "bodega":
-        print(f"🔑 Rol Bodega ({email}): filtrando usuarios por CDI")  # Debug
-
-        bodega = await collection_bodegas.find_one({"correo_electronico": email})
-        if not bodega:
-            raise HTTPException(status_code=404, detail="Bodega no encontrada")
+        logger.debug("🔑 Rol Bodega (%s): filtrando usuarios por CDI", email)
 
-        cdi = bodega.get("cdi")
+        cdi = principal.cdi
         if cdi not in ["medellin", "guarne"]:
             raise HTTPException(status_code=400, detail="CDI de bodega no válido")
 
-        print(f"🏢 Bodega CDI: {cdi}")  # Debug
+        logger.debug("🏢 Bodega CDI: %s", cdi)
 
         collections = {
             "distribuidor": collection_distribuidores,
@@ -327,20 +321,20 @@ async def obtener_usuarios(
         seen_ids = set()
 
         for rol_col, collection in collections.items():
-            print(f"🔍 Buscando usuarios en la colección: {rol_col} con CDI={cdi}")
+            logger.debug("🔍 Buscando usuarios en la colección: %s con CDI=%s", rol_col, cdi)
             async for user in collection.find({"cdi": cdi}):
                 if user["id"] not in seen_ids:
                     seen_ids.add(user["id"])
                     usuarios.append(user)
 
     else:
-        print(f"❌ Acceso denegado para rol: {rol}")  # Debug
+        logger.warning("❌ Acceso denegado para rol: %s", rol)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="No autorizado para ver usuarios"
         )
 
-    print(f"📢 Total de usuarios encontrados: {len(usuarios)}")  # Debug
+    logger.debug("📢 Total de usuarios encontrados: %s", len(usuarios))
 
     # --- Formatear respuesta ---
     response = [
@@ -357,7 +351,7 @@ async def obtener_usuarios(
         ) for u in usuarios
     ]
 
-    print(f"📢 Respuesta preparada: {len(response)} usuarios")  # Debug
+    logger.debug("📢 Respuesta preparada: %s usuarios", len(response))
     return response
 
 # ENDPOINT PARA ACTUALIZAR USUARIOS 
@@ -367,11 +361,11 @@ async def editar_usuario(
     usuario_actualizado: UserUpdate,
     current_user: Dict = Depends(get_current_user)
 ):
-    print(f"📢 Iniciando edición de usuario: {usuario_id}")
+    logger.debug("📢 Iniciando edición de usuario: %s", usuario_id)
 
     # 1. Verificar permisos de admin
     if current_user["rol"] != "Admin":
-        print("❌ Acceso denegado: Solo los Admin pueden editar usuarios")
+        logger.warning("❌ Acceso denegado: Solo los Admin pueden editar usuarios")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los Admin pueden editar usuarios"
@@ -397,10 +391,10 @@ async def editar_usuario(
             break
 
     if not usuario_original:
-        print("❌ Usuario no encontrado")
+        logger.warning("❌ Usuario no encontrado")
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    print(f"📢 Usuario original encontrado: {usuario_original}")
+    logger.debug("📢 Usuario original encontrado: %s", usuario_original.get("correo_electronico"))
 
     # 4. Preparar datos para actualización
     update_data = usuario_actualizado.dict(exclude_unset=True)
@@ -408,10 +402,10 @@ async def editar_usuario(
 
     # 5. Manejo de contraseña si está en la actualización
     if "contrasena" in update_data:
-        hashed_password = pwd_context.hash(update_data["contrasena"])
+        hashed_password = await hashear_password(update_data["contrasena"])
         update_data["hashed_password"] = hashed_password
         del update_data["contrasena"]
-        print("🔑 Contraseña actualizada (hash generado)")
+        logger.debug("🔑 Contraseña actualizada (hash generado)")
 
     # 6. Validaciones para tipo_precio
     if "tipo_precio" in update_data:
@@ -430,17 +424,17 @@ async def editar_usuario(
 
     # 7. Manejar tipo_precio para no distribuidores
     if nuevo_rol != "distribuidor" and "tipo_precio" in update_data:
-        print("⚠️ Advertencia: tipo_precio solo aplica para distribuidores")
+        logger.warning("⚠️ Advertencia: tipo_precio solo aplica para distribuidores")
         update_data.pop("tipo_precio")
 
-    print(f"📢 Datos para actualización: {update_data}")
+    logger.debug("📢 Campos para actualización: %s", update_data.keys())
 
     # 8. Verificar si hay cambio de rol
     if nuevo_rol != rol_actual:
-        print(f"📢 Cambio de rol detectado: {rol_actual} -> {nuevo_rol}")
+        logger.debug("📢 Cambio de rol detectado: %s -> %s", rol_actual, nuevo_rol)
 
         if nuevo_rol not in ROLES_COLECCIONES:
-            print(f"❌ Rol '{nuevo_rol}' no válido")
+            logger.warning("❌ Rol '%s' no válido", nuevo_rol)
             raise HTTPException(
                 status_code=400,
                 detail=f"Rol '{nuevo_rol}' no válido. Roles permitidos: {list(ROLES_COLECCIONES.keys())}"
@@ -452,24 +446,24 @@ async def editar_usuario(
         if nuevo_rol != "distribuidor":
             nuevo_documento.pop("tipo_precio", None)
         
-        print(f"📢 Nuevo documento para colección destino: {nuevo_documento}")
+        logger.debug("📢 Nuevo documento para colección destino: %s", nuevo_documento.keys())
 
         try:
             await coleccion_actual.delete_one({"id": usuario_id})
-            print(f"📢 Usuario eliminado de la colección actual: {rol_actual}")
+            logger.debug("📢 Usuario eliminado de la colección actual: %s", rol_actual)
             
             await coleccion_destino.insert_one(nuevo_documento)
-            print(f"📢 Usuario insertado en la nueva colección: {nuevo_rol}")
+            logger.debug("📢 Usuario insertado en la nueva colección: %s", nuevo_rol)
             
             usuario_actualizado_db = await coleccion_destino.find_one({"id": usuario_id})
         except Exception as e:
-            print(f"❌ Error al cambiar de colección: {str(e)}")
+            logger.error("❌ Error al cambiar de colección: %s", str(e))
             raise HTTPException(
                 status_code=500,
                 detail=f"Error al cambiar de colección: {str(e)}"
             )
     else:
-        print("📢 Actualización sin cambio de rol")
+        logger.debug("📢 Actualización sin cambio de rol")
 
         for campo in ["_id", "id", "admin_id"]:
             update_data.pop(campo, None)
@@ -482,16 +476,17 @@ async def editar_usuario(
 
     # 9. Preparar respuesta
     if usuario_actualizado_db:
-        if isinstance(usuario_actualizado_db.get("_id"), ObjectId):
-            usuario_actualizado_db["_id"] = str(usuario_actualizado_db["_id"])
-        if isinstance(usuario_actualizado_db.get("admin_id"), ObjectId):
-            usuario_actualizado_db["admin_id"] = str(usuario_actualizado_db["admin_id"])
-
         # Eliminar campos sensibles de la respuesta
         usuario_actualizado_db.pop("hashed_password", None)
         usuario_actualizado_db.pop("contrasena", None)
 
-    print(f"📢 Usuario actualizado: {usuario_actualizado_db}")
+    logger.debug("📢 Usuario actualizado: %s", usuario_actualizado_db)
+
+    # El perfil cacheado del usuario (rol, tipo_precio, CDI...) ya no es válido
+    invalidar_principal(
+        usuario_original.get("correo_electronico"),
+        (usuario_actualizado_db or {}).get("correo_electronico")
+    )
 
     return UserResponse(**usuario_actualizado_db)
 
@@ -528,18 +523,11 @@ async def cambiar_estado_usuario(
         {"id": usuario_id},
         {"$set": {"estado": nuevo_estado}}
     )
+    invalidar_principal(usuario_encontrado.get("correo_electronico"))
 
     # Obtener datos actualizados
     usuario_actualizado = await coleccion_encontrada.find_one({"id": usuario_id})
     
-    # Convertir ObjectIds
-    if usuario_actualizado:
-        usuario_actualizado = {
-            **usuario_actualizado,
-            "_id": str(usuario_actualizado["_id"]),
-            "admin_id": str(usuario_actualizado.get("admin_id")) if usuario_actualizado.get("admin_id") else None
-        }
-
     return UserResponse(**usuario_actualizado)
 
 # Endpoint para obtener información del usuario autenticado
@@ -609,6 +597,7 @@ async def toggle_unidades_individuales(
         )
 
         if result.modified_count == 1:
+            invalidar_principal(distribuidor.get("correo_electronico"))
             return {
                 "message": "Permiso actualizado correctamente",
                 "distribuidor_id": distribuidor_id,
@@ -620,6 +609,6 @@ async def toggle_unidades_individuales(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error al actualizar unidades individuales: {str(e)}")
+        logger.error("Error al actualizar unidades individuales: %s", str(e))
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
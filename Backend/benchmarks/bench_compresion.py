@@ -0,0 +1,113 @@
+"""Benchmark de compresión: bytes en la red y coste de CPU por endpoint.
+
+Para cada endpoint pide la respuesta sin comprimir (identity) y con cada
+algoritmo disponible (gzip y, si están instalados, br / zstd), y mide:
+
+- bytes en la red (Content-Length de la respuesta) y ratio frente a identity
+- tiempo de CPU de comprimir ese cuerpo (process_time, mediana de N pasadas)
+- latencia p50 de la petición completa
+
+Ejecuta la app en proceso (httpx + ASGITransport) contra la base de datos de
+MONGODB_URI como el primer Admin (o BENCH_ADMIN_EMAIL); solo hace lecturas.
+
+Uso (desde Backend/):
+
+    python -m benchmarks.bench_compresion --repeticiones 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("OUTBOX_WORKER_ENABLED", "false")
+
+import httpx
+
+from app.auth.routes import get_current_user
+from app.core.compresion import compresores_disponibles
+from app.core.config import app, lifespan
+from app.core.database import collection_admin
+
+ENDPOINTS = [
+    "/orders/get-all-orders/?limit=100",
+    "/store/store/inventario",
+    "/api/usuarios/",
+]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+async def obtener_admin():
+    email = os.getenv("BENCH_ADMIN_EMAIL")
+    admin = await collection_admin.find_one({"correo_electronico": email} if email else {})
+    if not admin:
+        raise SystemExit("No se encontró un Admin para el benchmark")
+    return admin
+
+
+def cpu_compresion(compresor, cuerpo: bytes, pasadas: int) -> float:
+    """Mediana en ms del tiempo de CPU de comprimir `cuerpo`"""
+    tiempos = []
+    for _ in range(pasadas):
+        inicio = time.process_time()
+        compresor(cuerpo)
+        tiempos.append((time.process_time() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+async def medir(cliente, ruta, codificacion, repeticiones):
+    tiempos = []
+    respuesta = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = await cliente.get(ruta, headers={"Accept-Encoding": codificacion})
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if respuesta.status_code != 200:
+            raise SystemExit(f"Error {respuesta.status_code} en {ruta}: {respuesta.text[:200]}")
+    bytes_red = int(respuesta.headers.get("content-length", len(respuesta.content)))
+    return bytes_red, respuesta.headers.get("content-encoding", "identity"), respuesta.content, tiempos
+
+
+async def main(repeticiones, pasadas):
+    compresores = compresores_disponibles()
+
+    async with lifespan(app):
+        admin = await obtener_admin()
+        app.dependency_overrides[get_current_user] = lambda: {
+            "email": admin["correo_electronico"],
+            "rol": "Admin",
+        }
+
+        transporte = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+                print(f"{'endpoint':<36} {'codif.':>8} {'bytes':>10} {'ratio':>7} {'cpu ms':>8} {'p50 ms':>8}")
+                for ruta in ENDPOINTS:
+                    # Calentamiento (cachés, single-flight, índices)
+                    await medir(cliente, ruta, "identity", 2)
+
+                    bytes_planos, _, cuerpo, tiempos = await medir(cliente, ruta, "identity", repeticiones)
+                    print(f"{ruta:<36} {'identity':>8} {bytes_planos:>10} {1:>7.3f} {0:>8.2f} {percentil(tiempos, 50):>8.1f}")
+
+                    for codificacion, compresor in compresores.items():
+                        bytes_red, aplicada, _, tiempos = await medir(cliente, ruta, codificacion, repeticiones)
+                        cpu = cpu_compresion(compresor, cuerpo, pasadas) if aplicada != "identity" else 0.0
+                        print(
+                            f"{'':<36} {aplicada:>8} {bytes_red:>10} {bytes_red / bytes_planos:>7.3f} "
+                            f"{cpu:>8.2f} {percentil(tiempos, 50):>8.1f}"
+                        )
+        finally:
+            app.dependency_overrides.pop(get_current_user, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--pasadas", type=int, default=20, help="Compresiones por medición de CPU")
+    args = parser.parse_args()
+    asyncio.run(main(args.repeticiones, args.pasadas))
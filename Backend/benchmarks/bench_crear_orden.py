@@ -0,0 +1,106 @@
+"""Benchmark de /orders/create-purchase-order/: latencia p50/p99 según número de líneas.
+
+Ejecuta la app en proceso (httpx + ASGITransport) contra la base de datos de
+MONGODB_URI, así que debe apuntarse a una base de pruebas o staging. Las
+órdenes y correos creados se eliminan al terminar; el worker de correos no se
+arranca.
+
+Uso (desde Backend/):
+
+    python -m benchmarks.bench_crear_orden --lineas 1 10 30 60 --repeticiones 50
+
+El distribuidor se toma de BENCH_DISTRIBUIDOR_EMAIL o, si no está definido,
+del primer distribuidor sin mínimo de compra.
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+os.environ.setdefault("OUTBOX_WORKER_ENABLED", "false")
+
+import httpx
+from bson import ObjectId
+
+from app.auth.routes import get_current_user
+from app.core.config import app, lifespan
+from app.core.database import collection_distribuidores, collection_ordenes, collection_outbox, collection_productos
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+async def obtener_distribuidor():
+    email = os.getenv("BENCH_DISTRIBUIDOR_EMAIL")
+    filtro = {"correo_electronico": email} if email else {"minimo_compra": None}
+    distribuidor = await collection_distribuidores.find_one(filtro)
+    if not distribuidor:
+        raise SystemExit("No se encontró un distribuidor para el benchmark")
+    return distribuidor
+
+
+async def medir(cliente, ids_productos, lineas, repeticiones, creadas):
+    cuerpo = {
+        "direccion": "Benchmark",
+        "notas": "benchmark",
+        "productos": [
+            {"id": ids_productos[i % len(ids_productos)], "cantidad": 1, "precio": 1000}
+            for i in range(lineas)
+        ],
+    }
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = await cliente.post("/orders/create-purchase-order/", json=cuerpo)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if respuesta.status_code != 200:
+            raise SystemExit(f"Error {respuesta.status_code}: {respuesta.text}")
+        orden = respuesta.json()["orden_compra"]
+        creadas.append((ObjectId(orden["_id"]), orden["id"]))
+    return tiempos
+
+
+async def main(lineas_a_probar, repeticiones):
+    inicio_benchmark = datetime.utcnow()
+    creadas = []
+
+    async with lifespan(app):
+        distribuidor = await obtener_distribuidor()
+        app.dependency_overrides[get_current_user] = lambda: {
+            "email": distribuidor["correo_electronico"],
+            "rol": distribuidor.get("rol", "distribuidor_nacional"),
+        }
+        ids_productos = [p["id"] async for p in collection_productos.find({}, {"_id": 0, "id": 1}).limit(200)]
+        if not ids_productos:
+            raise SystemExit("No hay productos en la base de datos")
+
+        transporte = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+                # Calentamiento
+                await medir(cliente, ids_productos, 1, 3, creadas)
+
+                print(f"{'líneas':>7} {'p50 ms':>9} {'p99 ms':>9} {'máx ms':>9}")
+                for lineas in lineas_a_probar:
+                    tiempos = await medir(cliente, ids_productos, lineas, repeticiones, creadas)
+                    print(f"{lineas:>7} {percentil(tiempos, 50):>9.1f} {percentil(tiempos, 99):>9.1f} {max(tiempos):>9.1f}")
+        finally:
+            app.dependency_overrides.pop(get_current_user, None)
+            if creadas:
+                await collection_ordenes.delete_many({"_id": {"$in": [_id for _id, _ in creadas]}})
+                await collection_outbox.delete_many({
+                    "creado_en": {"$gte": inicio_benchmark},
+                    "asunto": {"$regex": "|".join(sorted({orden_id for _, orden_id in creadas}))},
+                })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lineas", type=int, nargs="+", default=[1, 5, 10, 20, 40, 60])
+    parser.add_argument("--repeticiones", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(main(args.lineas, args.repeticiones))
@@ -0,0 +1,115 @@
+"""Presupuesto de consultas a Mongo por endpoint (regresiones N+1).
+
+Pide cada endpoint una vez y falla (código de salida 1) si lanza más comandos
+de Mongo que su presupuesto. Los comandos se cuentan con
+`presupuesto_consultas` (app/core/consultas.py), igual que las cabeceras
+X-DB-Calls; si un endpoint se pasa se listan los comandos repetidos.
+
+Antes de medir se pide /api/auth/me para que la caché de principales no
+entre en la cuenta; el resto de cachés empiezan frías, que es el caso que
+más consultas hace.
+
+Ejecuta la app en proceso (httpx + ASGITransport) contra la base de datos de
+MONGODB_URI como el primer Admin (o BENCH_ADMIN_EMAIL). Solo hace lecturas:
+no entra en el lifespan de la app (ni índices, ni reconciliación de
+contadores, ni workers), solo abre la conexión a Mongo.
+
+El mismo presupuesto se comprueba sin base de datos en
+tests/test_presupuesto_consultas.py (mongomock-motor).
+
+Uso (desde Backend/):
+
+    python -m benchmarks.presupuesto_consultas
+"""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("OUTBOX_WORKER_ENABLED", "false")
+
+import httpx
+
+from app.auth.routes import get_current_user
+from app.core.config import app
+from app.core.consultas import presupuesto_consultas
+from app.core.database import (
+    close_mongo_connection,
+    collection_admin,
+    collection_distribuidores,
+    collection_pedidos,
+    connect_to_mongo
+)
+
+# Ruta -> máximo de comandos de Mongo (un getMore cuenta como comando)
+PRESUPUESTOS = {
+    "/orders/get-all-orders/?limit=100": 2,
+    "/orders/detalles-pedidos/{pedido_id}": 2,
+    "/store/store/inventario": 2,
+    "/api/productos/": 3,
+    "/api/usuarios/": 6,
+}
+
+
+async def obtener_admin():
+    email = os.getenv("BENCH_ADMIN_EMAIL")
+    admin = await collection_admin.find_one({"correo_electronico": email} if email else {})
+    if not admin:
+        raise SystemExit("No se encontró un Admin para el benchmark")
+    return admin
+
+
+async def obtener_pedido_id(admin) -> str | None:
+    """Un pedido de un distribuidor del Admin, para que el detalle responda 200"""
+    distribuidor = await collection_distribuidores.find_one(
+        {"admin_id": {"$in": [admin["_id"], str(admin["_id"])]}}, {"_id": 1}
+    )
+    filtro = {"distribuidor_id": str(distribuidor["_id"])} if distribuidor else {}
+    pedido = await collection_pedidos.find_one(filtro, {"id": 1})
+    return pedido.get("id") if pedido else None
+
+
+async def main() -> int:
+    fallos = 0
+
+    # Solo la conexión: el lifespan crearía índices y arrancaría workers que escriben
+    await connect_to_mongo()
+    try:
+        admin = await obtener_admin()
+        pedido_id = await obtener_pedido_id(admin)
+        app.dependency_overrides[get_current_user] = lambda: {
+            "email": admin["correo_electronico"],
+            "rol": "Admin",
+        }
+
+        transporte = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+                await cliente.get("/api/auth/me")
+
+                print(f"{'endpoint':<40} {'estado':>6} {'comandos':>9} {'máximo':>7} {'ms':>8}")
+                for plantilla, maximo in PRESUPUESTOS.items():
+                    if "{pedido_id}" in plantilla and not pedido_id:
+                        print(f"{plantilla:<40} {'-':>6} {'sin pedidos, se omite':>26}")
+                        continue
+                    ruta = plantilla.format(pedido_id=pedido_id)
+                    try:
+                        with presupuesto_consultas(maximo, f"GET {plantilla}") as consumo:
+                            respuesta = await cliente.get(ruta)
+                    except AssertionError as e:
+                        fallos += 1
+                        print(f"❌ {e}")
+                        continue
+                    print(
+                        f"{plantilla:<40} {respuesta.status_code:>6} {consumo.llamadas:>9} "
+                        f"{maximo:>7} {consumo.milisegundos:>8.1f}"
+                    )
+        finally:
+            app.dependency_overrides.pop(get_current_user, None)
+    finally:
+        close_mongo_connection()
+
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,155 @@
+"""Presupuesto de consultas por endpoint sin base de datos real (mongomock-motor).
+
+mongomock no emite los eventos de monitorización de pymongo, así que el
+cliente simulado se envuelve para sumar cada llamada al `ConsumoDB` de la
+petición, igual que haría `ListenerConsumo` con un Mongo real (un cursor
+cuenta como un comando; aquí no hay getMore).
+
+Ejecutar desde Backend/ con las dependencias de requirements-dev.txt:
+
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "clave-de-pruebas")
+os.environ.setdefault("OUTBOX_WORKER_ENABLED", "false")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+httpx = pytest.importorskip("httpx")
+
+from bson import ObjectId
+
+from app.auth.models import Principal
+from app.auth.routes import get_principal
+from app.core import database
+from app.core.config import app
+from app.core.consultas import consumo_actual, presupuesto_consultas
+
+# Método de Motor -> comando de Mongo que lanza
+COMANDOS = {
+    "find": "find",
+    "find_one": "find",
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "find_one_and_update": "findAndModify",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "bulk_write": "bulkWrite",
+}
+
+
+class _ColeccionContada:
+    def __init__(self, coleccion):
+        self._coleccion = coleccion
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._coleccion, nombre)
+        if nombre not in COMANDOS:
+            return atributo
+
+        def contado(*args, **kwargs):
+            consumo = consumo_actual.get()
+            if consumo is not None:
+                consumo.registrar(COMANDOS[nombre], self._coleccion.name)
+            return atributo(*args, **kwargs)
+
+        return contado
+
+
+class _BaseContada:
+    def __init__(self, base):
+        self._base = base
+
+    def __getitem__(self, nombre):
+        return _ColeccionContada(self._base[nombre])
+
+    def __getattr__(self, nombre):
+        return getattr(self._base, nombre)
+
+
+class _ClienteContado:
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def __getitem__(self, nombre):
+        return _BaseContada(self._cliente[nombre])
+
+    def __getattr__(self, nombre):
+        return getattr(self._cliente, nombre)
+
+
+@pytest.fixture
+def datos(monkeypatch):
+    """Base simulada con un Admin, un distribuidor suyo y un pedido"""
+    cliente = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(database, "client", _ClienteContado(cliente))
+    base = cliente[database.db_name]
+
+    admin_id = ObjectId()
+    distribuidor_id = ObjectId()
+
+    async def poblar():
+        await base["distribuidores"].insert_one({
+            "_id": distribuidor_id, "admin_id": admin_id, "nombre": "Distribuidora",
+            "correo_electronico": "dist@example.com", "pais": "Colombia",
+        })
+        await base["pedidos"].insert_one({
+            "id": "PED-1", "distribuidor_id": str(distribuidor_id), "fecha": datetime(2025, 1, 15),
+            "estado": "pendiente", "tipo_precio": "sin_iva", "revision": 0,
+            "productos": [{"id": "P1", "nombre": "Crema", "cantidad": 2, "precio": 1000}],
+        })
+
+    asyncio.run(poblar())
+    yield {"admin_id": str(admin_id), "distribuidor_id": str(distribuidor_id)}
+    app.dependency_overrides.pop(get_principal, None)
+
+
+def pedir(ruta: str, principal: Principal, maximo: int):
+    """GET en proceso dentro de `presupuesto_consultas`; devuelve (respuesta, consumo)"""
+    app.dependency_overrides[get_principal] = lambda: principal
+
+    async def ejecutar():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            with presupuesto_consultas(maximo, f"GET {ruta}") as consumo:
+                respuesta = await cliente.get(ruta)
+        return respuesta, consumo
+
+    return asyncio.run(ejecutar())
+
+
+def test_detalles_pedido_admin_lee_el_distribuidor_una_vez(datos):
+    admin = Principal(email="admin@example.com", rol="Admin", id=datos["admin_id"])
+
+    respuesta, consumo = pedir("/orders/detalles-pedidos/PED-1", admin, maximo=2)
+
+    assert respuesta.status_code == 200
+    assert respuesta.json()["pedido"]["distribuidor_info"]["nombre"] == "Distribuidora"
+    assert consumo.comandos == {"find pedidos": 1, "find distribuidores": 1}
+
+
+def test_detalles_pedido_distribuidor(datos):
+    distribuidor = Principal(
+        email="dist@example.com", rol="distribuidor_nacional", id=datos["distribuidor_id"]
+    )
+
+    respuesta, _ = pedir("/orders/detalles-pedidos/PED-1", distribuidor, maximo=2)
+
+    assert respuesta.status_code == 200
+
+
+def test_presupuesto_excedido_lista_los_comandos(datos):
+    admin = Principal(email="admin@example.com", rol="Admin", id=datos["admin_id"])
+
+    with pytest.raises(AssertionError, match="2 comandos de Mongo \\(presupuesto 1\\).*find distribuidores"):
+        pedir("/orders/detalles-pedidos/PED-1", admin, maximo=1)
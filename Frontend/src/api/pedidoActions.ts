@@ -6,19 +6,29 @@ export const fetchPedidos = async (): Promise<Pedido[]> => {
         const token = localStorage.getItem('access_token');
         if (!token) throw new Error('No hay token de autenticación');
         
-        const response = await fetch('https://api.rizosfelices.co/orders/get-all-orders/', {
-            headers: {
-                'Authorization': `Bearer ${token}`,
-                'Content-Type': 'application/json'
+        // El listado está paginado por cursor: se siguen las páginas hasta que next_cursor sea null
+        const pedidos: any[] = [];
+        let cursor: string | null = null;
+        do {
+            const url: string = 'https://api.rizosfelices.co/orders/get-all-orders/?limit=200&fields=id,fecha,estado,tipo_precio,distribuidor_id,distribuidor_nombre,total,productos'
+                + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : '');
+            const response = await fetch(url, {
+                headers: {
+                    'Authorization': `Bearer ${token}`,
+                    'Content-Type': 'application/json'
+                }
+            });
+
+            if (!response.ok) {
+                throw new Error(`Error ${response.status}: ${response.statusText}`);
             }
-        });
 
-        if (!response.ok) {
-            throw new Error(`Error ${response.status}: ${response.statusText}`);
-        }
+            const data = await response.json();
+            if (Array.isArray(data.pedidos)) pedidos.push(...data.pedidos);
+            cursor = data.next_cursor ?? null;
+        } while (cursor);
 
-        const data = await response.json();
-        return Array.isArray(data.pedidos) ? data.pedidos.map(parsePedido) : [];
+        return pedidos.map(parsePedido);
     } catch (error) {
         console.error('Error en fetchPedidos:', error);
         throw new Error('No se pudieron obtener los pedidos');
@@ -48,23 +48,30 @@ export default function PedidosPage() {
           throw new Error("No se encontró el token de autenticación");
         }
 
-        const response = await fetch(
-          "https://api.rizosfelices.co/orders/get-all-orders/",
-          {
+        // El listado está paginado por cursor: se siguen las páginas hasta que next_cursor sea null
+        const todos: any[] = [];
+        let cursor: string | null = null;
+        do {
+          const url: string =
+            "https://api.rizosfelices.co/orders/get-all-orders/?limit=200&fields=id,fecha,estado,productos" +
+            (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
+          const response = await fetch(url, {
             headers: {
               Authorization: `Bearer ${token}`,
             },
-          },
-        );
+          });
 
-        if (!response.ok) {
-          throw new Error("Error al obtener los pedidos");
-        }
+          if (!response.ok) {
+            throw new Error("Error al obtener los pedidos");
+          }
 
-        const data = await response.json();
+          const data = await response.json();
+          todos.push(...(data.pedidos || []));
+          cursor = data.next_cursor ?? null;
+        } while (cursor);
 
         // Mapeamos los pedidos asegurando que usamos el id correcto
-        const pedidosFormateados = data.pedidos.map((pedido: any) => ({
+        const pedidosFormateados = todos.map((pedido: any) => ({
           id: pedido.id, // Usamos específicamente el campo id
           fecha: pedido.fecha || new Date().toISOString(),
           productos: pedido.productos || [],